@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+"""
+Benchmarks of dockswap CLI against simulated docker and docker-compose.
+
+Every command is run as a separate process (``python -m dockswap ...``), so
+interpreter startup and imports are measured too, with ``HOME`` pointing to
+a temporary directory holding generated storage. Fake ``docker`` (tests/fake_docker.py)
+and ``docker-compose`` (tests/fake_docker_compose.py) take ``--latency`` seconds per call.
+
+Median of every case is appended to ``benchmarks/results.jsonl`` and compared
+with the last run made with the same settings::
+
+    $ python -m benchmarks.run
+    $ python -m benchmarks.run --composers 10 --containers 0,50 --repeat 3 --no-save
+
+Exit code is 1 if any case got slower than ``--threshold`` (20% by default).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tempfile
+from pathlib import Path
+from statistics import median
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+FAKE_DOCKER = ROOT / "tests" / "fake_docker.py"
+FAKE_DOCKER_COMPOSE = ROOT / "tests" / "fake_docker_compose.py"
+RESULTS_PATH = Path(__file__).resolve().parent / "results.jsonl"
+
+COMMANDS = ["add", "list", "start", "stopall"]
+DEFAULT_COMPOSERS = [10, 1000, 10000]
+DEFAULT_CONTAINERS = [0, 100, 500]
+
+sys.path.insert(0, str(ROOT))
+
+from dockswap.dockswap.core import Composer  # noqa: E402
+from dockswap.dockswap.storage import get_repo_class  # noqa: E402
+
+COMPOSE_CONTENT = '{"services": {"web": {"image": "nginx", "ports": ["8000:80"]}}}'
+
+
+def fake_binary(path: Path, script: Path) -> str:
+    path.write_text('#!/bin/sh\nexec "{}" "{}" "$@"\n'.format(sys.executable, script))
+    os.chmod(str(path), 0o755)
+    return str(path)
+
+
+def containers_state(count: int) -> Dict:
+    """`count` running containers spread over 10 projects that are not registered."""
+    return {
+        "containers": [
+            {
+                "id": "c{:05d}".format(i),
+                "name": "other{}_web_{}".format(i % 10, i),
+                "running": True,
+                "labels": {
+                    "com.docker.compose.project": "other{}".format(i % 10),
+                    "com.docker.compose.service": "web",
+                },
+            }
+            for i in range(count)
+        ]
+    }
+
+
+class Workspace(object):
+    """Temporary HOME with generated storage and fake docker toolchain."""
+
+    def __init__(self, directory: Path, backend: str, latency: float):
+        self.directory = directory
+        self.home = directory / "home"
+        self.home.mkdir()
+        self.state_path = directory / "docker-state.json"
+        self.compose_path = directory / "project" / "docker-compose.json"
+        self.compose_path.parent.mkdir()
+        self.compose_path.write_text(COMPOSE_CONTENT)
+        self.backend = backend
+
+        self.env = dict(os.environ)
+        self.env.update(
+            {
+                "HOME": str(self.home),
+                "PYTHONPATH": str(ROOT),
+                "DOCKSWAP_STORAGE_BACKEND": backend,
+                "DOCKSWAP_DOCKER_CLI": fake_binary(directory / "docker", FAKE_DOCKER),
+                "DOCKSWAP_DOCKER_COMPOSE_CLI": fake_binary(
+                    directory / "docker-compose", FAKE_DOCKER_COMPOSE
+                ),
+                "DOCKSWAP_ENGINE": "cli",
+                "FAKE_DOCKER_STATE": str(self.state_path),
+                "FAKE_DOCKER_LATENCY": str(latency),
+                "FAKE_DOCKER_COMPOSE_LATENCY": str(latency),
+            }
+        )
+        self.env.pop("DOCKSWAP_STORAGE_FILE_NAME", None)
+        self.set_containers(0)
+
+    def set_containers(self, count: int):
+        with open(self.state_path, "w") as state_file:
+            json.dump(containers_state(count), state_file)
+
+    def seed(self, count: int):
+        """Register `count` composers (storage is written in-process, not measured)."""
+        composers = [
+            Composer(
+                docker_compose_path=str(self.compose_path),
+                project_name="project{}".format(i),
+            )
+            for i in range(count)
+        ]
+        home = os.environ.get("HOME")
+        os.environ["HOME"] = str(self.home)
+        try:
+            repo_class = get_repo_class(self.backend)
+            storage_name = repo_class.STORAGE_PATH
+            if storage_name != "storage.json":
+                self.env["DOCKSWAP_STORAGE_FILE_NAME"] = storage_name
+            repo_class().persist_all(composers, rewrite=True)
+        finally:
+            if home is None:
+                os.environ.pop("HOME")
+            else:
+                os.environ["HOME"] = home
+
+    def run(self, args: List[str]) -> float:
+        started = time.monotonic()
+        result = subprocess.run(
+            [sys.executable, "-m", "dockswap"] + args,
+            env=self.env,
+            cwd=str(self.directory),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        elapsed = time.monotonic() - started
+        if result.returncode != 0:
+            raise RuntimeError(
+                "dockswap {} failed: {}".format(" ".join(args), result.stderr.decode())
+            )
+        return elapsed
+
+
+def command_args(command: str, composers: int, attempt: int, compose_path: Path) -> List[str]:
+    if command == "add":
+        return ["add", "bench{}".format(attempt), "--path", str(compose_path)]
+    if command == "list":
+        return ["list"]
+    if command == "start":
+        return ["start", "project{}".format(composers // 2), "--remove-other"]
+    return ["stopall", "--remove"]
+
+
+def bench_case(
+    workspace: Workspace, command: str, composers: int, containers: int, repeat: int
+) -> float:
+    timings = []
+    for attempt in range(repeat):
+        workspace.set_containers(containers)
+        timings.append(
+            workspace.run(command_args(command, composers, attempt, workspace.compose_path))
+        )
+    return median(timings)
+
+
+def run_benchmarks(
+    composers: List[int],
+    containers: List[int],
+    commands: List[str],
+    repeat: int = 3,
+    latency: float = 0.0,
+    backend: str = "json",
+    report=print,
+) -> Dict[str, float]:
+    """Median seconds per case, cases are named "command/composers/containers"."""
+    results = {}
+    for composer_count in composers:
+        with tempfile.TemporaryDirectory(prefix="dockswap-bench-") as directory:
+            workspace = Workspace(Path(directory), backend, latency)
+            workspace.seed(composer_count)
+            for command in commands:
+                # container count does not matter for commands that do not touch docker
+                counts = containers if command in ("start", "stopall") else containers[:1]
+                for container_count in counts:
+                    case = "{}/{}/{}".format(command, composer_count, container_count)
+                    results[case] = bench_case(
+                        workspace, command, composer_count, container_count, repeat
+                    )
+                    report("{:<28} {:>8.3f}s".format(case, results[case]))
+    return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        output = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=str(ROOT),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        ).stdout
+    except OSError:
+        return None
+    return output.decode().strip() or None
+
+
+def load_runs(path: Path) -> List[Dict]:
+    if not path.exists():
+        return []
+    with open(path, "r") as results_file:
+        return [json.loads(line) for line in results_file if line.strip()]
+
+
+def compare(
+    previous: Dict[str, float], current: Dict[str, float], threshold: float
+) -> List[str]:
+    """Describe cases that are more than `threshold` (fraction) slower than before."""
+    regressions = []
+    for case, seconds in current.items():
+        before = previous.get(case)
+        if before and seconds > before * (1 + threshold):
+            regressions.append(
+                "{}: {:.3f}s -> {:.3f}s (+{:.0%})".format(
+                    case, before, seconds, seconds / before - 1
+                )
+            )
+    return regressions
+
+
+def parse_counts(value: str) -> List[int]:
+    return [int(part) for part in value.split(",") if part]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark dockswap CLI")
+    parser.add_argument(
+        "--composers",
+        type=parse_counts,
+        default=DEFAULT_COMPOSERS,
+        help="comma separated numbers of registered composers",
+    )
+    parser.add_argument(
+        "--containers",
+        type=parse_counts,
+        default=DEFAULT_CONTAINERS,
+        help="comma separated numbers of running containers",
+    )
+    parser.add_argument(
+        "--commands", default=",".join(COMMANDS), help="comma separated commands to run"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case")
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds per fake docker call"
+    )
+    parser.add_argument("--backend", default="json", help="storage backend")
+    parser.add_argument("--results", type=Path, default=RESULTS_PATH)
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--no-save", action="store_true", help="do not record results")
+    args = parser.parse_args(argv)
+
+    commands = [command for command in args.commands.split(",") if command]
+    unknown = set(commands) - set(COMMANDS)
+    if unknown:
+        parser.error("unknown commands: {}".format(", ".join(sorted(unknown))))
+
+    results = run_benchmarks(
+        args.composers,
+        args.containers,
+        commands,
+        repeat=args.repeat,
+        latency=args.latency,
+        backend=args.backend,
+    )
+
+    settings = {"backend": args.backend, "latency": args.latency, "repeat": args.repeat}
+    previous = [run for run in load_runs(args.results) if run["settings"] == settings]
+    regressions = compare(previous[-1]["results"], results, args.threshold) if previous else []
+    for regression in regressions:
+        print("REGRESSION {}".format(regression))
+
+    if not args.no_save:
+        run = {
+            "time": time.time(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "settings": settings,
+            "results": results,
+        }
+        with open(args.results, "a") as results_file:
+            results_file.write(json.dumps(run) + "\n")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
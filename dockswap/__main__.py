@@ -0,0 +1,76 @@
+"""
+Entry point of `dockswap` command.
+
+Commands that do not need the whole CLI (for now only `version`) and shell
+completion of project and service names (see `completion`) are answered
+here without importing typer and the rest of dockswap. Commands served by
+`dockswap daemon` are forwarded to it if it is running (see `client`),
+everything else is passed to the typer app in `cli`.
+"""
+import os
+import sys
+from typing import List, Optional
+
+from . import __version__
+
+
+def fast_version(args: List[str]) -> Optional[str]:
+    """
+    Return output of `dockswap version ...` for `args` or `None`
+    if it can not be answered without full CLI (e.g. --help or bad options).
+    """
+    if not args or args[0] != "version":
+        return None
+
+    part = None
+    mini = False
+    options = iter(args[1:])
+    for option in options:
+        if option == "--mini":
+            mini = True
+        elif option == "--no-mini":
+            mini = False
+        elif option == "--part":
+            part = next(options, None)
+        elif option.startswith("--part="):
+            part = option[len("--part="):]
+        else:
+            return None
+
+    if part is not None:
+        parts = dict(zip(["major", "minor", "patch"], __version__.split(".")))
+        return parts.get(part)
+
+    if mini:
+        return __version__
+    return "DockSwapping projects with v{version}".format(version=__version__)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = sys.argv[1:] if argv is None else argv
+
+    if "_DOCKSWAP_COMPLETE" in os.environ:
+        from .completion import complete
+
+        exit_code = complete()
+        if exit_code is not None:
+            return exit_code
+
+    output = fast_version(args)
+    if output is not None:
+        sys.stdout.write(output + "\n")
+        return 0
+
+    from .client import forward
+
+    exit_code = forward(args)
+    if exit_code is not None:
+        return exit_code
+
+    from .cli import app
+
+    return app(args=args, prog_name="dockswap")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+"""
+In-process Python API of dockswap, for tools that would otherwise run
+`dockswap` once per operation and parse its output::
+
+    from dockswap.api import DockSwap
+
+    dockswap = DockSwap()
+    result = dockswap.swap("shop")
+    if not result.ok:
+        print(result.error)
+    for result in dockswap.start_many(["db", "cache"]):
+        print(result.project, result.ok, result.elapsed)
+
+One `DockSwap` object keeps one repo (storage is read once) and one engine
+(with `DOCKSWAP_ENGINE=api` one Docker API connection per thread) for all of
+its calls. Operations return `Result` objects instead of printing, output of
+docker-compose is not printed unless `echo` is set. Failures of projects are
+reported in results (unexpected exceptions included), so one failing project
+does not abort a batch; `DockSwapError` is raised only for invalid requests
+(e.g. unknown storage backend). `KeyboardInterrupt` and `SystemExit` are not
+caught.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from .dockswap.core import Composer, DockSwapRepo
+from .dockswap.errors import DockSwapError
+from .dockswap.teardown import DEFAULT_STOP_TIMEOUT, DEFAULT_WORKERS
+
+DEFAULT_BATCH_WORKERS = 4
+
+
+class Result(object):
+    """Outcome of `action` on `project` (`None` for actions on all containers)."""
+
+    def __init__(
+        self,
+        action: str,
+        project: Optional[str] = None,
+        ok: bool = True,
+        error: Optional[str] = None,
+        elapsed: float = 0.0,
+        details: Optional[Dict[str, Any]] = None,
+    ):
+        self.action = action
+        self.project = project
+        self.ok = ok
+        self.error = error
+        self.elapsed = elapsed
+        self.details = details or {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "action": self.action,
+            "project": self.project,
+            "ok": self.ok,
+            "error": self.error,
+            "elapsed": round(self.elapsed, 3),
+            **self.details,
+        }
+
+    def __repr__(self):
+        return "Result(action={!r}, project={!r}, ok={!r})".format(
+            self.action, self.project, self.ok
+        )
+
+
+def perform(action: str, project: Optional[str], operation: Callable[[], Dict]) -> Result:
+    """
+    Run `operation` (returning details) and wrap its outcome into `Result`.
+    Errors other than `DockSwapError` are reported with their type, e.g. "OSError: ...".
+    """
+    started = time.monotonic()
+    try:
+        details = operation()
+    except DockSwapError as error:
+        return Result(action, project, False, str(error), time.monotonic() - started)
+    except Exception as error:
+        message = "{}: {}".format(type(error).__name__, error)
+        return Result(action, project, False, message, time.monotonic() - started)
+    return Result(action, project, True, None, time.monotonic() - started, details)
+
+
+class DockSwap(object):
+    def __init__(
+        self,
+        repo: Optional[DockSwapRepo] = None,
+        engine=None,
+        echo: bool = False,
+        workers: int = DEFAULT_BATCH_WORKERS,
+    ):
+        self._repo = repo
+        self._engine = engine
+        self.echo = echo
+        self.workers = workers
+
+    @property
+    def repo(self) -> DockSwapRepo:
+        if self._repo is None:
+            from .dockswap.storage import get_repo_class
+
+            self._repo = get_repo_class()()
+        return self._repo
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from .dockswap.engine import get_engine
+
+            self._engine = get_engine()
+        return self._engine
+
+    def composers(self) -> List[Composer]:
+        return self.repo.get_all()
+
+    def composer(self, project: str) -> Composer:
+        composer = self.repo.get(project)
+        composer.echo = self.echo
+        return composer
+
+    def start(
+        self, project: str, services: Optional[List[str]] = None, force: bool = False
+    ) -> Result:
+        """
+        Start `project` (or only its `services`). Unless `force`, nothing is run
+        if its configuration did not change and it is running (see fastpath.py).
+        """
+        return perform("start", project, lambda: self._start(project, services, force))
+
+    def _start(self, project: str, services: Optional[List[str]], force: bool) -> Dict:
+        from .dockswap.admission import schedule_footprints
+
+        composer = self.composer(project)
+        details = self._up(composer, services, force)
+        if details["mode"] != "unchanged":
+            # sampled once the project warmed up, start does not wait for it
+            schedule_footprints([composer])
+        return details
+
+    def _up(self, composer: Composer, services: Optional[List[str]], force: bool) -> Dict:
+        from .dockswap.fastpath import fast_start
+        from .dockswap.validators import validate_services
+
+        if services:
+            validate_services(composer, services)
+        if force:
+            composer.start(only=services)
+            return {"mode": "up", "services": services or []}
+
+        plan = fast_start(composer, services, engine=self.engine)
+        if plan.up_to_date:
+            return {"mode": "unchanged", "services": []}
+        if plan.services is not None:
+            return {"mode": "update", "services": plan.services}
+        return {"mode": "up", "services": services or []}
+
+    def stop(self, project: str) -> Result:
+        """Stop containers of `project` (`docker-compose down`)."""
+
+        def operation():
+            self.composer(project).stop()
+            return {}
+
+        return perform("stop", project, operation)
+
+    def swap(
+        self,
+        project: str,
+        services: Optional[List[str]] = None,
+        force: bool = False,
+        timeout: int = DEFAULT_STOP_TIMEOUT,
+        workers: int = DEFAULT_WORKERS,
+    ) -> Result:
+        """
+        Tear down containers of all other projects (containers of `project`
+        are kept, others get `timeout` seconds to stop) and start `project`,
+        like `dockswap start --remove-other`.
+        """
+
+        def operation():
+            from .dockswap.swap import plan_swap
+
+            composer = self.composer(project)
+            plan = plan_swap(composer, self.engine)
+            report = plan.execute(timeout, workers, engine=self.engine)
+            report.raise_for_failures()
+            details = self._start(project, services, force)
+            details["removed"] = report.removed
+            return details
+
+        return perform("swap", project, operation)
+
+    def stop_all(
+        self,
+        remove: bool = False,
+        timeout: int = DEFAULT_STOP_TIMEOUT,
+        workers: int = DEFAULT_WORKERS,
+    ) -> Result:
+        """Stop (and if `remove`, remove) all containers, like `dockswap stopall`."""
+
+        def operation():
+            from .dockswap.teardown import teardown
+
+            report = teardown(remove, timeout, workers, engine=self.engine)
+            report.raise_for_failures()
+            return {"stopped": report.stopped, "removed": report.removed}
+
+        return perform("stopall", None, operation)
+
+    def start_many(
+        self,
+        projects: List[str],
+        services: Optional[Dict[str, List[str]]] = None,
+        force: bool = False,
+        workers: Optional[int] = None,
+    ) -> List[Result]:
+        """
+        Start `projects` in parallel (`workers` at once), `services` maps project
+        to services to start. Results are in order of `projects`.
+        """
+        services = services or {}
+        return self.batch(
+            lambda project: self.start(project, services.get(project), force), projects, workers
+        )
+
+    def stop_many(self, projects: List[str], workers: Optional[int] = None) -> List[Result]:
+        """Stop `projects` in parallel (`workers` at once), results are in order of `projects`."""
+        return self.batch(self.stop, projects, workers)
+
+    def batch(
+        self, operation: Callable[[str], Result], projects: List[str], workers: Optional[int]
+    ) -> List[Result]:
+        if not projects:
+            return []
+        # storage is loaded before threads share the repo
+        self.repo.get_all()
+        with ThreadPoolExecutor(max_workers=max(1, workers or self.workers)) as executor:
+            return list(executor.map(operation, projects))
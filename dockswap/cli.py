@@ -1,6 +1,6 @@
-import os
-import subprocess
 import functools
+import json
+import time
 
 from typing import Optional, List
 from pathlib import Path
@@ -11,28 +11,68 @@ from .dockswap.validators import (
     validate_docker_compose_path,
     validate_path,
     validate_project_name,
+    validate_services,
 )
-from .dockswap.core import Composer, DockSwapRepo
+from .dockswap.core import Composer
 from .dockswap.errors import DockSwapError
+from .dockswap.execution import install_signal_forwarding
+from .dockswap.storage import LazyRepo, get_repo_class
+from .dockswap import timing
 
 VERSION = "0.3.0"
 MAJOR, MINOR, PATCH = VERSION.split(".")
 
 app = typer.Typer(help="DockSwap. Tool for swapping projects.")
+group_app = typer.Typer(help="Manage groups of composers started together")
+app.add_typer(group_app, name="group")
 
 docker_compose_path_help = (
-    "Path to .yml or .json file that must be run using docker-compose"
+    "Path to .yml, .yaml or .json file that must be run using docker-compose"
 )
 env_path_help = (
     "If your docker-compose file uses env_file then specify path for that file"
 )
+
+
+def complete_registered(args: List[str], incomplete: str) -> List[str]:
+    """
+    Project or service names for shell completion. Used only when completion
+    index could not answer (see completion.py), so index is rebuilt first.
+    """
+    from .completion import candidates, load_index
+
+    repo.write_completion_index(repo.loaded_data)
+    index = load_index(str(repo.get_completion_index_path()))
+    return candidates(args, incomplete, index) or []
+
+
+project_name_argument = typer.Argument(..., autocompletion=complete_registered)
 dry_option = typer.Option(False, help="Do not run command, instead just print it")
 remove_option = typer.Option(False, help="Remove stopped containers")
+remove_other_option = typer.Option(
+    False,
+    help="Stop and remove containers of other projects, keeping the ones of this project",
+)
 service_option = typer.Option(
-    None, help="Name of service to be started. Can be provided multiple times"
+    None,
+    help="Name of service to be started. Can be provided multiple times",
+    autocompletion=complete_registered,
+)
+stop_timeout_option = typer.Option(
+    None,
+    help="Seconds to wait for other containers to stop before killing them [default: 10]",
+)
+workers_option = typer.Option(
+    None, help="Number of parallel workers stopping other containers [default: 4]"
+)
+profile_option = typer.Option(False, help="Print time spent in every phase")
+json_option = typer.Option(
+    False, "--json", help="Print result as JSON (one object per line) instead of messages"
 )
 
-repo = DockSwapRepo()
+# repo is built on first use, so that importing cli (or running commands that
+# do not need registered composers) does not touch ~/.dockswap
+repo = LazyRepo()
 
 
 class VersionPart(Enum):
@@ -46,15 +86,82 @@ def handle_error(func):
 
     @functools.wraps(func)
     def wrapped(*args, **kwargs):
+        # children started from worker threads get signals forwarded as well
+        install_signal_forwarding()
         try:
             return func(*args, **kwargs)
         except DockSwapError as dockswap_err:
+            if kwargs.get("json_output"):
+                emit_json(
+                    {"ok": False, "error": str(dockswap_err), "exit_code": dockswap_err.exit_code}
+                )
             typer.secho(str(dockswap_err), fg=typer.colors.RED, err=True)
-            raise typer.Exit(code=1)
+            raise typer.Exit(code=dockswap_err.exit_code)
 
     return wrapped
 
 
+def emit_json(data: dict):
+    """Print `data` as one line of JSON (NDJSON output of `--json`)."""
+    typer.echo(json.dumps(data, sort_keys=True))
+
+
+def emit_results(results: List):
+    """Print results of `api.DockSwap` calls, exit with 1 if any of them failed."""
+    for result in results:
+        emit_json(result.to_dict())
+    if not all(result.ok for result in results):
+        raise typer.Exit(code=1)
+
+
+def json_api():
+    """API object running commands for `--json`: docker-compose output is not printed."""
+    from .api import DockSwap
+
+    return DockSwap(repo=repo)
+
+
+def reject_with_json(**options):
+    """Raise `DockSwapError` if any of `options` (which `--json` does not support) is set."""
+    given = ["--" + name.replace("_", "-") for name, value in options.items() if value]
+    if given:
+        raise DockSwapError("--json can not be combined with {}".format(", ".join(given)))
+
+
+def profiled(command: str, project_argument: str = "project_name"):
+    """
+    Time phases of `command` and append them to history (unless run is `dry`)
+    under project given as `project_argument`.
+    With `profile` option phase timings are also printed to stderr.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapped(*args, **kwargs):
+            profiler = timing.start()
+            ok = False
+            try:
+                result = func(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                profiler.finish()
+                if not kwargs.get("dry") and timing.enabled():
+                    try:
+                        timing.History().append(
+                            command, profiler, project=kwargs.get(project_argument), ok=ok
+                        )
+                    except OSError:
+                        pass  # history must never break the command itself
+                if kwargs.get("profile"):
+                    for line in profiler.describe():
+                        typer.echo(line, err=True)
+
+        return wrapped
+
+    return decorator
+
+
 @app.command()
 def version(
     part: Optional[VersionPart] = typer.Option(
@@ -90,7 +197,7 @@ def add(
     validate_project_name(repo, project_name)
     if env_path:
         validate_path(env_path)
-    validate_docker_compose_path(path)
+    validate_docker_compose_path(path, env_path)
     composer = Composer(
         docker_compose_path=path, env_path=env_path, project_name=project_name
     )
@@ -102,14 +209,75 @@ def add(
 
 
 @app.command()
-def list(full: Optional[bool] = typer.Option(False, help="show more info")):
+@handle_error
+def discover(
+    root: Path = typer.Argument(..., help="Directory searched for compose files"),
+    ignore: Optional[List[str]] = typer.Option(
+        None, help="Pattern of directories to skip. Can be provided multiple times"
+    ),
+    no_default_ignore: Optional[bool] = typer.Option(
+        False, help="Do not skip hidden directories, node_modules, venv..."
+    ),
+    workers: Optional[int] = typer.Option(
+        None, help="Number of directories scanned in parallel [default: 16]"
+    ),
+    dry: Optional[bool] = typer.Option(False, help="Only show what would be registered"),
+):
+    """Register composers for all compose files found in a directory tree"""
+    from .dockswap.discover import DEFAULT_DISCOVER_WORKERS, DEFAULT_IGNORE, discover_composers
+
+    patterns = ([] if no_default_ignore else [*DEFAULT_IGNORE]) + [*(ignore or [])]
+    discovery = discover_composers(
+        str(root.absolute()), repo.get_all(), patterns, workers or DEFAULT_DISCOVER_WORKERS
+    )
+    for path, reason in discovery.skipped:
+        typer.secho("Skipped {}: {}".format(path, reason), fg=typer.colors.YELLOW)
+    for composer in discovery.composers:
+        typer.echo(composer.represent(full=True))
+
+    if dry or not discovery.composers:
+        return
+    repo.persist_all(discovery.composers)
+    typer.secho(
+        "Successfully registered {} composer(s)".format(len(discovery.composers)),
+        fg=typer.colors.GREEN,
+    )
+
+
+@app.command()
+@handle_error
+def list(
+    full: Optional[bool] = typer.Option(False, help="show more info"),
+    services: Optional[bool] = typer.Option(
+        False, help="show services defined in compose files"
+    ),
+    json_output: Optional[bool] = json_option,
+):
     """List all registered composers"""
+    if json_output:
+        for composer in repo.get_all():
+            data = composer.to_dict()
+            if services:
+                try:
+                    data["services"] = composer.spec.service_names
+                except DockSwapError:
+                    data["services"] = None
+            emit_json(data)
+        return
+
     for i, composer in enumerate(repo.get_all(), start=1):
-        typer.echo("{}. {}".format(i, composer.represent(full=full)))
+        line = "{}. {}".format(i, composer.represent(full=full))
+        if services:
+            try:
+                line += " [{}]".format(", ".join(composer.spec.service_names))
+            except DockSwapError:
+                line += " [unavailable]"
+        typer.echo(line)
 
 
 @app.command()
-def delete(project_name: str):
+@handle_error
+def delete(project_name: str = project_name_argument):
     """Delete registered composer"""
     deleted = repo.delete(project_name)
     if deleted:
@@ -126,97 +294,285 @@ def delete(project_name: str):
         )
 
 
-def stop_other_containers(remove: Optional[bool] = False, dry: Optional[bool] = False):
+def stop_other_containers(
+    remove: Optional[bool] = False,
+    dry: Optional[bool] = False,
+    timeout: Optional[int] = None,
+    workers: Optional[int] = None,
+):
     """
     Stop all running containers by running `docker stop ...`. If `remove` then
-    also run `docker rm ...`. If `dry` then just return command to be run.
-    If there actually no running containers then `dry` return `None` instead of empty string.
+    also force remove all containers with `docker rm -f ...`.
+    If `dry` then just return command to be run.
+    If there actually no containers to stop then `dry` return `None` instead of empty string.
+
+    Containers are stopped (and removed) in parallel by `workers` and each of them
+    is given `timeout` seconds to stop gracefully. Failures are collected
+    for every container and reported at once.
 
     Note: `docker` command can be changed by setting `DOCKSWAP_DOCKER_CLI` environment variable.
     """
-    docker_bin = os.environ.get("DOCKSWAP_DOCKER_CLI", "docker")
-    list_all_containers_command = "{} ps -aq".format(docker_bin)
-    list_all_containers = subprocess.getoutput(list_all_containers_command)
-    list_all_containers = " ".join(list_all_containers.split())
+    from .dockswap import teardown
 
-    stop_command_dry = "{} stop {}".format(docker_bin, list_all_containers)
-    remove_command_dry = "{} rm {}".format(docker_bin, list_all_containers)
+    if dry:
+        return teardown.teardown_command(remove=remove, **teardown_options(timeout))
 
-    if not list_all_containers:
-        return None
+    report = teardown.teardown(remove=remove, **teardown_options(timeout, workers))
+    report.raise_for_failures()
 
-    if dry:
-        commands = [stop_command_dry]
 
-        if remove:
-            commands.append(remove_command_dry)
+def teardown_options(timeout: Optional[int] = None, workers: Optional[int] = None):
+    """Keyword arguments for teardown functions, omitting options that were not given."""
+    options = {}
+    if timeout is not None:
+        options["timeout"] = timeout
+    if workers is not None:
+        options["workers"] = workers
+    return options
 
-        return " && ".join(commands)
 
-    # TODO: This part could actually be two separate functions
-    # execute stop command
-    out = subprocess.run([docker_bin, "stop"] + list_all_containers.split())
-    if out.returncode != 0:
-        raise DockSwapError(
-            'Command "{}" exited with status code {}'.format(
-                stop_command_dry, out.returncode
-            )
-        )
-    if remove:
-        # execute rm command
-        out = subprocess.run([docker_bin, "rm"] + list_all_containers.split())
-        if out.returncode != 0:
-            raise DockSwapError(
-                'Command "{}" exited with status code {}'.format(
-                    remove_command_dry, out.returncode
-                )
-            )
+def wait_for_services(
+    composer: Composer,
+    only: Optional[List[str]] = None,
+    timeout: Optional[int] = None,
+    since: Optional[float] = None,
+):
+    """Wait until services of `composer` are ready, see `readiness.wait_until_ready`."""
+    from .dockswap.readiness import DEFAULT_WAIT_TIMEOUT, wait_until_ready
+
+    services = wait_until_ready(
+        composer, only, DEFAULT_WAIT_TIMEOUT if timeout is None else timeout, since=since
+    )
+    typer.echo("Ready: {}".format(", ".join(services) or "no containers"))
+
+
+def sample_footprints(*composers: Composer):
+    """
+    Sample usage of `composers` just brought up, once they warmed up, so that
+    later `start --fit` knows how much they need (start does not wait for it).
+    """
+    from .dockswap.admission import schedule_footprints
+
+    schedule_footprints([*composers])
+
+
+def start_composer(composer: Composer, service: Optional[List[str]], force: bool) -> bool:
+    """
+    Start `composer` skipping `docker-compose up` (or running it only for
+    changed services) if configuration did not change since its last start.
+    Return whether `up` was run.
+    """
+    from .dockswap.fastpath import fast_start
+
+    if force:
+        composer.start(only=service)
+        return True
+    plan = fast_start(composer, service)
+    if plan.up_to_date or plan.services is not None:
+        typer.echo("{}: {}".format(composer.project_name, plan.describe()))
+    return not plan.up_to_date
 
 
 @app.command()
 @handle_error
+@profiled("start")
 def start(
-    project_name: str,
-    remove_other: Optional[bool] = remove_option,
+    project_name: str = project_name_argument,
+    remove_other: Optional[bool] = remove_other_option,
     dry: Optional[bool] = dry_option,
     service: Optional[List[str]] = service_option,
+    stop_timeout: Optional[int] = stop_timeout_option,
+    workers: Optional[int] = workers_option,
+    pipeline: Optional[bool] = typer.Option(
+        False, help="Pull images of project while other containers are being stopped"
+    ),
+    create: Optional[bool] = typer.Option(
+        False, help="With --pipeline also create containers before starting them"
+    ),
+    standby: Optional[bool] = typer.Option(
+        False,
+        help="Pause other registered projects instead of stopping them"
+        " and unpause this project if it is paused",
+    ),
+    standby_count: Optional[int] = typer.Option(
+        None, help="Number of paused projects to keep [default: 2]"
+    ),
+    standby_memory: Optional[str] = typer.Option(
+        None, help="Memory budget of paused projects, e.g. 4g [default: unlimited]"
+    ),
+    wait: Optional[bool] = typer.Option(
+        False, help="Wait until services are running and healthy"
+    ),
+    timeout: Optional[int] = typer.Option(
+        None, help="Seconds to wait for services with --wait [default: 60]"
+    ),
+    fit: Optional[bool] = typer.Option(
+        False,
+        help="Stop only as many least recently used projects as needed"
+        " for memory and CPU of this project",
+    ),
+    force: Optional[bool] = typer.Option(
+        False,
+        help="Always run docker-compose up, even if configuration of project"
+        " did not change and its services are running",
+    ),
+    profile: Optional[bool] = profile_option,
+    json_output: Optional[bool] = json_option,
 ):
     """Start containers for registered composer"""
-    composer = repo.get(project_name)
+    if json_output:
+        reject_with_json(dry=dry, fit=fit, standby=standby, pipeline=pipeline, wait=wait)
+        api = json_api()
+        if remove_other:
+            return emit_results(
+                [api.swap(project_name, service, force, **teardown_options(stop_timeout, workers))]
+            )
+        return emit_results([api.start(project_name, service, force)])
 
-    if remove_other and not dry:
-        stop_other_containers(remove=True, dry=False)
-    command = composer.start(dry=dry, only=service)
+    with timing.phase("storage"):
+        composer = repo.get(project_name)
+    if service:
+        validate_services(composer, service)
+    # containers that exited before this start are not waited for
+    started = time.time()
+
+    if fit:
+        if standby or remove_other or pipeline:
+            raise DockSwapError(
+                "--fit can not be combined with --standby, --remove-other or --pipeline"
+            )
+        from .dockswap.admission import admit
+
+        admission = admit(composer, repo, dry=dry)
+        if dry:
+            for line in admission.describe():
+                typer.echo("# {}".format(line))
+            commands = [other.stop(dry=True) for other in admission.evict]
+            return typer.echo(" && ".join(commands + [composer.start(dry=True, only=service)]))
+
+        if start_composer(composer, service, force):
+            sample_footprints(composer)
+        if wait:
+            wait_for_services(composer, service, timeout, started)
+        if admission.evict:
+            typer.echo(
+                "Stopped to make room: {}".format(
+                    ", ".join(other.project_name for other in admission.evict)
+                )
+            )
+        return typer.secho("Successfully swapped a project!", fg=typer.colors.GREEN)
+
+    if standby:
+        from .dockswap.standby import StandbyPool, standby_swap
+
+        result = standby_swap(
+            composer,
+            repo,
+            pool=StandbyPool(count=standby_count, memory=standby_memory),
+            only=service,
+            remove_other=remove_other,
+            dry=dry,
+            **teardown_options(stop_timeout, workers)
+        )
+        if dry:
+            return typer.echo(" && ".join(result.commands))
+        if not result.warm:
+            sample_footprints(composer)
+        if wait:
+            wait_for_services(composer, service, timeout, started)
+        return typer.secho(
+            "Swapped back to a warm project!"
+            if result.warm
+            else "Successfully swapped a project!",
+            fg=typer.colors.GREEN,
+        )
+
+    plan = None
+    if remove_other:
+        # containers of the project itself are kept, only other projects are torn down
+        from .dockswap.swap import plan_swap
+
+        plan = plan_swap(composer)
+
+    if pipeline:
+        from .dockswap.swap import pipelined_swap, pipelined_swap_command
+
+        if dry:
+            for line in plan.describe() if plan else []:
+                typer.echo("# {}".format(line))
+            return typer.echo(
+                pipelined_swap_command(
+                    composer, plan, service, create, **teardown_options(stop_timeout)
+                )
+            )
+
+        pipelined_swap(
+            composer, plan, service, create, **teardown_options(stop_timeout, workers)
+        )
+        sample_footprints(composer)
+        if wait:
+            wait_for_services(composer, service, timeout, started)
+        return typer.secho("Successfully swapped a project!", fg=typer.colors.GREEN)
+
+    if plan and not dry:
+        plan.execute(**teardown_options(stop_timeout, workers)).raise_for_failures()
+    command = composer.start(dry=True, only=service) if dry else None
+    if not dry and start_composer(composer, service, force):
+        sample_footprints(composer)
 
     if command and dry:
-        if remove_other:
-            remove_command = stop_other_containers(remove=True, dry=True)
+        if plan:
+            for line in plan.describe():
+                typer.echo("# {}".format(line))
+            remove_command = plan.command(**teardown_options(stop_timeout))
             if not remove_command:
                 return typer.echo(command)
             return typer.echo(" && ".join([remove_command, command]))
         typer.echo(command)
 
     if not dry:
+        if wait:
+            wait_for_services(composer, service, timeout, started)
         typer.secho("Successfully swapped a project!", fg=typer.colors.GREEN)
 
 
 @app.command()
 @handle_error
+@profiled("stop")
 def stop(
-    project_name: str,
+    project_name: str = project_name_argument,
     remove_other: Optional[bool] = remove_option,
     dry: Optional[bool] = dry_option,
+    stop_timeout: Optional[int] = stop_timeout_option,
+    workers: Optional[int] = workers_option,
+    profile: Optional[bool] = profile_option,
+    json_output: Optional[bool] = json_option,
 ):
     """Stop containers for registered composer"""
-    composer = repo.get(project_name)
+    if json_output:
+        reject_with_json(dry=dry)
+        api = json_api()
+        results = []
+        if remove_other:
+            results.append(
+                api.stop_all(remove=True, **teardown_options(stop_timeout, workers))
+            )
+        return emit_results(results + [api.stop(project_name)])
+
+    with timing.phase("storage"):
+        composer = repo.get(project_name)
 
     if remove_other and not dry:
-        stop_other_containers(remove=True, dry=False)
+        stop_other_containers(
+            remove=True, dry=False, timeout=stop_timeout, workers=workers
+        )
     command = composer.stop(dry=dry)
 
     if command and dry:
         if remove_other:
-            remove_command = stop_other_containers(remove=True, dry=True)
+            remove_command = stop_other_containers(
+                remove=True, dry=True, timeout=stop_timeout
+            )
             if not remove_command:
                 return typer.echo(command)
             return typer.echo(" && ".join([remove_command, command]))
@@ -228,9 +584,25 @@ def stop(
 
 @app.command()
 @handle_error
-def stopall(dry: Optional[bool] = dry_option, remove: Optional[bool] = remove_option):
+@profiled("stopall")
+def stopall(
+    dry: Optional[bool] = dry_option,
+    remove: Optional[bool] = remove_option,
+    stop_timeout: Optional[int] = stop_timeout_option,
+    workers: Optional[int] = workers_option,
+    profile: Optional[bool] = profile_option,
+    json_output: Optional[bool] = json_option,
+):
     """Stop (and/or remove) all running containers"""
-    command = stop_other_containers(remove=remove, dry=dry)
+    if json_output:
+        reject_with_json(dry=dry)
+        return emit_results(
+            [json_api().stop_all(remove, **teardown_options(stop_timeout, workers))]
+        )
+
+    command = stop_other_containers(
+        remove=remove, dry=dry, timeout=stop_timeout, workers=workers
+    )
     if dry:
         typer.echo(command)
     else:
@@ -242,6 +614,352 @@ def stopall(dry: Optional[bool] = dry_option, remove: Optional[bool] = remove_op
         )
 
 
+@app.command()
+@handle_error
+def doctor(
+    images: Optional[bool] = typer.Option(
+        False, help="Also check that images of services are pulled"
+    ),
+    prune: Optional[bool] = typer.Option(
+        False, help="Delete composers which compose or env file does not exist any more"
+    ),
+    workers: Optional[int] = typer.Option(
+        None, help="Number of composers checked in parallel [default: 16]"
+    ),
+):
+    """Check all registered composers"""
+    from .dockswap.doctor import DEFAULT_DOCTOR_WORKERS, diagnose_all, normalize_image
+
+    local_images = None
+    if images:
+        from .dockswap.engine import get_engine
+
+        local_images = {normalize_image(name) for name in get_engine().image_names()}
+
+    composers = repo.get_all()
+    diagnoses = diagnose_all(composers, local_images, workers or DEFAULT_DOCTOR_WORKERS)
+    broken = [diagnosis for diagnosis in diagnoses if not diagnosis.ok]
+    for diagnosis in broken:
+        typer.secho(
+            "{}{}:".format(diagnosis.composer.project_name, " (stale)" if diagnosis.stale else ""),
+            fg=typer.colors.YELLOW,
+        )
+        for problem in diagnosis.problems:
+            typer.echo("  - {}".format(problem))
+
+    pruned = []
+    if prune:
+        pruned = repo.delete_many(
+            [diagnosis.composer.project_name for diagnosis in broken if diagnosis.stale]
+        )
+        if pruned:
+            typer.secho(
+                "Pruned {} stale composer(s): {}".format(len(pruned), ", ".join(pruned)),
+                fg=typer.colors.GREEN,
+            )
+
+    if len(broken) == len(pruned):
+        return typer.secho(
+            "All {} composer(s) are fine".format(len(composers) - len(pruned)),
+            fg=typer.colors.GREEN,
+        )
+    raise DockSwapError(
+        "{} of {} composer(s) have problems".format(len(broken) - len(pruned), len(composers))
+    )
+
+
+@app.command()
+@handle_error
+def prefetch(
+    workers: Optional[int] = typer.Option(
+        None, help="Number of images pulled in parallel [default: 3]"
+    ),
+    restart: Optional[bool] = typer.Option(
+        False, help="Pull everything again instead of resuming interrupted run"
+    ),
+    dry: Optional[bool] = typer.Option(False, help="Only show images in order of pulling"),
+):
+    """Pull images of all registered composers ahead of time"""
+    from .dockswap.prefetch import (
+        DEFAULT_PREFETCH_WORKERS,
+        prefetch as prefetch_images,
+        prefetch_plan,
+        swap_frequency,
+    )
+
+    composers = repo.get_all()
+    if dry:
+        plan = prefetch_plan(composers, swap_frequency(timing.History().records()))
+        for item in plan:
+            typer.echo("{} ({})".format(item.image, ", ".join(item.projects)))
+        return
+
+    def on_pulled(item, error):
+        if error:
+            typer.secho("Failed {}: {}".format(item.image, error), fg=typer.colors.RED)
+        else:
+            typer.echo("Pulled {} ({})".format(item.image, ", ".join(item.projects)))
+
+    result = prefetch_images(
+        composers, workers or DEFAULT_PREFETCH_WORKERS, restart, on_pulled=on_pulled
+    )
+    if result.skipped:
+        typer.echo("Resumed, {} image(s) already pulled".format(len(result.skipped)))
+    if result.failed:
+        raise DockSwapError(
+            "Could not pull {} image(s), run prefetch again to retry".format(len(result.failed))
+        )
+    typer.secho("Pulled {} image(s)".format(len(result.pulled)), fg=typer.colors.GREEN)
+
+
+@app.command()
+@handle_error
+def top(
+    interval: Optional[float] = typer.Option(2.0, help="Seconds between refreshes"),
+    once: Optional[bool] = typer.Option(False, help="Print usage once and exit"),
+    stream: Optional[bool] = typer.Option(
+        False, help="Follow docker stats instead of reading cgroup files"
+    ),
+):
+    """Show live CPU, memory and IO usage per registered project"""
+    import sys
+    import threading
+
+    from .dockswap.daemon import ContainerCache
+    from .dockswap.engine import get_engine
+    from .dockswap.top import LIST_INTERVAL, MixedSampler, Renderer, StreamSampler, Top
+
+    cache = ContainerCache(get_engine(), max_age=LIST_INTERVAL)
+    stopped = threading.Event()
+    threading.Thread(target=cache.watch, args=(stopped,), daemon=True).start()
+
+    sampler = StreamSampler() if stream else MixedSampler()
+
+    monitor = Top(sampler, cache.list_containers, repo.get_all())
+    renderer = Renderer() if sys.stdout.isatty() and not once else None
+    try:
+        # CPU and IO rates need two samples
+        monitor.frame()
+        if renderer:
+            typer.echo("\x1b[2J", nl=False)
+        while not stopped.wait(interval):
+            lines = monitor.frame()
+            if renderer:
+                typer.echo(renderer.render(lines), nl=False)
+            else:
+                typer.echo("\n".join(lines + ([] if once else [""])))
+            if once:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stopped.set()
+        sampler.close()
+
+
+@app.command()
+@handle_error
+def stats(
+    project_name: Optional[str] = typer.Argument(None, help="Show only this project"),
+):
+    """Show p50/p95/max time of swap phases per project"""
+    rows = timing.summarize(timing.History().records(), project=project_name)
+    if not rows:
+        return typer.echo("No timings recorded yet")
+
+    typer.echo(
+        "{:<20} {:<16} {:>5} {:>9} {:>9} {:>9}".format(
+            "PROJECT", "PHASE", "RUNS", "P50", "P95", "MAX"
+        )
+    )
+    for name, phase_name, runs, p50, p95, maximum in rows:
+        typer.echo(
+            "{:<20} {:<16} {:>5} {:>8.3f}s {:>8.3f}s {:>8.3f}s".format(
+                name, phase_name, runs, p50, p95, maximum
+            )
+        )
+
+
+@app.command()
+@handle_error
+@profiled("snapshot")
+def snapshot(
+    project_name: str = project_name_argument,
+    name: str = typer.Argument(..., help="Name of snapshot, e.g. seeded"),
+    method: Optional[str] = typer.Option(
+        "auto",
+        help="reflink (clone into docker volume), tar (gzipped archive)"
+        " or auto (reflink where filesystem supports it, tar otherwise)",
+    ),
+    replace: Optional[bool] = typer.Option(False, help="Overwrite existing snapshot"),
+    delete: Optional[bool] = typer.Option(False, help="Delete snapshot instead"),
+    profile: Optional[bool] = profile_option,
+):
+    """Snapshot named volumes of a stopped project"""
+    from .dockswap.snapshot import create_snapshot, delete_snapshot, describe
+
+    composer = repo.get(project_name)
+    if delete:
+        delete_snapshot(composer, name)
+        return typer.secho('Deleted snapshot "{}"'.format(name), fg=typer.colors.GREEN)
+
+    created = create_snapshot(composer, name, method, replace)
+    typer.secho("Created snapshot {}".format(describe(name, created)), fg=typer.colors.GREEN)
+
+
+@app.command()
+@handle_error
+@profiled("restore")
+def restore(
+    project_name: str = project_name_argument,
+    name: str = typer.Argument(..., help="Name of snapshot"),
+    profile: Optional[bool] = profile_option,
+):
+    """Restore named volumes of a stopped project from snapshot"""
+    from .dockswap.snapshot import restore_snapshot
+
+    restore_snapshot(repo.get(project_name), name)
+    typer.secho(
+        'Restored snapshot "{}", start project to use it'.format(name), fg=typer.colors.GREEN
+    )
+
+
+@app.command()
+@handle_error
+def snapshots(project_name: str = project_name_argument):
+    """List snapshots of a project"""
+    from .dockswap.snapshot import SnapshotIndex, describe
+
+    index = SnapshotIndex(repo.get(project_name).project_name).load()
+    if not index:
+        return typer.echo("No snapshots yet")
+    for name, created in sorted(index.items(), key=lambda item: item[1]["created"]):
+        typer.echo(describe(name, created))
+
+
+@app.command()
+@handle_error
+def daemon(
+    stop: Optional[bool] = typer.Option(False, help="Stop running daemon"),
+):
+    """Serve start/stop/list/stopall from a resident process (same as dockswapd)"""
+    from .dockswap.daemon import Daemon, stop as stop_daemon
+
+    if stop:
+        if stop_daemon():
+            return typer.secho("Stopped dockswap daemon", fg=typer.colors.GREEN)
+        return typer.secho("dockswap daemon is not running", fg=typer.colors.YELLOW)
+
+    Daemon().serve()
+
+
+@group_app.command("add")
+@handle_error
+def group_add(
+    group_name: str,
+    members: List[str] = typer.Argument(..., help="Registered projects of the group"),
+    after: Optional[List[str]] = typer.Option(
+        None,
+        help='Dependency as "project:dependency", project is started after dependency.'
+        " Can be provided multiple times",
+    ),
+):
+    """Create (or replace) a group of registered composers"""
+    from .dockswap.groups import Group, GroupRepo
+
+    for member in members:
+        repo.get(member)
+
+    dependencies = {}
+    for edge in after or []:
+        if ":" not in edge:
+            raise DockSwapError(
+                'Dependency must look like "project:dependency", got "{}"'.format(edge)
+            )
+        member, dependency = edge.split(":", 1)
+        dependencies.setdefault(member, []).append(dependency)
+
+    GroupRepo().persist(Group(group_name, members, dependencies))
+    typer.secho('Successfully saved group "{}"'.format(group_name), fg=typer.colors.GREEN)
+
+
+@group_app.command("list")
+@handle_error
+def group_list():
+    """List all groups"""
+    from .dockswap.groups import GroupRepo
+
+    for i, group in enumerate(GroupRepo().get_all(), start=1):
+        typer.echo("{}. {}".format(i, group.represent()))
+
+
+@group_app.command("delete")
+@handle_error
+def group_delete(group_name: str):
+    """Delete a group (its composers stay registered)"""
+    from .dockswap.groups import GroupRepo
+
+    if GroupRepo().delete(group_name):
+        typer.secho('Successfully removed group "{}"'.format(group_name), fg=typer.colors.GREEN)
+    else:
+        typer.secho(
+            'Seems like group "{}" did not exist or already removed'.format(group_name),
+            fg=typer.colors.YELLOW,
+        )
+
+
+@group_app.command("start")
+@handle_error
+@profiled("group-start", project_argument="group_name")
+def group_start(
+    group_name: str,
+    remove_other: Optional[bool] = typer.Option(
+        False, help="Stop and remove containers of projects that are not in the group"
+    ),
+    dry: Optional[bool] = dry_option,
+    parallel: Optional[int] = typer.Option(
+        None, help="Number of projects started at once [default: 4]"
+    ),
+    stop_timeout: Optional[int] = stop_timeout_option,
+    workers: Optional[int] = workers_option,
+    profile: Optional[bool] = profile_option,
+):
+    """Start all composers of a group, dependencies first and the rest in parallel"""
+    from .dockswap import teardown
+    from .dockswap.groups import (
+        DEFAULT_GROUP_WORKERS,
+        GroupRepo,
+        foreign_containers,
+        start_group,
+        start_group_commands,
+    )
+
+    group = GroupRepo().get(group_name)
+    with timing.phase("storage"):
+        composers = {member: repo.get(member) for member in group.members}
+
+    foreign = foreign_containers(composers.values()) if remove_other else []
+
+    if dry:
+        if foreign:
+            typer.echo(
+                teardown.teardown_command(
+                    remove=True, containers=foreign, **teardown_options(stop_timeout)
+                )
+            )
+        for line in start_group_commands(group, composers):
+            typer.echo(line)
+        return
+
+    if foreign:
+        teardown.teardown(
+            remove=True, containers=foreign, **teardown_options(stop_timeout, workers)
+        ).raise_for_failures()
+    start_group(group, composers, workers=parallel or DEFAULT_GROUP_WORKERS)
+    sample_footprints(*composers.values())
+    typer.secho('Successfully started group "{}"!'.format(group_name), fg=typer.colors.GREEN)
+
+
 @app.command()
 def prune(input: Optional[bool] = typer.Option(True, help="ask for confirmation")):
     """Prune existing registered composers."""
@@ -250,14 +968,14 @@ def prune(input: Optional[bool] = typer.Option(True, help="ask for confirmation"
         typer.secho("Pruned all registered composers", fg=typer.colors.GREEN)
 
     if not input:
-        DockSwapRepo.prune()
+        get_repo_class().prune()
         success()
         return
 
     prune_yes = typer.confirm("Are you sure to prune all your registered composers?")
 
     if prune_yes:
-        DockSwapRepo.prune()
+        get_repo_class().prune()
         success()
     else:
         typer.secho("Pruning cancelled...", fg=typer.colors.YELLOW)
@@ -0,0 +1,109 @@
+"""
+Thin client of `dockswap daemon`.
+
+Commands served by daemon are forwarded to it over unix socket
+(~/.dockswap/dockswapd.sock or `DOCKSWAP_DAEMON_SOCKET`) as one JSON line.
+Daemon answers with JSON lines of output as the command prints it
+(`{"stdout": "..."}` or `{"stderr": "..."}`) and the last one holds exit code.
+If daemon is not running (or runs with different environment) `forward`
+returns `None` and the command is executed in-process as usual.
+
+Only standard library modules that are cheap to import are used here.
+"""
+import os
+import sys
+import json
+import socket
+from typing import Callable, Dict, List, Optional
+
+DAEMON_COMMANDS = ("start", "stop", "list", "stopall")
+CONNECT_TIMEOUT = 1.0
+# environment that changes what commands do, daemon refuses requests if it differs
+ENV_PREFIXES = ("DOCKSWAP_", "DOCKER_", "COMPOSE_")
+IGNORED_ENV = ("DOCKSWAP_DAEMON", "DOCKSWAP_DAEMON_SOCKET")
+
+
+def daemon_socket_path() -> str:
+    return os.environ.get("DOCKSWAP_DAEMON_SOCKET") or os.path.join(
+        os.path.expanduser("~"), ".dockswap", "dockswapd.sock"
+    )
+
+
+def relevant_env(environ: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    environ = os.environ if environ is None else environ
+    return {
+        key: value
+        for key, value in environ.items()
+        if key.startswith(ENV_PREFIXES) and key not in IGNORED_ENV
+    }
+
+
+def send(
+    request: Dict,
+    path: Optional[str] = None,
+    output: Optional[Callable[[Dict[str, str]], None]] = None,
+) -> Optional[Dict]:
+    """
+    Send `request` to daemon and return its final response, lines of output
+    received before it are passed to `output`. `None` if daemon is not reachable.
+    """
+    path = path or daemon_socket_path()
+    if not os.path.exists(path):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(CONNECT_TIMEOUT)
+        try:
+            sock.connect(path)
+
+            # commands like `start` may take minutes
+            sock.settimeout(None)
+            sock.sendall(json.dumps(request).encode() + b"\n")
+        except OSError:
+            return None
+
+        try:
+            with sock.makefile("rb") as reader:
+                for line in reader:
+                    message = json.loads(line.decode())
+                    if "exit_code" in message or "fallback" in message:
+                        return message
+                    if output is not None:
+                        output(message)
+        except OSError:
+            pass
+    finally:
+        sock.close()
+
+    # request was sent, so it is not safe to run the command again in-process
+    return {"exit_code": 1, "stderr": "dockswap daemon closed connection\n"}
+
+
+def forward(args: List[str]) -> Optional[int]:
+    """
+    Run command `args` in daemon and print its output.
+    Return exit code or `None` if command has to be run in-process.
+    """
+    if not args or args[0] not in DAEMON_COMMANDS:
+        return None
+    if os.environ.get("DOCKSWAP_DAEMON", "1") in ("0", "false", "no"):
+        return None
+
+    # streams are taken before daemon answers, output goes where the caller expects it
+    streams = {"stdout": sys.stdout, "stderr": sys.stderr}
+
+    def output(message: Dict[str, str]):
+        for name, stream in streams.items():
+            if message.get(name):
+                stream.write(message[name])
+                stream.flush()
+
+    response = send(
+        {"args": args, "env": relevant_env(), "color": sys.stdout.isatty()}, output=output
+    )
+    if response is None or response.get("fallback"):
+        return None
+
+    output(response)
+    return response.get("exit_code", 1)
@@ -0,0 +1,139 @@
+"""
+Fast shell completion of project and service names.
+
+Registered projects and services of their compose files are kept in a small
+index next to the storage file (~/.dockswap/storage.json.completion), which is
+updated on every write to storage (see dockswap/completion_index.py).
+Completion requests that ask for project or service names (`dockswap start <TAB>`,
+`dockswap start foo --service <TAB>`) are answered from it by `complete`
+without importing typer or the rest of dockswap, everything else (commands,
+options) is left to typer.
+
+Only standard library modules that are cheap to import are used here.
+"""
+import os
+import sys
+import shlex
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from .dockswap.completion_index import fingerprint, load_index
+
+COMPLETE_VAR = "_DOCKSWAP_COMPLETE"
+# commands which first argument is a registered project
+PROJECT_COMMANDS = ("start", "stop", "delete", "snapshot", "restore", "snapshots")
+# options of those commands that take a value
+VALUE_OPTIONS = (
+    "--service",
+    "--stop-timeout",
+    "--workers",
+    "--standby-count",
+    "--standby-memory",
+    "--method",
+    "--timeout",
+)
+
+
+def split_words(line: str) -> List[str]:
+    try:
+        return shlex.split(line)
+    except ValueError:
+        # unbalanced quote in the word being completed
+        return line.split()
+
+
+def request_words(shell: str, environ: Mapping[str, str]) -> Tuple[List[str], str]:
+    """Words before the one being completed (without program name) and that word."""
+    if shell == "bash":
+        words = split_words(environ.get("COMP_WORDS", ""))
+        cword = int(environ.get("COMP_CWORD", "0") or 0)
+        return words[1:cword], words[cword] if cword < len(words) else ""
+
+    line = environ.get("_TYPER_COMPLETE_ARGS", "")
+    words = split_words(line)[1:]
+    if shell in ("powershell", "pwsh"):
+        incomplete = environ.get("_TYPER_COMPLETE_WORD_TO_COMPLETE", "")
+        if incomplete and words and words[-1] == incomplete:
+            words = words[:-1]
+        return words, incomplete
+    if words and not line.endswith(" "):
+        return words[:-1], words[-1]
+    return words, ""
+
+
+def candidates(
+    args: List[str], incomplete: str, index: Optional[Dict[str, Dict]]
+) -> Optional[List[str]]:
+    """
+    Project or service names completing `incomplete` after `args`, `None`
+    if something else is completed or index can not answer it.
+    """
+    if not args or args[0] not in PROJECT_COMMANDS or incomplete.startswith("-"):
+        return None
+
+    positional = []
+    words = iter(args[1:])
+    for word in words:
+        if word in VALUE_OPTIONS:
+            next(words, None)
+        elif not word.startswith("-"):
+            positional.append(word)
+
+    if args[-1] == "--service":
+        if args[0] != "start" or index is None:
+            return None
+        entry = index.get(positional[0]) if positional else None
+        if entry is None:
+            return []
+        if entry.get("fingerprint") != fingerprint(entry.get("compose")):
+            return None  # compose file changed since index was written
+        names = entry.get("services") or []
+    elif args[-1] in VALUE_OPTIONS or positional:
+        return None
+    elif index is None:
+        return None
+    else:
+        names = list(index)
+
+    return [name for name in names if name.startswith(incomplete)]
+
+
+def escape_zsh(value: str) -> str:
+    return value.replace('"', '""').replace("'", "''").replace("$", "\\$").replace("`", "\\`")
+
+
+def complete(environ: Optional[Mapping[str, str]] = None) -> Optional[int]:
+    """
+    Answer shell completion request (made with `_DOCKSWAP_COMPLETE=complete_<shell>`)
+    from index and return exit code, `None` if it has to be answered by typer.
+    """
+    environ = os.environ if environ is None else environ
+    instruction = environ.get(COMPLETE_VAR, "")
+    if not instruction.startswith("complete_"):
+        return None
+    shell = instruction.split("_", 1)[1]
+    if shell not in ("bash", "zsh", "fish", "powershell", "pwsh"):
+        return None
+
+    args, incomplete = request_words(shell, environ)
+    names = candidates(args, incomplete, load_index())
+    if names is None:
+        return None
+
+    if shell == "bash":
+        output = "".join(name + "\n" for name in names)
+    elif shell == "zsh":
+        if not names:
+            output = "_files\n"
+        else:
+            output = "_arguments '*: :(({}))'\n".format(
+                "\n".join('"{}"'.format(escape_zsh(name)) for name in names)
+            )
+    elif shell == "fish":
+        if environ.get("_TYPER_COMPLETE_FISH_ACTION") == "is-args":
+            return 0 if names else 1
+        output = "".join(name + "\n" for name in names)
+    else:
+        output = "".join(name + "::: \n" for name in names)
+
+    sys.stdout.write(output)
+    return 0
@@ -0,0 +1,352 @@
+"""
+Resource-aware admission: before a project is started only as many other
+registered projects are stopped (least recently used first) as needed for it
+to fit, everything else keeps running.
+
+Footprint of a project is estimated from samples of its containers' usage
+(`docker stats --no-stream`) kept in ~/.dockswap/footprints.json. Samples are
+taken whenever a project is running while another project is admitted (one
+`docker stats` covers all running containers) and, after `up` started it, by a
+detached process once the project warmed up (`DOCKSWAP_FOOTPRINT_DELAY`
+seconds), so that start itself never waits for `docker stats`.
+Free capacity is read from /proc/meminfo and /proc/loadavg.
+"""
+import os
+import sys
+import json
+import time
+import subprocess
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .core import Composer, DockSwapRepo
+from .engine import Usage, get_engine, parse_size
+from .errors import DockSwapError
+from .fs import atomic_write, file_lock
+from .swap import group_by_project
+from .timing import History, percentile, phase
+
+# memory kept free on top of estimated footprint (`DOCKSWAP_FIT_RESERVE`)
+DEFAULT_MEMORY_RESERVE = "512m"
+SAMPLES_LIMIT = 20
+ESTIMATE_PERCENTILE = 90
+# seconds a started project is given to warm up before it is sampled
+DEFAULT_FOOTPRINT_DELAY = 30.0
+
+
+def format_memory(size: int) -> str:
+    return "{:.0f}MiB".format(size / 1024 ** 2)
+
+
+class Capacity(object):
+    """Free resources of the host."""
+
+    def __init__(self, memory_available: int, cpus: int, load: float):
+        self.memory_available = memory_available
+        self.cpus = cpus
+        self.load = load
+
+    @property
+    def cpu_free(self) -> float:
+        return max(0.0, self.cpus - self.load)
+
+    @classmethod
+    def read(
+        cls, meminfo_path: str = "/proc/meminfo", loadavg_path: str = "/proc/loadavg"
+    ) -> "Capacity":
+        try:
+            with open(meminfo_path, "r") as meminfo_file:
+                meminfo = dict(
+                    line.split(":", 1) for line in meminfo_file.read().splitlines() if ":" in line
+                )
+            with open(loadavg_path, "r") as loadavg_file:
+                load = float(loadavg_file.read().split()[0])
+        except (OSError, ValueError, IndexError) as error:
+            raise DockSwapError("Could not read free capacity of the host: {}".format(error))
+
+        available = meminfo.get("MemAvailable") or meminfo.get("MemFree", "0 kB")
+        return cls(parse_size(available.replace(" kB", "k")), os.cpu_count() or 1, load)
+
+
+class FootprintRepo(object):
+    """Last `SAMPLES_LIMIT` usage samples of every project."""
+
+    FILE_NAME = "footprints.json"
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path or DockSwapRepo.get_dockswap_folder() / self.FILE_NAME
+        self.lock_path = self.path.with_name(self.path.name + ".lock")
+
+    def load(self) -> Dict[str, List[Dict[str, Any]]]:
+        try:
+            with open(self.path, "r") as footprints_file:
+                return json.load(footprints_file)
+        except (OSError, ValueError):
+            return {}
+
+    def record(self, usage: Dict[str, Usage]):
+        """Add a sample of every project in `usage` (keyed by project name)."""
+        if not usage:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with file_lock(self.lock_path):
+            footprints = self.load()
+            now = time.time()
+            for project_name, sample in usage.items():
+                samples = footprints.setdefault(project_name, [])
+                samples.append({"time": now, "memory": sample.memory, "cpu": sample.cpu})
+                footprints[project_name] = samples[-SAMPLES_LIMIT:]
+            atomic_write(self.path, json.dumps(footprints))
+
+    def estimate(self, project_name: str) -> Optional[Usage]:
+        """High percentile of samples of project, `None` if it was never sampled."""
+        samples = self.load().get(project_name)
+        if not samples:
+            return None
+        return Usage(
+            int(percentile([s["memory"] for s in samples], ESTIMATE_PERCENTILE)),
+            percentile([s["cpu"] for s in samples], ESTIMATE_PERCENTILE),
+        )
+
+
+def last_used(records: List[Dict[str, Any]]) -> Dict[str, float]:
+    """Time of the last successful start of every project in history `records`."""
+    used: Dict[str, float] = {}
+    for record in records:
+        if record.get("command") == "start" and record.get("ok") and record.get("project"):
+            used[record["project"]] = max(used.get(record["project"], 0), record.get("time", 0))
+    return used
+
+
+class AdmissionPlan(object):
+    def __init__(
+        self,
+        composer: Composer,
+        estimate: Optional[Usage],
+        capacity: Capacity,
+        evict: List[Composer],
+        shortfall: Usage,
+    ):
+        self.composer = composer
+        self.estimate = estimate
+        self.capacity = capacity
+        self.evict = evict
+        # what is still missing after eviction, nothing more can be stopped
+        self.shortfall = shortfall
+
+    def describe(self) -> List[str]:
+        lines = [
+            "free: {} memory, {:.1f} of {} CPUs".format(
+                format_memory(self.capacity.memory_available),
+                self.capacity.cpu_free,
+                self.capacity.cpus,
+            ),
+            'project "{}" needs: {}'.format(
+                self.composer.project_name,
+                "{} memory, {:.1f} CPUs".format(
+                    format_memory(self.estimate.memory), self.estimate.cpu
+                )
+                if self.estimate
+                else "unknown (never sampled)",
+            ),
+        ]
+        if self.evict:
+            lines.append("stop: {}".format(", ".join(c.project_name for c in self.evict)))
+        else:
+            lines.append("nothing to stop")
+        if self.shortfall.memory or self.shortfall.cpu:
+            lines.append(
+                "still short of {} memory, {:.1f} CPUs".format(
+                    format_memory(self.shortfall.memory), self.shortfall.cpu
+                )
+            )
+        return lines
+
+
+def plan_admission(
+    composer: Composer,
+    running: "OrderedDict[str, Usage]",
+    registered: Dict[str, Composer],
+    capacity: Capacity,
+    estimate: Optional[Usage],
+    used: Optional[Dict[str, float]] = None,
+    reserve: int = 0,
+) -> AdmissionPlan:
+    """
+    Choose registered projects to stop so that `estimate` of `composer` fits
+    into `capacity` keeping `reserve` bytes of memory free. `running` is usage
+    of running projects by compose project name, projects are stopped from
+    least recently `used` one and only while they free what is missing.
+    """
+    current = running.get(composer.compose_project_name, Usage())
+    needed = estimate or Usage()
+    missing_memory = (
+        max(0, needed.memory - current.memory) + reserve - capacity.memory_available
+    )
+    missing_cpu = max(0.0, needed.cpu - current.cpu) - capacity.cpu_free
+
+    used = used or {}
+    candidates = sorted(
+        (
+            registered[project]
+            for project in running
+            if project in registered and project != composer.compose_project_name
+        ),
+        key=lambda other: used.get(other.project_name, 0),
+    )
+    evict = []
+    for other in candidates:
+        if missing_memory <= 0 and missing_cpu <= 0:
+            break
+        usage = running[other.compose_project_name]
+        if (missing_memory > 0 and usage.memory) or (missing_cpu > 0 and usage.cpu):
+            evict.append(other)
+            missing_memory -= usage.memory
+            missing_cpu -= usage.cpu
+
+    shortfall = Usage(max(0, missing_memory), max(0.0, missing_cpu))
+    return AdmissionPlan(composer, estimate, capacity, evict, shortfall)
+
+
+def project_usage(engine, projects: Optional[List[str]] = None) -> "OrderedDict[str, Usage]":
+    """Usage of running containers summed per compose project (only of `projects` if given)."""
+    with phase("list"):
+        containers = engine.list_containers()
+    groups = group_by_project([c for c in containers if c.project])
+    if projects is not None:
+        groups = OrderedDict((p, groups[p]) for p in groups if p in projects)
+
+    ids = [c.id for containers in groups.values() for c in containers]
+    with phase("stats"):
+        usage = engine.resource_usage(ids) if ids else {}
+    return OrderedDict(
+        (
+            project,
+            sum((usage.get(c.id, Usage()) for c in containers), Usage()),
+        )
+        for project, containers in groups.items()
+    )
+
+
+def memory_reserve() -> int:
+    return parse_size(os.environ.get("DOCKSWAP_FIT_RESERVE", DEFAULT_MEMORY_RESERVE))
+
+
+def admit(
+    composer: Composer,
+    repo: DockSwapRepo,
+    engine=None,
+    footprints: Optional[FootprintRepo] = None,
+    capacity: Optional[Capacity] = None,
+    history: Optional[History] = None,
+    dry: bool = False,
+) -> AdmissionPlan:
+    """
+    Make room for `composer` stopping least recently used registered projects
+    (see `plan_admission`), unregistered containers are left alone.
+    Usage of running registered projects is recorded as their samples.
+    """
+    engine = engine or get_engine()
+    footprints = footprints or FootprintRepo()
+    history = history or History()
+
+    registered = {other.compose_project_name: other for other in repo.get_all()}
+    running = project_usage(engine, list(registered))
+    capacity = capacity or Capacity.read()
+    plan = plan_admission(
+        composer,
+        running,
+        registered,
+        capacity,
+        footprints.estimate(composer.project_name),
+        last_used(history.records()),
+        memory_reserve(),
+    )
+    if dry:
+        return plan
+
+    try:
+        footprints.record(
+            {registered[project].project_name: usage for project, usage in running.items()}
+        )
+    except OSError:
+        # samples are only a hint, they must not keep the project from starting
+        pass
+    for other in plan.evict:
+        other.stop()
+    return plan
+
+
+def record_footprint(
+    composer: Composer, engine=None, footprints: Optional[FootprintRepo] = None
+):
+    """Record a sample of `composer` usage."""
+    record_footprints([composer], engine, footprints)
+
+
+def record_footprints(
+    composers: List[Composer], engine=None, footprints: Optional[FootprintRepo] = None
+):
+    """Record samples of usage of `composers` (one `docker stats` for all)."""
+    record_usage(
+        {composer.compose_project_name: composer.project_name for composer in composers},
+        engine,
+        footprints,
+    )
+
+
+def record_usage(
+    projects: Dict[str, str], engine=None, footprints: Optional[FootprintRepo] = None
+):
+    """Record samples of running `projects` (names by compose project name)."""
+    engine = engine or get_engine()
+    footprints = footprints or FootprintRepo()
+    usage = project_usage(engine, list(projects))
+    if usage:
+        footprints.record({projects[project]: sample for project, sample in usage.items()})
+
+
+def footprint_delay() -> float:
+    try:
+        return float(os.environ.get("DOCKSWAP_FOOTPRINT_DELAY", DEFAULT_FOOTPRINT_DELAY))
+    except ValueError:
+        return DEFAULT_FOOTPRINT_DELAY
+
+
+def schedule_footprints(composers: List[Composer]):
+    """
+    Sample usage of `composers` just brought up by `up` in a detached process
+    once they warmed up, start does not wait for it. The sample is only a hint
+    (running projects are sampled by `admit` too), so failures are ignored.
+    """
+    args = [sys.executable, "-m", __name__, str(footprint_delay())]
+    args += [
+        "{}={}".format(composer.compose_project_name, composer.project_name)
+        for composer in composers
+    ]
+    try:
+        subprocess.Popen(
+            args,
+            start_new_session=True,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+    except OSError:
+        pass
+
+
+def sample_later(
+    delay: float, projects: Dict[str, str], engine=None, footprints: Optional[FootprintRepo] = None
+):
+    """Record samples of `projects` (see `record_usage`) after `delay` seconds."""
+    time.sleep(delay)
+    try:
+        record_usage(projects, engine, footprints)
+    except (DockSwapError, OSError):
+        pass
+
+
+if __name__ == "__main__":
+    sample_later(float(sys.argv[1]), dict(arg.split("=", 1) for arg in sys.argv[2:]))
@@ -0,0 +1,36 @@
+"""
+Index of registered projects and services of their compose files used by shell
+completion (see completion.py), kept next to the storage file and updated by
+`DockSwapRepo.update_completion_index` (`write_completion_index` regenerates it).
+
+Completion reads it before anything else is imported, so only standard
+library modules that are cheap to import are used here.
+"""
+import os
+import json
+from typing import Dict, List, Optional
+
+INDEX_SUFFIX = ".completion"
+
+
+def index_path() -> str:
+    file_name = os.environ.get("DOCKSWAP_STORAGE_FILE_NAME", "storage.json")
+    return os.path.join(os.path.expanduser("~"), ".dockswap", file_name + INDEX_SUFFIX)
+
+
+def fingerprint(path: Optional[str]) -> Optional[List[int]]:
+    """Same as `compose.file_fingerprint`, which is not imported to keep this module light."""
+    try:
+        stat = os.stat(path) if path else None
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size] if stat else None
+
+
+def load_index(path: Optional[str] = None) -> Optional[Dict[str, Dict]]:
+    """Index entries by project name, `None` if there is no (readable) index."""
+    try:
+        with open(path or index_path(), "r") as index_file:
+            return {entry["name"]: entry for entry in json.load(index_file)["projects"]}
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
@@ -0,0 +1,414 @@
+import os
+import re
+import json
+import hashlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .errors import DockSwapError
+from .fs import atomic_write
+
+PROJECT_NAME_ENV = "COMPOSE_PROJECT_NAME"
+
+
+def read_env_file(path: Optional[str]) -> Dict[str, str]:
+    """
+    Read KEY=VALUE pairs from env file at `path` the way docker-compose does:
+    blank lines and comments are skipped, surrounding quotes are stripped.
+    Missing (or not specified) file gives empty dict.
+    """
+    if not path or not os.path.isfile(path):
+        return {}
+
+    env = {}
+    with open(path, "r") as env_file:
+        for line in env_file:
+            line = line.strip()
+            if not line or line.startswith("#") or "=" not in line:
+                continue
+            if line.startswith("export "):
+                line = line[len("export "):]
+            key, value = line.split("=", 1)
+            value = value.strip()
+            if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"":
+                value = value[1:-1]
+            env[key.strip()] = value
+    return env
+
+
+def normalize_project_name(name: str) -> str:
+    return re.sub(r"[^-_a-z0-9]", "", name.lower())
+
+
+def compose_project_name(
+    docker_compose_path: str, env_path: Optional[str] = None
+) -> str:
+    """
+    Name docker-compose gives to project of file at `docker_compose_path`.
+    `COMPOSE_PROJECT_NAME` is taken from environment, then from env file
+    (or `.env` next to compose file) and falls back to name of the directory
+    compose file is located in.
+    """
+    compose_dir = Path(os.path.abspath(docker_compose_path)).parent
+
+    name = os.environ.get(PROJECT_NAME_ENV)
+    if not name:
+        env = read_env_file(env_path or str(compose_dir / ".env"))
+        name = env.get(PROJECT_NAME_ENV)
+
+    return normalize_project_name(name or compose_dir.name)
+
+
+INTERPOLATION_RE = re.compile(
+    r"\$(?:(?P<escaped>\$)"
+    r"|(?P<named>[_a-zA-Z][_a-zA-Z0-9]*)"
+    r"|{(?P<braced>[_a-zA-Z][_a-zA-Z0-9]*)(?:(?P<op>:?[-?])(?P<arg>[^}]*))?})"
+)
+
+
+def interpolate(value: Any, env: Dict[str, str]) -> Any:
+    """
+    Substitute variables in every string of `value` (recursively) the way
+    docker-compose does: $VAR, ${VAR}, ${VAR:-default}, ${VAR-default},
+    ${VAR:?error}, ${VAR?error} and $$ for literal $.
+    """
+    if isinstance(value, dict):
+        return {key: interpolate(item, env) for key, item in value.items()}
+    if isinstance(value, list):
+        return [interpolate(item, env) for item in value]
+    if not isinstance(value, str):
+        return value
+
+    def substitute(match):
+        if match.group("escaped"):
+            return "$"
+
+        name = match.group("named") or match.group("braced")
+        op, arg = match.group("op"), match.group("arg") or ""
+        variable = env.get(name)
+        missing = variable is None or (op is not None and op.startswith(":") and not variable)
+
+        if op and op.endswith("-") and missing:
+            return arg
+        if op and op.endswith("?") and missing:
+            raise DockSwapError(
+                'Variable "{}" is required: {}'.format(name, arg or "not set")
+            )
+        return variable or ""
+
+    return INTERPOLATION_RE.sub(substitute, value)
+
+
+def referenced_variables(content: str) -> List[str]:
+    """Names of variables interpolated anywhere in compose file `content`."""
+    return sorted(
+        {
+            match.group("named") or match.group("braced")
+            for match in INTERPOLATION_RE.finditer(content)
+            if not match.group("escaped")
+        }
+    )
+
+
+def environment_hash(variables: List[str]) -> str:
+    """Hash of values (or absence) of `variables` in environment of dockswap."""
+    values = {name: os.environ.get(name) for name in variables}
+    return content_hash(json.dumps(values, sort_keys=True).encode())
+
+
+def parse_compose_content(content: str, path: str) -> Dict[str, Any]:
+    """Parse content of compose file at `path` as JSON or YAML (judging by suffix)."""
+    try:
+        if path.endswith(".json"):
+            data = json.loads(content)
+        else:
+            import yaml
+
+            data = yaml.safe_load(content)
+    except ImportError:
+        raise DockSwapError(
+            "PyYAML is required to read {}. Install it with `pip install PyYAML`".format(path)
+        )
+    except Exception as error:
+        # json.JSONDecodeError or yaml.YAMLError (PyYAML is imported lazily)
+        raise DockSwapError("Could not parse {}: {}".format(path, error))
+
+    if not isinstance(data, dict):
+        raise DockSwapError("{} is not a valid docker-compose file".format(path))
+    return data
+
+
+class ServiceSpec(object):
+    def __init__(
+        self,
+        name: str,
+        image: Optional[str] = None,
+        build: Optional[str] = None,
+        ports: Optional[List[str]] = None,
+        depends_on: Optional[List[str]] = None,
+        config_hash: Optional[str] = None,
+    ):
+        self.name = name
+        self.image = image
+        self.build = build
+        self.ports = ports or []
+        self.depends_on = depends_on or []
+        # hash of interpolated service configuration, tells if service changed
+        self.config_hash = config_hash
+
+    @classmethod
+    def from_config(cls, name: str, config: Dict[str, Any], base_dir: str) -> "ServiceSpec":
+        build = config.get("build")
+        if isinstance(build, dict):
+            build = build.get("context", ".")
+        if build is not None:
+            build = os.path.normpath(os.path.join(base_dir, str(build)))
+
+        depends_on = config.get("depends_on") or []
+        if isinstance(depends_on, dict):
+            depends_on = list(depends_on)
+
+        return cls(
+            name=name,
+            image=config.get("image"),
+            build=build,
+            ports=[
+                str(port if not isinstance(port, dict) else port.get("published", ""))
+                for port in config.get("ports") or []
+            ],
+            depends_on=[str(dependency) for dependency in depends_on],
+            config_hash=content_hash(json.dumps(config, sort_keys=True, default=str).encode()),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "image": self.image,
+            "build": self.build,
+            "ports": self.ports,
+            "depends_on": self.depends_on,
+            "config_hash": self.config_hash,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ServiceSpec":
+        return cls(**data)
+
+
+class ComposeSpec(object):
+    """What dockswap needs to know about a parsed compose file."""
+
+    def __init__(
+        self,
+        services: Dict[str, ServiceSpec],
+        volumes: Optional[List[str]] = None,
+        volume_names: Optional[Dict[str, str]] = None,
+    ):
+        self.services = services
+        self.volumes = volumes or []
+        # volumes whose docker name is not derived from project name (`name`, `external`)
+        self.volume_names = volume_names or {}
+
+    def volume_name(self, volume: str, project: str) -> str:
+        """Name of docker volume docker-compose uses for named `volume` of `project`."""
+        return self.volume_names.get(volume) or "{}_{}".format(project, volume)
+
+    @property
+    def service_names(self) -> List[str]:
+        return list(self.services)
+
+    @property
+    def images(self) -> List[str]:
+        return [s.image for s in self.services.values() if s.image]
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], base_dir: str) -> "ComposeSpec":
+        services = config.get("services")
+        if services is None:
+            # version 1 compose files have services at top level
+            services = {
+                key: value
+                for key, value in config.items()
+                if key not in ("version", "volumes", "networks") and isinstance(value, dict)
+            }
+        return cls(
+            services=OrderedDict(
+                (name, ServiceSpec.from_config(name, service or {}, base_dir))
+                for name, service in services.items()
+            ),
+            volumes=list(config.get("volumes") or {}),
+            volume_names={
+                volume: name
+                for volume, name in (
+                    (volume, explicit_volume_name(volume, volume_config))
+                    for volume, volume_config in (config.get("volumes") or {}).items()
+                )
+                if name
+            },
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "services": [service.to_dict() for service in self.services.values()],
+            "volumes": self.volumes,
+            "volume_names": self.volume_names,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ComposeSpec":
+        services = [ServiceSpec.from_dict(service) for service in data["services"]]
+        return cls(
+            services=OrderedDict((service.name, service) for service in services),
+            volumes=data.get("volumes", []),
+            volume_names=data.get("volume_names", {}),
+        )
+
+
+def explicit_volume_name(volume: str, config: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Docker name of `volume` given in compose file, `None` if it is derived from project."""
+    config = config or {}
+    external = config.get("external")
+    if isinstance(external, dict) and external.get("name"):
+        return str(external["name"])
+    if config.get("name"):
+        return str(config["name"])
+    return volume if external else None
+
+
+def file_fingerprint(path: Optional[str]) -> Optional[List[int]]:
+    """Cheap fingerprint (mtime and size) of file at `path`, `None` if it is missing."""
+    if not path:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def content_hash(*contents: bytes) -> str:
+    digest = hashlib.sha256()
+    for content in contents:
+        digest.update(content)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def default_cache_dir() -> Path:
+    from .core import DockSwapRepo
+
+    return DockSwapRepo.get_dockswap_folder() / "cache" / "compose"
+
+
+class ComposeCache(object):
+    """
+    Cache of parsed compose files kept under ~/.dockswap/cache/compose,
+    one entry per compose file. Entry is valid while mtime and size of compose
+    (and env) file are the same and variables referenced by compose file have
+    the same values in environment (it overrides env file). If files changed,
+    content is hashed and the file is parsed again only if content actually
+    changed. Entries written by other `VERSION` of the cache are ignored.
+    """
+
+    VERSION = 4
+
+    def __init__(self, cache_dir: Optional[Path] = None):
+        self.cache_dir = Path(cache_dir) if cache_dir else default_cache_dir()
+        # memory key -> (referenced variables, their environment hash, spec)
+        self.memory: Dict[str, Tuple[List[str], str, ComposeSpec]] = {}
+
+    def entry_path(self, path: str, env_path: Optional[str]) -> Path:
+        key = hashlib.sha1("{}\0{}".format(path, env_path or "").encode()).hexdigest()
+        return self.cache_dir / "{}.json".format(key)
+
+    def read_entry(self, entry_path: Path) -> Optional[Dict[str, Any]]:
+        try:
+            with open(entry_path, "r") as entry_file:
+                return json.load(entry_file)
+        except (OSError, ValueError):
+            return None
+
+    def write_entry(self, entry_path: Path, entry: Dict[str, Any]):
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            atomic_write(entry_path, json.dumps(entry))
+        except OSError:
+            pass  # cache is an optimization only
+
+    def get(self, path: str, env_path: Optional[str] = None) -> ComposeSpec:
+        """Get spec of compose file at `path` interpolated with `env_path` file."""
+        path = os.path.abspath(path)
+        # docker-compose reads .env next to compose file if env file is not specified
+        env_path = os.path.abspath(env_path or os.path.join(os.path.dirname(path), ".env"))
+        fingerprint = [file_fingerprint(path), file_fingerprint(env_path)]
+        if fingerprint[0] is None:
+            raise DockSwapError("{} does not exist".format(path))
+
+        entry_path = self.entry_path(path, env_path)
+        memory_key = "{}:{}".format(entry_path, fingerprint)
+        if memory_key in self.memory:
+            variables, environment, spec = self.memory[memory_key]
+            if environment_hash(variables) == environment:
+                return spec
+
+        entry = self.read_entry(entry_path)
+        if entry and entry.get("version") != self.VERSION:
+            entry = None
+        if (
+            entry
+            and entry["fingerprint"] == fingerprint
+            and entry["environment"] == environment_hash(entry["variables"])
+        ):
+            variables, environment = entry["variables"], entry["environment"]
+            spec = ComposeSpec.from_dict(entry["spec"])
+        else:
+            with open(path, "rb") as compose_file:
+                content = compose_file.read()
+            env_content = b""
+            if fingerprint[1] is not None:
+                with open(env_path, "rb") as env_file:
+                    env_content = env_file.read()
+
+            digest = content_hash(content, env_content)
+            variables = referenced_variables(content.decode())
+            environment = environment_hash(variables)
+            if entry and entry["hash"] == digest and entry["environment"] == environment:
+                spec = ComposeSpec.from_dict(entry["spec"])
+            else:
+                spec = self.parse(path, content.decode(), env_path)
+
+            self.write_entry(
+                entry_path,
+                {
+                    "version": self.VERSION,
+                    "path": path,
+                    "env_path": env_path,
+                    "fingerprint": fingerprint,
+                    "hash": digest,
+                    "variables": variables,
+                    "environment": environment,
+                    "spec": spec.to_dict(),
+                },
+            )
+
+        self.memory[memory_key] = (variables, environment, spec)
+        return spec
+
+    @staticmethod
+    def parse(path: str, content: str, env_path: str) -> ComposeSpec:
+        env = read_env_file(env_path)
+        env.update(os.environ)
+        config = interpolate(parse_compose_content(content, path), env)
+        return ComposeSpec.from_config(config, os.path.dirname(path))
+
+
+_cache: Optional[ComposeCache] = None
+
+
+def get_compose_spec(path: str, env_path: Optional[str] = None) -> ComposeSpec:
+    """Get (cached) spec of compose file at `path`."""
+    global _cache
+    if _cache is None:
+        _cache = ComposeCache()
+    return _cache.get(path, env_path)
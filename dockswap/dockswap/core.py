@@ -1,17 +1,23 @@
 import os
 import json
-import subprocess
 from typing import Dict, Any, Optional, List, Union
 from pathlib import Path
 from enum import Enum
 
+from .completion_index import INDEX_SUFFIX, load_index
+from .compose import ComposeSpec, compose_project_name, file_fingerprint, get_compose_spec
 from .errors import DockSwapError
+from .fs import atomic_write
+from .timing import phase
 
 
 class Composer(object):
     class Action(Enum):
         START = "up"
         STOP = "down"
+        PULL = "pull"
+        CREATE = "up --no-start"
+        UPDATE = "up --no-deps"
 
     def __init__(
         self,
@@ -33,6 +39,8 @@ class Composer(object):
         self.env_path = str(env_path) if env_path else None
         self.binary_name = docker_compose_cli_env if not binary_name else binary_name
         self.project_name = project_name
+        # print output of docker-compose (it is logged anyway if log is enabled)
+        self.echo = True
 
     def start(self, dry: Optional[bool] = False, only: Optional[List[str]] = None):
         """
@@ -47,9 +55,8 @@ class Composer(object):
         if dry:
             return command
 
-        result = subprocess.run(command.split())
-        if result.returncode != 0:
-            self.fail(command, result.returncode)
+        self.forget_start_config()
+        self.execute(command, "compose_up")
 
     def stop(self, remove: Optional[bool] = False, dry: Optional[bool] = False):
         """
@@ -61,14 +68,78 @@ class Composer(object):
         if dry:
             return command
 
-        result = subprocess.run(command.split())
-        if result.returncode != 0:
-            self.fail(command, result.returncode)
+        self.execute(command, "compose_down")
 
-    def fail(self, command: str, returncode: int):
-        raise DockSwapError(
-            'Command "{}" exited with status code {}'.format(command, returncode)
-        )
+    def pull(self, dry: Optional[bool] = False, only: Optional[List[str]] = None):
+        """
+        Pull images of this composer (or of `only` services), so that
+        starting containers later does not wait for network.
+        If `dry` is `True`, then just return command to be executed.
+        """
+        command = self.construct_command(Composer.Action.PULL, only)
+
+        if dry:
+            return command
+
+        self.execute(command, "compose_pull")
+
+    def create(self, dry: Optional[bool] = False, only: Optional[List[str]] = None):
+        """
+        Create (but do not start) containers of this composer.
+        If `dry` is `True`, then just return command to be executed.
+        """
+        command = self.construct_command(Composer.Action.CREATE, only)
+
+        if dry:
+            return command
+
+        self.execute(command, "compose_create")
+
+    def update(self, services: List[str], dry: Optional[bool] = False):
+        """
+        Recreate (or start) only `services` of this composer, without touching
+        services they depend on, which must be running already.
+        If `dry` is `True`, then just return command to be executed.
+        """
+        command = self.construct_command(Composer.Action.UPDATE, services)
+
+        if dry:
+            return command
+
+        self.forget_start_config()
+        self.execute(command, "compose_update")
+
+    def forget_start_config(self):
+        """
+        Drop configuration recorded by fast path of `start` (see fastpath.py)
+        before running `up`, which may change what runs. Fast path records it
+        again once its own `up` succeeds.
+        """
+        from .fastpath import ConfigRepo
+
+        ConfigRepo().forget(self.project_name)
+
+    def execute(self, command: str, phase_name: str = "compose"):
+        """
+        Run `command` printing its output line by line prefixed with
+        project name and phase (e.g. "foo/up"), see `output.run_checked`.
+        Deadline of command is the one of `phase_name` (see execution.py).
+        """
+        from .output import run_checked
+
+        prefix = "{}/{}".format(self.project_name, phase_name.split("_", 1)[-1])
+        with phase(phase_name):
+            run_checked(command.split(), prefix=prefix, phase=phase_name, echo=self.echo)
+
+    @property
+    def spec(self) -> ComposeSpec:
+        """Parsed (and cached) compose file of this composer."""
+        return get_compose_spec(self.docker_compose_path, self.env_path)
+
+    @property
+    def compose_project_name(self) -> str:
+        """Project name docker-compose uses for containers of this composer."""
+        return compose_project_name(self.docker_compose_path, self.env_path)
 
     def get_env_option(self):
         """Get --env-file option if self.env_path is specified"""
@@ -90,9 +161,11 @@ class Composer(object):
         that is to be used when starting specific
         containers defined in a service.
         """
-        env_part = self.get_env_option() if action == Composer.Action.START else ""
+        env_part = self.get_env_option() if action != Composer.Action.STOP else ""
         file_part = self.get_file_option()
-        detached_part = "-d" if action == Composer.Action.START else ""
+        detached_part = (
+            "-d" if action in (Composer.Action.START, Composer.Action.UPDATE) else ""
+        )
         only_part = " ".join(_only.strip() for _only in (only or []))
         command = "{dc_bin} {env_part} {file_part} {action} {detached_part} {only_part}".format(
             dc_bin=self.binary_name,
@@ -141,38 +214,151 @@ class DockSwapRepo(object):
     DOCKSWAP_DIR = ".dockswap"
     STORAGE_PATH = os.environ.get("DOCKSWAP_STORAGE_FILE_NAME", "storage.json")
 
+    @classmethod
+    def get_dockswap_folder(cls) -> Path:
+        return Path.home() / Path(cls.DOCKSWAP_DIR)
+
+    @classmethod
+    def get_storage_path(cls) -> Path:
+        return cls.get_dockswap_folder() / Path(cls.STORAGE_PATH)
+
     @classmethod
     def prune(cls):
-        storage_path = Path.home() / Path(cls.DOCKSWAP_DIR) / Path(cls.STORAGE_PATH)
-        storage_path.unlink()
+        cls.get_storage_path().unlink()
+        cls.drop_completion_index()
 
     def __init__(self):
-        self.dockswap_folder = Path.home() / Path(self.DOCKSWAP_DIR)
+        self.dockswap_folder = self.get_dockswap_folder()
         self.dockswap_folder.mkdir(exist_ok=True)
-        self.storage_path = self.dockswap_folder / Path(self.STORAGE_PATH)
-        self.storage_path.touch()
-
+        self.storage_path = self.get_storage_path()
         self._loaded_data: Optional[Dict[str, Any]] = None
 
+        self.setup()
+
+    def setup(self):
+        """Prepare underlying storage. Called once on initialization."""
+        self.storage_path.touch()
+
     @property
     def loaded_data(self) -> List[Dict[str, str]]:
         """Lazy loaded raw composers data"""
         if not self._loaded_data:
             with open(self.storage_path, "r") as storage_file:
-                try:
-                    data = json.load(storage_file) or []
-                except json.JSONDecodeError:
-                    data = []
-
-                self._loaded_data = data
+                self._loaded_data = self.decode(storage_file.read())
 
             return self._loaded_data
 
         return self._loaded_data
 
+    def decode(self, content: str) -> List[Dict[str, str]]:
+        """
+        Decode storage file content. Empty file means there are no composers,
+        but garbage in file is an error: silently treating it as empty would
+        wipe all registrations on next write.
+        """
+        if not content.strip():
+            return []
+
+        try:
+            return json.loads(content) or []
+        except json.JSONDecodeError:
+            raise DockSwapError(
+                "Storage file {} is corrupted. Fix or remove it manually".format(
+                    self.storage_path
+                )
+            )
+
     def commit(self, data: List[Dict[str, str]]):
-        with open(self.storage_path, "w") as storage_file:
-            json.dump(data, storage_file)
+        """Replace all composers with `data`, completion index is regenerated."""
+        self.store(data)
+        self.write_completion_index(data)
+
+    def store(self, data: List[Dict[str, str]]):
+        """Write `data` to storage file, completion index is left to the caller."""
+        atomic_write(self.storage_path, json.dumps(data))
+        self._loaded_data = data
+
+    @classmethod
+    def get_completion_index_path(cls) -> Path:
+        storage_path = cls.get_storage_path()
+        return storage_path.with_name(storage_path.name + INDEX_SUFFIX)
+
+    @classmethod
+    def drop_completion_index(cls):
+        """Remove completion index, e.g. when all composers are pruned."""
+        try:
+            cls.get_completion_index_path().unlink()
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def completion_entry(
+        composer_data: Dict[str, str], previous: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Completion index entry of composer. Services are taken from `previous`
+        entry while compose file is unchanged, so it is not parsed again.
+        """
+        name, compose_path = composer_data["project_name"], composer_data["dc_path"]
+        fingerprint = file_fingerprint(compose_path)
+        if (
+            previous
+            and fingerprint
+            and previous.get("compose") == compose_path
+            and previous.get("fingerprint") == fingerprint
+        ):
+            return previous
+
+        try:
+            services = get_compose_spec(compose_path, composer_data.get("env_path")).service_names
+        except (DockSwapError, OSError, ValueError):
+            services = []
+        return {
+            "name": name,
+            "compose": compose_path,
+            "fingerprint": fingerprint,
+            "services": services,
+        }
+
+    def write_completion_index(self, data: List[Dict[str, str]]):
+        """
+        Regenerate index of project and service names used by shell completion
+        (see completion.py). Services are taken from the previous index while
+        compose file is unchanged, so compose files are not parsed on every write.
+        """
+        path = self.get_completion_index_path()
+        previous = load_index(str(path)) or {}
+        self.save_completion_index(
+            [
+                self.completion_entry(composer_data, previous.get(composer_data["project_name"]))
+                for composer_data in data
+            ]
+        )
+
+    def update_completion_index(
+        self, added: List[Dict[str, str]] = (), deleted: List[str] = ()
+    ):
+        """
+        Apply change of `added` and `deleted` composers to completion index
+        without looking at the other ones. Missing index is regenerated.
+        """
+        index = load_index(str(self.get_completion_index_path()))
+        if index is None:
+            self.write_completion_index(self.loaded_data)
+            return
+
+        for name in deleted:
+            index.pop(name, None)
+        for composer_data in added:
+            entry = index.pop(composer_data["project_name"], None)
+            index[composer_data["project_name"]] = self.completion_entry(composer_data, entry)
+        self.save_completion_index([*index.values()])
+
+    def save_completion_index(self, entries: List[Dict[str, Any]]):
+        try:
+            atomic_write(self.get_completion_index_path(), json.dumps({"projects": entries}))
+        except OSError:
+            pass  # completion falls back to loading storage
 
     def get_all(self) -> List[Composer]:
         composers = []
@@ -184,8 +370,8 @@ class DockSwapRepo(object):
         return composers
 
     def persist(self, composer: Composer):
-        data = self.loaded_data + [composer.to_dict()]
-        self.commit(data)
+        self.store(self.loaded_data + [composer.to_dict()])
+        self.update_completion_index(added=[composer.to_dict()])
 
     def persist_all(self, composers: List[Composer], rewrite: bool = False):
         composers_data = [c.to_dict() for c in composers]
@@ -193,7 +379,8 @@ class DockSwapRepo(object):
         if rewrite:
             self.commit(composers_data)
         else:
-            self.commit(self.loaded_data + composers_data)
+            self.store(self.loaded_data + composers_data)
+            self.update_completion_index(added=composers_data)
 
     def get(self, project_name: str, silent_not_found=False) -> Composer:
         composers = self.get_all()
@@ -210,8 +397,14 @@ class DockSwapRepo(object):
         )
 
     def delete(self, project_name: str) -> bool:
+        return bool(self.delete_many([project_name]))
+
+    def delete_many(self, project_names: List[str]) -> List[str]:
+        """Delete composers of all `project_names` at once, return names that were deleted."""
+        names = set(project_names)
         composers = self.get_all()
-        nice_composers = [c for c in composers if c.project_name != project_name]
-        deleted = len(composers) != len(nice_composers)
-        self.persist_all(nice_composers, rewrite=True)
+        deleted = [c.project_name for c in composers if c.project_name in names]
+        if deleted:
+            self.store([c.to_dict() for c in composers if c.project_name not in names])
+            self.update_completion_index(deleted=deleted)
         return deleted
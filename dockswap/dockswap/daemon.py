@@ -0,0 +1,380 @@
+"""
+`dockswapd`: resident process serving `start`, `stop`, `list` and `stopall`
+for thin client (see dockswap/client.py) over unix socket.
+
+Daemon imports everything once, keeps registered composers in memory
+(reloaded only when storage files change) and keeps list of containers
+current from docker events stream, so most commands do not have to list
+containers at all. Requests are served one at a time, output of a command
+is sent to client line by line while it runs. With
+`DOCKSWAP_PREFETCH_INTERVAL` set images are also pulled periodically
+in background (see prefetch.py).
+"""
+import io
+import os
+import sys
+import json
+import time
+import signal
+import threading
+import traceback
+import socketserver
+from collections import OrderedDict
+from contextlib import redirect_stderr, redirect_stdout
+from typing import Any, Callable, Dict, List, Optional
+
+from .compose import file_fingerprint
+from .engine import Container, Event, get_engine, set_default_engine
+from .errors import DockSwapError
+from ..client import DAEMON_COMMANDS, daemon_socket_path, relevant_env, send
+
+# container state after event, other events (create, rename...) need relisting
+EVENT_STATES = {
+    "start": "running",
+    "unpause": "running",
+    "pause": "paused",
+    "die": "exited",
+    "stop": "exited",
+}
+MAX_RETRY_DELAY = 30
+
+
+def prefetch_interval() -> float:
+    """Seconds between image prefetches (`DOCKSWAP_PREFETCH_INTERVAL`, 0 disables)."""
+    try:
+        return max(0.0, float(os.environ.get("DOCKSWAP_PREFETCH_INTERVAL", "0")))
+    except ValueError:
+        return 0.0
+
+
+class ContainerCache(object):
+    """
+    Containers known to daemon. Cache is used only while docker events are
+    being watched, otherwise containers are listed every time (or once
+    in `max_age` seconds, if it is given).
+    """
+
+    def __init__(self, engine, max_age: float = 0):
+        self.engine = engine
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.containers: Optional["OrderedDict[str, Container]"] = None
+        self.listed_at = 0.0
+        self.watching = False
+        # bumped on every change, so that listing racing with events is not cached
+        self.generation = 0
+
+    def list_containers(self, all: bool = False) -> List[Container]:
+        with self.lock:
+            containers, generation = self.containers, self.generation
+            fresh = containers is not None and (
+                self.watching or time.monotonic() - self.listed_at < self.max_age
+            )
+        if not fresh:
+            listed = self.engine.list_containers(all=True)
+            containers = OrderedDict((container.id, container) for container in listed)
+            with self.lock:
+                if (self.watching or self.max_age) and self.generation == generation:
+                    self.containers = containers
+                    self.listed_at = time.monotonic()
+        return [c for c in containers.values() if all or c.running]
+
+    def invalidate(self):
+        with self.lock:
+            self.containers = None
+            self.generation += 1
+
+    def set_watching(self, watching: bool):
+        with self.lock:
+            self.watching = watching
+            self.containers = None
+            self.generation += 1
+
+    def apply(self, event: Event):
+        with self.lock:
+            self.generation += 1
+            if self.containers is None:
+                return
+            container = self.containers.get(event.id)
+            if event.status == "destroy":
+                self.containers.pop(event.id, None)
+            elif container is None or event.status in ("create", "rename"):
+                self.containers = None
+            elif event.status in EVENT_STATES:
+                container.state = EVENT_STATES[event.status]
+
+    def update(self, ids: List[str], state: Optional[str]):
+        """Record result of daemon's own operation (`None` state means removed)."""
+        with self.lock:
+            if self.containers is None:
+                return
+            for container_id in ids:
+                if state is None:
+                    self.containers.pop(container_id, None)
+                elif container_id in self.containers:
+                    self.containers[container_id].state = state
+
+    def watch(self, stopped: threading.Event):
+        """Follow docker events until `stopped`, reconnecting with backoff."""
+        delay = 1
+        while not stopped.is_set():
+            try:
+                events = self.engine.events()
+            except DockSwapError:
+                stopped.wait(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+                continue
+
+            self.set_watching(True)
+            for event in events:
+                self.apply(event)
+                delay = 1
+            self.set_watching(False)
+            stopped.wait(delay)
+            delay = min(delay * 2, MAX_RETRY_DELAY)
+
+
+class CachedEngine(object):
+    """Engine listing containers from `cache` and keeping it up to date."""
+
+    def __init__(self, engine, cache: ContainerCache):
+        self.engine = engine
+        self.cache = cache
+        self.name = engine.name
+
+    def list_containers(self, all: bool = False) -> List[Container]:
+        return self.cache.list_containers(all=all)
+
+    def stop(self, ids: List[str], timeout: int):
+        stopped, failures = self.engine.stop(ids, timeout)
+        self.cache.update(stopped, "exited")
+        return stopped, failures
+
+    def remove(self, ids: List[str], force: bool = True):
+        removed, failures = self.engine.remove(ids, force)
+        self.cache.update(removed, None)
+        return removed, failures
+
+    def pause(self, ids: List[str]):
+        paused, failures = self.engine.pause(ids)
+        self.cache.update(paused, "paused")
+        return paused, failures
+
+    def unpause(self, ids: List[str]):
+        unpaused, failures = self.engine.unpause(ids)
+        self.cache.update(unpaused, "running")
+        return unpaused, failures
+
+    def __getattr__(self, name):
+        return getattr(self.engine, name)
+
+
+class LineWriter(io.TextIOBase):
+    """
+    Text stream passing every complete line written to it to `emit` as
+    `{name: line}` (e.g. `{"stdout": "Ready: web\\n"}`), rest is passed on `flush`.
+    """
+
+    def __init__(self, name: str, emit: Callable[[Dict[str, str]], None]):
+        self.name = name
+        self.emit = emit
+        self.pending = ""
+        self.lock = threading.Lock()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        with self.lock:
+            self.pending += text
+            *lines, self.pending = self.pending.split("\n")
+            for line in lines:
+                self.emit({self.name: line + "\n"})
+        return len(text)
+
+    def flush(self):
+        with self.lock:
+            if self.pending:
+                self.emit({self.name: self.pending})
+                self.pending = ""
+
+
+def storage_fingerprint(repo) -> List[Any]:
+    """Fingerprint of storage files of `repo` (database of SQLite repo is always read)."""
+    paths = [repo.storage_path, getattr(repo, "journal_path", None)]
+    return [file_fingerprint(str(path) if path else None) for path in paths]
+
+
+class Daemon(object):
+    def __init__(self, engine=None):
+        from .. import cli
+
+        self.cli = cli
+        self.cache = ContainerCache(engine or get_engine())
+        self.engine = CachedEngine(self.cache.engine, self.cache)
+        self.env = relevant_env()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.fingerprint: Optional[List[Any]] = None
+        self.server: Optional[socketserver.BaseServer] = None
+
+    def refresh_registry(self):
+        """Drop loaded composers if storage was changed by someone else."""
+        fingerprint = storage_fingerprint(self.cli.repo)
+        if fingerprint != self.fingerprint:
+            self.cli.repo._loaded_data = None
+            self.fingerprint = fingerprint
+
+    def handle(
+        self, request: Dict[str, Any], emit: Callable[[Dict[str, str]], None]
+    ) -> Dict[str, Any]:
+        """Serve `request`, passing output of command to `emit` as it is printed."""
+        command = request.get("command")
+        if command == "ping":
+            return {"exit_code": 0, "pid": os.getpid()}
+        if command == "shutdown":
+            self.stop_in_background()
+            return {"exit_code": 0}
+
+        args = request.get("args") or []
+        if not args or args[0] not in DAEMON_COMMANDS or request.get("env") != self.env:
+            return {"fallback": True}
+
+        with self.lock:
+            self.refresh_registry()
+            response = self.run(args, emit, bool(request.get("color")))
+            if args[0] in ("start", "stop") and "--dry" not in args:
+                # docker-compose changed containers behind daemon's back
+                self.cache.invalidate()
+            return response
+
+    def run(
+        self, args: List[str], emit: Callable[[Dict[str, str]], None], color: bool = False
+    ) -> Dict[str, Any]:
+        stdout, stderr = LineWriter("stdout", emit), LineWriter("stderr", emit)
+        exit_code = 0
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                self.cli.app(args=args, prog_name="dockswap", color=color)
+            except SystemExit as exit:
+                if isinstance(exit.code, int):
+                    exit_code = exit.code
+                else:
+                    exit_code = 0 if exit.code is None else 1
+            except Exception:
+                traceback.print_exc()
+                exit_code = 1
+            finally:
+                stdout.flush()
+                stderr.flush()
+        return {"exit_code": exit_code}
+
+    def serve(self, socket_path: Optional[str] = None):
+        """Serve requests on `socket_path` until shut down."""
+        socket_path = socket_path or daemon_socket_path()
+        if send({"command": "ping"}, socket_path) is not None:
+            raise DockSwapError("dockswap daemon is already running on {}".format(socket_path))
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)  # left by daemon that was killed
+        os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+
+        set_default_engine(self.engine)
+        watcher = threading.Thread(target=self.cache.watch, args=(self.stopped,), daemon=True)
+        watcher.start()
+        interval = prefetch_interval()
+        if interval:
+            threading.Thread(target=self.prefetch, args=(interval,), daemon=True).start()
+
+        # bind creates socket with mode masked by umask, so it is accessible to
+        # the owner only from the start (chmod after bind left a window open)
+        umask = os.umask(0o177)
+        try:
+            self.server = DaemonServer(socket_path, self)
+        finally:
+            os.umask(umask)
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *args: self.stop_in_background())
+        try:
+            self.server.serve_forever(poll_interval=0.2)
+        finally:
+            self.stopped.set()
+            self.server.server_close()
+            set_default_engine(None)
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+    def prefetch(self, interval: float):
+        """Pull images of registered composers every `interval` seconds."""
+        from .prefetch import prefetch
+
+        while not self.stopped.wait(interval):
+            with self.lock:
+                self.refresh_registry()
+                composers = self.cli.repo.get_all()
+            try:
+                prefetch(composers, engine=self.cache.engine)
+            except DockSwapError:
+                pass  # failed images are retried by the next run
+
+    def shutdown(self):
+        if self.server is not None:
+            self.server.shutdown()
+
+    def stop_in_background(self):
+        # shutdown blocks until serving loop exits, so it can not be called from it
+        threading.Thread(target=self.shutdown).start()
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.write_lock = threading.Lock()
+        self.disconnected = False
+
+    def send(self, message: Dict[str, Any]):
+        """Write `message` as one JSON line, client that went away is not written to anymore."""
+        with self.write_lock:
+            if self.disconnected:
+                return
+            try:
+                self.wfile.write(json.dumps(message).encode() + b"\n")
+                self.wfile.flush()
+            except OSError:
+                self.disconnected = True
+
+    def handle(self):
+        line = self.rfile.readline()
+        try:
+            request = json.loads(line.decode())
+        except ValueError:
+            return
+        self.send(self.server.daemon.handle(request, self.send))
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, daemon: Daemon):
+        self.daemon = daemon
+        super().__init__(socket_path, RequestHandler)
+
+
+def stop(socket_path: Optional[str] = None) -> bool:
+    """Ask daemon to shut down, `False` if it is not running."""
+    return send({"command": "shutdown"}, socket_path) is not None
+
+
+def main():
+    """Entry point of `dockswapd` command."""
+    try:
+        Daemon().serve()
+    except DockSwapError as error:
+        sys.stderr.write(str(error) + "\n")
+        return 1
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""
+Discovery of compose files in a directory tree (`dockswap discover`).
+
+Directories are scanned concurrently with `os.scandir` (one task per
+directory, symlinks are not followed), directories matching ignore patterns
+are skipped. Every directory with a compose file gives one composer named
+after the directory, found composers are validated in parallel and checked
+against registered ones once, so registering hundreds of them costs one
+storage write.
+"""
+import os
+import fnmatch
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .core import Composer
+from .errors import DockSwapError
+from .validators import validate_docker_compose_path
+
+DEFAULT_DISCOVER_WORKERS = 16
+# looked for in this order, first one found in a directory wins
+COMPOSE_FILE_NAMES = (
+    "docker-compose.yml",
+    "docker-compose.yaml",
+    "docker-compose.json",
+    "compose.yml",
+    "compose.yaml",
+)
+ENV_FILE_NAMES = (".env",)
+DEFAULT_IGNORE = (
+    ".*",
+    "node_modules",
+    "__pycache__",
+    "venv",
+    "site-packages",
+    "vendor",
+)
+
+
+class Found(object):
+    """Compose (and env) file found in a directory."""
+
+    def __init__(self, directory: str, compose_path: str, env_path: Optional[str] = None):
+        self.directory = directory
+        self.compose_path = compose_path
+        self.env_path = env_path
+
+
+class Discovery(object):
+    def __init__(self):
+        self.composers: List[Composer] = []
+        # compose files that were not registered and why
+        self.skipped: List[Tuple[str, str]] = []
+
+
+def is_ignored(name: str, relative: str, patterns: Iterable[str]) -> bool:
+    """Patterns are matched against directory name and its path relative to root."""
+    return any(
+        fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relative, pattern)
+        for pattern in patterns
+    )
+
+
+def scan(
+    directory: str, root: str, patterns: Iterable[str]
+) -> Tuple[Optional[Found], List[str]]:
+    """Compose file in `directory` (if any) and its subdirectories that are not ignored."""
+    files: Set[str] = set()
+    subdirectories = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        relative = os.path.relpath(entry.path, root)
+                        if not is_ignored(entry.name, relative, patterns):
+                            subdirectories.append(entry.path)
+                    elif entry.is_file():
+                        files.add(entry.name)
+                except OSError:
+                    continue
+    except OSError:
+        return None, []
+
+    found = None
+    for name in COMPOSE_FILE_NAMES:
+        if name in files:
+            env_name = next((env for env in ENV_FILE_NAMES if env in files), None)
+            found = Found(
+                directory,
+                os.path.join(directory, name),
+                os.path.join(directory, env_name) if env_name else None,
+            )
+            break
+    return found, sorted(subdirectories)
+
+
+def walk(
+    root: str, patterns: Iterable[str] = DEFAULT_IGNORE, workers: int = DEFAULT_DISCOVER_WORKERS
+) -> List[Found]:
+    """Compose files under `root` found by scanning directories in parallel, sorted by path."""
+    root = os.path.abspath(root)
+    patterns = list(patterns)
+    found = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        pending = {executor.submit(scan, root, root, patterns)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                directory_found, subdirectories = future.result()
+                if directory_found:
+                    found.append(directory_found)
+                for subdirectory in subdirectories:
+                    pending.add(executor.submit(scan, subdirectory, root, patterns))
+    return sorted(found, key=lambda item: item.directory)
+
+
+def project_names(found: List[Found], root: str, taken: Set[str]) -> Dict[str, Optional[str]]:
+    """
+    Project name for every found directory: its name, or its path relative to
+    `root` joined with "-" when the name is used by another found directory or
+    is already `taken`. `None` if both are taken.
+    """
+    root = os.path.abspath(root)
+    counts: Dict[str, int] = {}
+    for item in found:
+        name = os.path.basename(item.directory)
+        counts[name] = counts.get(name, 0) + 1
+
+    names: Dict[str, Optional[str]] = {}
+    used = set(taken)
+    for item in found:
+        name = os.path.basename(item.directory)
+        relative = os.path.relpath(item.directory, root)
+        if (counts[name] > 1 or name in used) and relative != os.curdir:
+            name = relative.replace(os.sep, "-")
+        names[item.directory] = None if name in used else name
+        used.add(name)
+    return names
+
+
+def discover_composers(
+    root: str,
+    registered: List[Composer],
+    patterns: Iterable[str] = DEFAULT_IGNORE,
+    workers: int = DEFAULT_DISCOVER_WORKERS,
+) -> Discovery:
+    """
+    Composers for compose files under `root` that are not `registered` yet
+    (by compose file path), validated in parallel.
+    """
+    if not os.path.isdir(root):
+        raise DockSwapError("{} is not a directory".format(root))
+
+    registered_paths = {composer.docker_compose_path for composer in registered}
+    discovery = Discovery()
+    found = []
+    for item in walk(root, patterns, workers):
+        if item.compose_path in registered_paths:
+            discovery.skipped.append((item.compose_path, "already registered"))
+        else:
+            found.append(item)
+
+    def validate(item: Found) -> Optional[str]:
+        try:
+            validate_docker_compose_path(
+                Path(item.compose_path), Path(item.env_path) if item.env_path else None
+            )
+        except DockSwapError as error:
+            return str(error)
+        return None
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        problems = list(executor.map(validate, found))
+
+    valid = []
+    for item, problem in zip(found, problems):
+        if problem:
+            discovery.skipped.append((item.compose_path, problem))
+        else:
+            valid.append(item)
+
+    names = project_names(valid, root, {composer.project_name for composer in registered})
+    for item in valid:
+        name = names[item.directory]
+        if name is None:
+            discovery.skipped.append((item.compose_path, "no free project name"))
+        else:
+            discovery.composers.append(
+                Composer(
+                    docker_compose_path=item.compose_path,
+                    env_path=item.env_path,
+                    project_name=name,
+                )
+            )
+    return discovery
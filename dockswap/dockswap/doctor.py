@@ -0,0 +1,120 @@
+"""
+Checks of registered composers: files they point to, compose files themselves,
+build contexts and (optionally) images of their services.
+"""
+import os
+import stat
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set
+
+from .core import Composer
+from .errors import DockSwapError
+
+DEFAULT_DOCTOR_WORKERS = 16
+
+
+class StatCache(object):
+    """
+    Results of `os.stat` shared between threads, so that paths used by many
+    composers (the same compose file, common build context...) are stat'ed once.
+    """
+
+    def __init__(self):
+        self.results: Dict[str, Optional[os.stat_result]] = {}
+        self.lock = threading.Lock()
+
+    def stat(self, path: str) -> Optional[os.stat_result]:
+        with self.lock:
+            if path in self.results:
+                return self.results[path]
+        try:
+            result = os.stat(path)
+        except OSError:
+            result = None
+        with self.lock:
+            self.results[path] = result
+        return result
+
+    def is_file(self, path: str) -> bool:
+        result = self.stat(path)
+        return result is not None and stat.S_ISREG(result.st_mode)
+
+    def is_dir(self, path: str) -> bool:
+        result = self.stat(path)
+        return result is not None and stat.S_ISDIR(result.st_mode)
+
+
+class Diagnosis(object):
+    def __init__(self, composer: Composer):
+        self.composer = composer
+        self.problems: List[str] = []
+        # files composer points to are gone, so it can not be started any more
+        self.stale = False
+
+    @property
+    def ok(self) -> bool:
+        return not self.problems
+
+
+def normalize_image(image: str) -> str:
+    """Image name as `docker image ls` shows it (with tag, `latest` by default)."""
+    if "@" in image or ":" in image.rsplit("/", 1)[-1]:
+        return image
+    return image + ":latest"
+
+
+def diagnose(
+    composer: Composer, stats: StatCache, images: Optional[Set[str]] = None
+) -> Diagnosis:
+    """
+    Check files of `composer` and its compose file. If `images` (names of local
+    images) are given, images of services that are not built are checked too.
+    """
+    diagnosis = Diagnosis(composer)
+
+    if not stats.is_file(composer.docker_compose_path):
+        diagnosis.problems.append(
+            "compose file {} does not exist".format(composer.docker_compose_path)
+        )
+        diagnosis.stale = True
+    if composer.env_path and not stats.is_file(composer.env_path):
+        diagnosis.problems.append("env file {} does not exist".format(composer.env_path))
+        diagnosis.stale = True
+    if diagnosis.stale:
+        return diagnosis
+
+    try:
+        spec = composer.spec
+    except DockSwapError as error:
+        diagnosis.problems.append(str(error))
+        return diagnosis
+
+    for service in spec.services.values():
+        if service.build and not stats.is_dir(service.build):
+            diagnosis.problems.append(
+                'build context {} of service "{}" does not exist'.format(
+                    service.build, service.name
+                )
+            )
+        if (
+            images is not None
+            and service.image
+            and not service.build
+            and normalize_image(service.image) not in images
+        ):
+            diagnosis.problems.append(
+                'image {} of service "{}" is not pulled'.format(service.image, service.name)
+            )
+    return diagnosis
+
+
+def diagnose_all(
+    composers: List[Composer],
+    images: Optional[Set[str]] = None,
+    workers: int = DEFAULT_DOCTOR_WORKERS,
+) -> List[Diagnosis]:
+    """Diagnose `composers` in parallel sharing one stat cache, keeping their order."""
+    stats = StatCache()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return list(executor.map(lambda composer: diagnose(composer, stats, images), composers))
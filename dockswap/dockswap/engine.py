@@ -0,0 +1,713 @@
+"""
+Engines used to talk to docker daemon.
+
+`CLIEngine` runs `docker` binary (can be changed by setting `DOCKSWAP_DOCKER_CLI`
+environment variable) for every operation. `APIEngine` talks HTTP to Docker Engine
+API over unix socket and reuses one connection per thread, so no process is forked.
+
+Engine is chosen with `DOCKSWAP_ENGINE` environment variable (`cli` by default
+or `api`). If API socket is not reachable then CLI engine is used instead.
+"""
+import os
+import json
+import socket
+import time
+import threading
+import subprocess
+import http.client
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import quote, urlencode
+
+from .errors import CommandError, DockSwapError
+from .execution import phase_timeout, run_captured, spawn, tail, terminate
+
+DEFAULT_SOCKET_PATH = "/var/run/docker.sock"
+API_VERSION = "v1.40"
+COMPOSE_PROJECT_LABEL = "com.docker.compose.project"
+COMPOSE_SERVICE_LABEL = "com.docker.compose.service"
+# "True" on containers of `docker-compose run`
+COMPOSE_ONEOFF_LABEL = "com.docker.compose.oneoff"
+PULL_TIMEOUT = 30 * 60
+
+# result of batch operation: ids that succeeded and errors by id for the rest
+BatchResult = Tuple[List[str], Dict[str, str]]
+
+
+def docker_binary() -> str:
+    """`docker` command, can be changed by setting `DOCKSWAP_DOCKER_CLI` environment variable."""
+    return os.environ.get("DOCKSWAP_DOCKER_CLI", "docker")
+
+
+def docker_socket_path() -> str:
+    """Path of docker daemon socket, taken from `DOCKER_HOST` if it is a unix socket."""
+    docker_host = os.environ.get("DOCKER_HOST", "")
+    if docker_host.startswith("unix://"):
+        return docker_host[len("unix://"):]
+    return DEFAULT_SOCKET_PATH
+
+
+class Container(object):
+    def __init__(
+        self,
+        id: str,
+        state: str,
+        name: str = "",
+        image: str = "",
+        labels: Optional[Dict[str, str]] = None,
+    ):
+        self.id = id
+        self.state = state
+        self.name = name
+        self.image = image
+        self.labels = labels or {}
+
+    @property
+    def running(self) -> bool:
+        return self.state == "running"
+
+    @property
+    def project(self) -> Optional[str]:
+        """Name of docker-compose project container belongs to (if any)."""
+        return self.labels.get(COMPOSE_PROJECT_LABEL)
+
+    @property
+    def service(self) -> Optional[str]:
+        return self.labels.get(COMPOSE_SERVICE_LABEL)
+
+    def __repr__(self):
+        return "Container(id={!r}, state={!r}, project={!r})".format(
+            self.id, self.state, self.project
+        )
+
+
+class Usage(object):
+    """Resources used by a container (or a project): memory in bytes and CPU in cores."""
+
+    __slots__ = ("memory", "cpu")
+
+    def __init__(self, memory: int = 0, cpu: float = 0.0):
+        self.memory = memory
+        self.cpu = cpu
+
+    def __add__(self, other: "Usage") -> "Usage":
+        return Usage(self.memory + other.memory, self.cpu + other.cpu)
+
+    def __eq__(self, other):
+        return isinstance(other, Usage) and (self.memory, self.cpu) == (other.memory, other.cpu)
+
+    def __repr__(self):
+        return "Usage(memory={}, cpu={:.2f})".format(self.memory, self.cpu)
+
+
+class Event(object):
+    """Container event as `docker events` reports it."""
+
+    def __init__(self, action: str, id: str, attributes: Optional[Dict[str, str]] = None):
+        self.action = action
+        self.id = id
+        self.attributes = attributes or {}
+
+    @property
+    def status(self) -> str:
+        """Action without details, e.g. "health_status" for "health_status: healthy"."""
+        return self.action.split(":", 1)[0]
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Event":
+        actor = data.get("Actor") or {}
+        return cls(
+            action=data.get("Action") or data.get("status", ""),
+            id=data.get("id") or actor.get("ID", ""),
+            attributes=actor.get("Attributes") or {},
+        )
+
+    def __repr__(self):
+        return "Event(action={!r}, id={!r})".format(self.action, self.id)
+
+
+class EventStream(object):
+    """
+    Iterable of events read from JSON `lines`. Iteration ends when lines
+    end or when stream is closed (which may be done from another thread).
+    """
+
+    def __init__(self, lines: Iterable, close: Callable[[], None]):
+        self.lines = lines
+        self._close = close
+        self.closed = False
+
+    def __iter__(self) -> Iterator[Event]:
+        try:
+            for line in self.lines:
+                try:
+                    yield Event.from_dict(
+                        json.loads(line.decode() if isinstance(line, bytes) else line)
+                    )
+                except ValueError:
+                    continue
+        except (OSError, ValueError, http.client.HTTPException):
+            # stream was closed while reading
+            return
+        finally:
+            self.close()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._close()
+
+
+def parse_labels(labels: str) -> Dict[str, str]:
+    """
+    Parse labels as `docker ps --format` prints them (k=v,k2=v2).
+    Label values may contain commas themselves, so a part
+    without `=` is a continuation of the previous value.
+    """
+    parsed: Dict[str, str] = {}
+    key = None
+    for part in labels.split(",") if labels else []:
+        if "=" in part:
+            key, value = part.split("=", 1)
+            parsed[key] = value
+        elif key is not None:
+            parsed[key] += "," + part
+    return parsed
+
+
+SIZE_UNITS = {
+    "b": 1,
+    "kb": 1000,
+    "kib": 1024,
+    "mb": 1000 ** 2,
+    "mib": 1024 ** 2,
+    "gb": 1000 ** 3,
+    "gib": 1024 ** 3,
+    "tb": 1000 ** 4,
+    "tib": 1024 ** 4,
+}
+
+
+def parse_size(size: str) -> int:
+    """Parse size like `12.5MiB` (as printed by `docker stats`) or `2g` into bytes."""
+    size = size.strip().lower()
+    number = size.rstrip("abcdefghijklmnopqrstuvwxyz")
+    unit = size[len(number):].strip() or "b"
+    if unit in ("k", "m", "g", "t"):
+        unit += "ib"
+    try:
+        return int(float(number) * SIZE_UNITS[unit])
+    except (KeyError, ValueError):
+        raise DockSwapError('Could not parse size "{}"'.format(size))
+
+
+def parse_percent(percent: str) -> float:
+    """Parse CPU percent like `150.25%` (as printed by `docker stats`) into cores."""
+    try:
+        return float(percent.strip().rstrip("%")) / 100
+    except ValueError:
+        return 0.0
+
+
+def stats_cpu(stats: Dict[str, Any]) -> float:
+    """CPU cores used by container according to one Docker Engine API stats sample."""
+    cpu, previous = stats.get("cpu_stats") or {}, stats.get("precpu_stats") or {}
+    used = (cpu.get("cpu_usage") or {}).get("total_usage", 0) - (
+        previous.get("cpu_usage") or {}
+    ).get("total_usage", 0)
+    elapsed = cpu.get("system_cpu_usage", 0) - previous.get("system_cpu_usage", 0)
+    if used <= 0 or elapsed <= 0:
+        return 0.0
+    return used / elapsed * cpu.get("online_cpus", 1)
+
+
+def match_ids(ids: List[str], values: Dict[str, Any]) -> Dict[str, Any]:
+    """Map `values` keyed by (possibly shortened) container ids back to full `ids`."""
+    matched = {}
+    for container_id in ids:
+        for short_id, value in values.items():
+            if container_id.startswith(short_id) or short_id.startswith(container_id):
+                matched[container_id] = value
+                break
+    return matched
+
+
+class CLIEngine(object):
+    """Engine that runs `docker` binary for every operation."""
+
+    name = "cli"
+
+    def __init__(self, binary: Optional[str] = None):
+        self.binary = binary or docker_binary()
+
+    def run(
+        self, args: List[str], phase: str = "docker", timeout: Optional[float] = None
+    ) -> subprocess.CompletedProcess:
+        """Run docker command within deadline of `phase` (see execution.py)."""
+        return run_captured([self.binary] + args, phase, timeout)
+
+    def check(self, args: List[str], phase: str = "docker") -> str:
+        started = time.monotonic()
+        result = self.run(args, phase)
+        if result.returncode != 0:
+            raise CommandError(
+                " ".join([self.binary] + args),
+                result.returncode,
+                tail(result.stderr),
+                time.monotonic() - started,
+            )
+        return result.stdout
+
+    def list_containers(self, all: bool = False) -> List[Container]:
+        """List running containers (or all containers if `all`)."""
+        args = ["ps", "--no-trunc", "--format", "{{json .}}"] + (["-a"] if all else [])
+        containers = []
+        for line in self.check(args).splitlines():
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            containers.append(
+                Container(
+                    id=data["ID"],
+                    state=data.get("State")
+                    or ("running" if data.get("Status", "").startswith("Up") else "exited"),
+                    name=data.get("Names", ""),
+                    image=data.get("Image", ""),
+                    labels=parse_labels(data.get("Labels", "")),
+                )
+            )
+        return containers
+
+    def batch(
+        self, args: List[str], ids: List[str], timeout: Optional[float] = None
+    ) -> BatchResult:
+        """
+        Run docker command `args` for container `ids` at once. Docker prints id of every
+        container it processed successfully, so return those together with
+        errors for the rest instead of failing the whole batch.
+        """
+        if not ids:
+            return [], {}
+
+        result = self.run(args + ids, timeout=timeout)
+        done = set(result.stdout.split())
+        error_lines = [line for line in result.stderr.splitlines() if line.strip()]
+
+        succeeded, failures = [], {}
+        for container_id in ids:
+            if container_id in done:
+                succeeded.append(container_id)
+                continue
+
+            matching = [line for line in error_lines if container_id in line]
+            if matching:
+                failures[container_id] = matching[0]
+            elif error_lines:
+                failures[container_id] = error_lines[-1]
+            else:
+                failures[container_id] = "exit code {}".format(result.returncode)
+
+        return succeeded, failures
+
+    def stop(self, ids: List[str], timeout: int) -> BatchResult:
+        deadline = phase_timeout("docker")
+        # containers are given `timeout` seconds to stop on top of the usual deadline
+        return self.batch(
+            ["stop", "-t", str(timeout)], ids, deadline + timeout if deadline else 0
+        )
+
+    def remove(self, ids: List[str], force: bool = True) -> BatchResult:
+        return self.batch(["rm"] + (["-f"] if force else []), ids)
+
+    def pause(self, ids: List[str]) -> BatchResult:
+        return self.batch(["pause"], ids)
+
+    def unpause(self, ids: List[str]) -> BatchResult:
+        return self.batch(["unpause"], ids)
+
+    def memory_usage(self, ids: List[str]) -> Dict[str, int]:
+        """Current memory usage (in bytes) of containers with `ids`."""
+        return {
+            container_id: usage.memory for container_id, usage in self.resource_usage(ids).items()
+        }
+
+    def resource_usage(self, ids: List[str]) -> Dict[str, Usage]:
+        """Current memory and CPU usage of containers with `ids`, in one `docker stats`."""
+        if not ids:
+            return {}
+
+        output = self.check(
+            ["stats", "--no-stream", "--format", "{{.ID}}\t{{.MemUsage}}\t{{.CPUPerc}}"] + ids
+        )
+        usage = {}
+        for line in output.splitlines():
+            parts = line.split("\t")
+            if len(parts) < 2:
+                continue
+            cpu = parse_percent(parts[2]) if len(parts) > 2 else 0.0
+            usage[parts[0].strip()] = Usage(parse_size(parts[1].split("/")[0]), cpu)
+        return match_ids(ids, usage)
+
+    def inspect(self, container_id: str) -> Dict[str, Any]:
+        return json.loads(self.check(["inspect", container_id]))[0]
+
+    def image_names(self) -> List[str]:
+        """Names (repository:tag) of images present locally."""
+        output = self.check(["image", "ls", "--format", "{{.Repository}}:{{.Tag}}"])
+        return [line.strip() for line in output.splitlines() if line.strip()]
+
+    def image_ids(self) -> Dict[str, str]:
+        """IDs of images present locally by their names (repository:tag)."""
+        output = self.check(
+            ["image", "ls", "--no-trunc", "--format", "{{.Repository}}:{{.Tag}} {{.ID}}"]
+        )
+        ids = {}
+        for line in output.splitlines():
+            parts = line.split()
+            if len(parts) == 2 and "<none>" not in parts[0]:
+                ids[parts[0]] = parts[1]
+        return ids
+
+    def pull(self, image: str):
+        """Pull `image` from its registry."""
+        self.check(["pull", "-q", image], phase="docker_pull")
+
+    def events(self) -> "EventStream":
+        """
+        Stream of container events, starting from now.
+        Stream ends if `docker events` exits.
+        """
+        process = spawn(
+            [self.binary, "events", "--format", "{{json .}}", "--filter", "type=container"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        )
+
+        def close():
+            terminate(process, grace=0)
+
+        return EventStream(process.stdout, close)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over unix socket."""
+
+    def __init__(self, socket_path: str, timeout: Optional[float] = None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+class APIEngine(object):
+    """
+    Engine that talks to Docker Engine API over unix socket.
+    Every thread keeps its own persistent (keep-alive) connection.
+    """
+
+    name = "api"
+
+    def __init__(self, socket_path: Optional[str] = None, timeout: float = 60):
+        self.socket_path = socket_path or docker_socket_path()
+        self.timeout = timeout
+        self.local = threading.local()
+
+    @property
+    def connection(self) -> UnixHTTPConnection:
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = UnixHTTPConnection(self.socket_path, timeout=self.timeout)
+            self.local.connection = connection
+        return connection
+
+    def close(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+    ) -> Tuple[int, Any]:
+        """Send request and return status and decoded JSON body (if any)."""
+        url = "/{}{}".format(API_VERSION, path)
+        if params:
+            url += "?" + urlencode(params)
+
+        for attempt in range(2):
+            connection = self.connection
+            try:
+                if connection.sock is None:
+                    connection.connect()
+                connection.sock.settimeout(timeout or self.timeout)
+                connection.request(method, url)
+                response = connection.getresponse()
+                body = response.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionError) as error:
+                # daemon closed idle keep-alive connection, reconnect once
+                self.close()
+                if attempt:
+                    raise DockSwapError(
+                        "Docker API request {} {} failed: {}".format(method, path, error)
+                    )
+            except (OSError, http.client.HTTPException) as error:
+                self.close()
+                raise DockSwapError(
+                    "Docker API request {} {} failed: {}".format(method, path, error)
+                )
+
+        data = None
+        if body:
+            try:
+                data = json.loads(body.decode())
+            except ValueError:
+                data = body.decode()
+        return response.status, data
+
+    def ping(self) -> bool:
+        try:
+            status, _ = self.request("GET", "/_ping", timeout=2)
+        except DockSwapError:
+            return False
+        return status == 200
+
+    @staticmethod
+    def error_message(status: int, data: Any) -> str:
+        if isinstance(data, dict) and data.get("message"):
+            return data["message"]
+        return "status code {}".format(status)
+
+    def list_containers(self, all: bool = False) -> List[Container]:
+        status, data = self.request("GET", "/containers/json", {"all": int(all)})
+        if status != 200:
+            raise DockSwapError(
+                "Could not list containers: {}".format(self.error_message(status, data))
+            )
+        return [
+            Container(
+                id=item["Id"],
+                state=item.get("State", ""),
+                name=(item.get("Names") or [""])[0].lstrip("/"),
+                image=item.get("Image", ""),
+                labels=item.get("Labels") or {},
+            )
+            for item in data
+        ]
+
+    def each(self, ids: List[str], operation) -> BatchResult:
+        succeeded, failures = [], {}
+        for container_id in ids:
+            try:
+                status, data = operation(quote(container_id))
+            except DockSwapError as error:
+                failures[container_id] = str(error)
+                continue
+            # 304 means container is already stopped
+            if status in (200, 204, 304):
+                succeeded.append(container_id)
+            else:
+                failures[container_id] = self.error_message(status, data)
+        return succeeded, failures
+
+    def stop(self, ids: List[str], timeout: int) -> BatchResult:
+        return self.each(
+            ids,
+            lambda container_id: self.request(
+                "POST",
+                "/containers/{}/stop".format(container_id),
+                {"t": timeout},
+                timeout=timeout + self.timeout,
+            ),
+        )
+
+    def remove(self, ids: List[str], force: bool = True) -> BatchResult:
+        return self.each(
+            ids,
+            lambda container_id: self.request(
+                "DELETE",
+                "/containers/{}".format(container_id),
+                {"force": int(force)},
+            ),
+        )
+
+    def pause(self, ids: List[str]) -> BatchResult:
+        return self.each(
+            ids,
+            lambda container_id: self.request(
+                "POST", "/containers/{}/pause".format(container_id)
+            ),
+        )
+
+    def unpause(self, ids: List[str]) -> BatchResult:
+        return self.each(
+            ids,
+            lambda container_id: self.request(
+                "POST", "/containers/{}/unpause".format(container_id)
+            ),
+        )
+
+    def memory_usage(self, ids: List[str]) -> Dict[str, int]:
+        """Current memory usage (in bytes) of containers with `ids`."""
+        return {
+            container_id: usage.memory for container_id, usage in self.resource_usage(ids).items()
+        }
+
+    def resource_usage(self, ids: List[str]) -> Dict[str, Usage]:
+        """Current memory and CPU usage of containers with `ids`."""
+        usage = {}
+        for container_id in ids:
+            status, data = self.request(
+                "GET",
+                "/containers/{}/stats".format(quote(container_id)),
+                {"stream": 0},
+            )
+            if status == 200 and isinstance(data, dict):
+                usage[container_id] = Usage(
+                    (data.get("memory_stats") or {}).get("usage", 0), stats_cpu(data)
+                )
+        return usage
+
+    def inspect(self, container_id: str) -> Dict[str, Any]:
+        status, data = self.request("GET", "/containers/{}/json".format(quote(container_id)))
+        if status != 200:
+            raise DockSwapError(
+                'Could not inspect container "{}": {}'.format(
+                    container_id, self.error_message(status, data)
+                )
+            )
+        return data
+
+    def image_names(self) -> List[str]:
+        """Names (repository:tag) of images present locally."""
+        status, data = self.request("GET", "/images/json")
+        if status != 200:
+            raise DockSwapError(
+                "Could not list images: {}".format(self.error_message(status, data))
+            )
+        return [tag for image in data for tag in image.get("RepoTags") or []]
+
+    def image_ids(self) -> Dict[str, str]:
+        """IDs of images present locally by their names (repository:tag)."""
+        status, data = self.request("GET", "/images/json")
+        if status != 200:
+            raise DockSwapError(
+                "Could not list images: {}".format(self.error_message(status, data))
+            )
+        return {
+            tag: image["Id"]
+            for image in data
+            for tag in image.get("RepoTags") or []
+            if "<none>" not in tag
+        }
+
+    def pull(self, image: str):
+        """Pull `image` from its registry."""
+        name, tag = image, None
+        if "@" not in image and ":" in image.rsplit("/", 1)[-1]:
+            name, tag = image.rsplit(":", 1)
+        params = {"fromImage": name}
+        if tag:
+            params["tag"] = tag
+        status, data = self.request("POST", "/images/create", params, timeout=PULL_TIMEOUT)
+        if status != 200:
+            raise DockSwapError(
+                'Could not pull image "{}": {}'.format(image, self.error_message(status, data))
+            )
+        # progress is streamed as JSON objects, failures are reported in them too
+        lines = data.splitlines() if isinstance(data, str) else [json.dumps(data)]
+        for line in lines:
+            try:
+                progress = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(progress, dict) and progress.get("error"):
+                raise DockSwapError(
+                    'Could not pull image "{}": {}'.format(image, progress["error"])
+                )
+
+    def events(self) -> "EventStream":
+        """
+        Stream of container events, starting from now.
+        Events are read over a separate connection without timeout.
+        """
+        connection = UnixHTTPConnection(self.socket_path)
+        url = "/{}/events?{}".format(
+            API_VERSION, urlencode({"filters": json.dumps({"type": ["container"]})})
+        )
+        try:
+            connection.request("GET", url)
+            response = connection.getresponse()
+        except (OSError, http.client.HTTPException) as error:
+            connection.close()
+            raise DockSwapError("Could not watch docker events: {}".format(error))
+        if response.status != 200:
+            connection.close()
+            raise DockSwapError(
+                "Could not watch docker events: status code {}".format(response.status)
+            )
+
+        def close():
+            # shutdown wakes up a thread blocked on reading the stream
+            if connection.sock is not None:
+                try:
+                    connection.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            connection.close()
+
+        return EventStream(response, close)
+
+
+_default_engine = None
+# engines resolved by `get_engine`, keyed by process, kind, docker binary and socket
+_engines: Dict[Tuple[int, str, str, str], Any] = {}
+_engines_lock = threading.Lock()
+
+
+def set_default_engine(engine):
+    """Make `get_engine()` without `kind` return `engine` (`None` to reset)."""
+    global _default_engine
+    _default_engine = engine
+
+
+def get_engine(kind: Optional[str] = None):
+    """
+    Get engine of `kind` (defaults to `DOCKSWAP_ENGINE` environment variable or `cli`).
+    API engine falls back to CLI engine if docker socket is not reachable.
+    Engine is created (and API socket pinged) once per process, later calls
+    reuse it together with its connections.
+    """
+    if kind is None and _default_engine is not None:
+        return _default_engine
+
+    kind = (kind or os.environ.get("DOCKSWAP_ENGINE", "cli")).lower()
+    if kind not in ("api", "cli"):
+        raise DockSwapError('Unknown engine "{}". Choose one of: cli, api'.format(kind))
+
+    key = (os.getpid(), kind, docker_binary(), docker_socket_path() if kind == "api" else "")
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = _engines[key] = resolve_engine(kind)
+    return engine
+
+
+def resolve_engine(kind: str):
+    if kind == "api":
+        engine = APIEngine()
+        if engine.ping():
+            return engine
+    return CLIEngine()
@@ -1,2 +1,82 @@
+import signal
+from typing import Optional
+
+
 class DockSwapError(Exception):
-    pass
+    # exit code of dockswap when command fails with this error
+    exit_code = 1
+
+
+class CommandError(DockSwapError):
+    """
+    Child process failed. Carries its exit code (`None` if it was killed
+    by dockswap), last lines of its stderr and seconds it ran.
+    """
+
+    def __init__(
+        self,
+        command: str,
+        returncode: Optional[int],
+        stderr_tail: str = "",
+        elapsed: float = 0.0,
+    ):
+        self.command = command
+        self.returncode = returncode
+        self.stderr_tail = stderr_tail
+        self.elapsed = elapsed
+        super().__init__(self.describe())
+
+    def describe(self) -> str:
+        message = 'Command "{}" exited with status code {} after {:.1f}s'.format(
+            self.command, self.returncode, self.elapsed
+        )
+        return self.with_tail(message)
+
+    def with_tail(self, message: str) -> str:
+        return "{}: {}".format(message, self.stderr_tail) if self.stderr_tail else message
+
+
+class CommandNotStarted(CommandError):
+    """Child process could not be started (binary is missing or not executable)."""
+
+    def __init__(self, command: str, error: OSError):
+        self.error = error
+        # exit codes shells use for the same failures
+        self.exit_code = 127 if isinstance(error, FileNotFoundError) else 126
+        super().__init__(command, self.exit_code)
+
+    def describe(self) -> str:
+        return 'Could not run "{}": {}'.format(self.command, self.error)
+
+
+class CommandTimeout(CommandError):
+    """Child process did not finish before deadline of its phase and was killed."""
+
+    exit_code = 124
+
+    def __init__(
+        self, command: str, timeout: float, stderr_tail: str = "", elapsed: float = 0.0
+    ):
+        self.timeout = timeout
+        super().__init__(command, None, stderr_tail, elapsed)
+
+    def describe(self) -> str:
+        return self.with_tail(
+            'Command "{}" did not finish in {:g}s and was killed'.format(
+                self.command, self.timeout
+            )
+        )
+
+
+class CommandInterrupted(CommandError):
+    """Dockswap got a signal while child process was running, signal was passed to it."""
+
+    def __init__(self, command: str, signum: int, stderr_tail: str = "", elapsed: float = 0.0):
+        self.signum = signum
+        self.exit_code = 128 + signum
+        super().__init__(command, None, stderr_tail, elapsed)
+
+    def describe(self) -> str:
+        return 'Command "{}" was interrupted by {} after {:.1f}s'.format(
+            self.command, signal.Signals(self.signum).name, self.elapsed
+        )
@@ -0,0 +1,321 @@
+"""
+Execution of child processes (`docker`, `docker-compose`), all of them are
+started with `spawn` and waited for under `supervised`.
+
+Deadlines: every phase has one (`docker` calls, `docker_pull`, `compose_up`,
+`compose_down`...), set with `DOCKSWAP_TIMEOUT_<PHASE>` environment variable
+in seconds (`0` disables it). When it passes, process group of the child is
+terminated (SIGTERM, then SIGKILL after `KILL_GRACE` seconds) and
+`CommandTimeout` is raised.
+
+Retries: commands failing with a transient daemon error (daemon is not
+reachable, registry throttles...) are run again after exponentially growing
+delays, `DOCKSWAP_RETRIES` times at most (2 by default) and only while
+the deadline allows.
+
+Cancellation: children run in their own process groups, so that a wedged
+child can be killed together with its own children. SIGINT and SIGTERM that
+dockswap gets are forwarded to all of these groups, children are waited for
+and `CommandInterrupted` is raised.
+"""
+import os
+import time
+import signal
+import threading
+import subprocess
+from contextlib import contextmanager
+from typing import IO, Callable, List, Optional, Set, Union
+
+from .errors import CommandInterrupted, CommandNotStarted, CommandTimeout
+
+PHASE_TIMEOUTS = {
+    "docker": 120,
+    "docker_pull": 30 * 60,
+    "compose_up": 15 * 60,
+    "compose_update": 15 * 60,
+    "compose_create": 15 * 60,
+    "compose_down": 10 * 60,
+    "compose_pull": 30 * 60,
+    "volume_snapshot": 30 * 60,
+    "volume_restore": 30 * 60,
+}
+DEFAULT_TIMEOUT = 15 * 60
+DEFAULT_RETRIES = 2
+KILL_GRACE = 10
+TAIL_LINES = 20
+
+# lowercased fragments of errors after which command is worth running again
+TRANSIENT_ERRORS = (
+    "cannot connect to the docker daemon",
+    "is the docker daemon running",
+    "connection refused",
+    "connection reset by peer",
+    "i/o timeout",
+    "tls handshake timeout",
+    "context deadline exceeded",
+    "toomanyrequests",
+    "503 service unavailable",
+    "502 bad gateway",
+)
+
+
+def phase_timeout(phase: str) -> Optional[float]:
+    """Deadline of `phase` in seconds, `None` if it has none."""
+    value = os.environ.get("DOCKSWAP_TIMEOUT_{}".format(phase.upper()))
+    if value is None:
+        timeout = float(PHASE_TIMEOUTS.get(phase, DEFAULT_TIMEOUT))
+    else:
+        try:
+            timeout = float(value)
+        except ValueError:
+            timeout = float(PHASE_TIMEOUTS.get(phase, DEFAULT_TIMEOUT))
+    return timeout if timeout > 0 else None
+
+
+class Deadline(object):
+    def __init__(self, timeout: Optional[float]):
+        self.timeout = timeout if timeout and timeout > 0 else None
+        self.at = time.monotonic() + self.timeout if self.timeout else None
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left (never negative), `None` if there is no deadline."""
+        if self.at is None:
+            return None
+        return max(0.0, self.at - time.monotonic())
+
+
+class RetryPolicy(object):
+    """Retries after `base_delay`, `base_delay * factor`... seconds, at most `max_delay`."""
+
+    def __init__(
+        self,
+        retries: int = DEFAULT_RETRIES,
+        base_delay: float = 0.5,
+        factor: float = 2.0,
+        max_delay: float = 8.0,
+    ):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.factor = factor
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        try:
+            retries = int(os.environ.get("DOCKSWAP_RETRIES", DEFAULT_RETRIES))
+        except ValueError:
+            retries = DEFAULT_RETRIES
+        return cls(retries=max(0, retries))
+
+    def delay(self, attempt: int, deadline: Optional[Deadline] = None) -> Optional[float]:
+        """
+        Seconds to wait before retrying after failed `attempt` (counted from 0),
+        `None` if there are no retries left or retry would not fit before `deadline`.
+        """
+        if attempt >= self.retries:
+            return None
+        delay = min(self.max_delay, self.base_delay * self.factor ** attempt)
+        remaining = deadline.remaining() if deadline else None
+        if remaining is not None and remaining <= delay:
+            return None
+        return delay
+
+
+def is_transient(stderr: str) -> bool:
+    stderr = stderr.lower()
+    return any(error in stderr for error in TRANSIENT_ERRORS)
+
+
+class ProcessGroups(object):
+    """Running children (each leading its own process group) and the last signal received."""
+
+    def __init__(self):
+        self.processes: Set[subprocess.Popen] = set()
+        self.lock = threading.Lock()
+        self.received: Optional[int] = None
+
+    def add(self, process: subprocess.Popen):
+        with self.lock:
+            self.processes.add(process)
+
+    def discard(self, process: subprocess.Popen):
+        with self.lock:
+            self.processes.discard(process)
+
+    def signal(self, signum: int):
+        with self.lock:
+            processes = [*self.processes]
+        for process in processes:
+            signal_group(process, signum)
+
+
+_groups = ProcessGroups()
+_installed = False
+
+
+def signal_group(process: subprocess.Popen, signum: int):
+    try:
+        os.killpg(process.pid, signum)
+    except (OSError, AttributeError):
+        # already gone, or platform without process groups
+        try:
+            process.send_signal(signum)
+        except OSError:
+            pass
+
+
+def forward_signal(signum: int, frame):
+    _groups.received = signum
+    _groups.signal(signum)
+    if signum == signal.SIGINT:
+        raise KeyboardInterrupt
+    raise SystemExit(128 + signum)
+
+
+def install_signal_forwarding():
+    """
+    Forward SIGINT and SIGTERM to process groups of children. Signal handlers
+    can be set from main thread only, elsewhere this does nothing.
+    Handlers set by someone else are left alone.
+    """
+    global _installed
+    if _installed or threading.current_thread() is not threading.main_thread():
+        return
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        current = signal.getsignal(signum)
+        if current in (signal.SIG_DFL, signal.default_int_handler):
+            signal.signal(signum, forward_signal)
+    _installed = True
+
+
+def spawn(args: List[str], **kwargs) -> subprocess.Popen:
+    """
+    Start `args` as leader of a new process group, so it can be signalled with its children.
+    Raise `CommandNotStarted` if it cannot be run at all (e.g. binary is missing).
+    """
+    install_signal_forwarding()
+    try:
+        process = subprocess.Popen(args, start_new_session=True, **kwargs)
+    except OSError as error:
+        raise CommandNotStarted(" ".join(args), error) from error
+    _groups.add(process)
+    return process
+
+
+def terminate(process: subprocess.Popen, grace: float = KILL_GRACE):
+    """Stop process group of `process`: SIGTERM, then SIGKILL if it is still up after `grace`."""
+    if process.poll() is None:
+        signal_group(process, signal.SIGTERM)
+    try:
+        process.wait(timeout=grace)
+    except subprocess.TimeoutExpired:
+        signal_group(process, signal.SIGKILL)
+        process.wait()
+    else:
+        # leftovers of the group (children that ignored SIGTERM)
+        signal_group(process, signal.SIGKILL)
+    for pipe in (process.stdin, process.stdout, process.stderr):
+        if pipe:
+            pipe.close()
+    _groups.discard(process)
+
+
+def tail(text: str, lines: int = TAIL_LINES) -> str:
+    """Last `lines` lines of `text`, as kept in errors of failed commands."""
+    return "\n".join(text.strip().splitlines()[-lines:])
+
+
+@contextmanager
+def supervised(
+    process: subprocess.Popen,
+    command: str,
+    deadline: Optional[Deadline] = None,
+    stderr_tail: Callable[[], str] = lambda: "",
+):
+    """
+    Wait for `process` in context. `subprocess.TimeoutExpired` becomes
+    `CommandTimeout` and signals become `CommandInterrupted`, process group
+    is terminated whenever context is left with an exception.
+    """
+    started = time.monotonic()
+    try:
+        yield
+    except subprocess.TimeoutExpired:
+        terminate(process)
+        raise CommandTimeout(
+            command,
+            deadline.timeout if deadline and deadline.timeout else 0,
+            stderr_tail(),
+            time.monotonic() - started,
+        ) from None
+    except (KeyboardInterrupt, SystemExit) as error:
+        terminate(process)
+        signum = _groups.received
+        _groups.received = None
+        if signum is None:
+            raise
+        raise CommandInterrupted(
+            command, signum, stderr_tail(), time.monotonic() - started
+        ) from error
+    except BaseException:
+        terminate(process)
+        raise
+    finally:
+        _groups.discard(process)
+
+
+def decode(output: Union[str, bytes, None]) -> str:
+    if isinstance(output, bytes):
+        return output.decode(errors="replace")
+    return output or ""
+
+
+def run_captured(
+    args: List[str],
+    phase: str = "docker",
+    timeout: Optional[float] = None,
+    retry: Optional[RetryPolicy] = None,
+    stdin: Optional[IO[bytes]] = None,
+    stdout: Optional[IO[bytes]] = None,
+) -> subprocess.CompletedProcess:
+    """
+    Run `args` capturing its output, within deadline of `phase` (or `timeout`),
+    retrying transient daemon errors. Result of the last attempt is returned
+    whatever its exit code.
+    `stdin` and `stdout` can be (seekable binary) files to stream data through
+    instead, they are rewound before every retry and `stdout` is not captured then.
+    """
+    deadline = Deadline(phase_timeout(phase) if timeout is None else timeout)
+    retry = retry or RetryPolicy.from_env()
+    command = " ".join(args)
+    attempt = 0
+    while True:
+        process = spawn(
+            args,
+            stdin=stdin,
+            stdout=stdout or subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=stdout is None,
+        )
+        # stderr collected until the deadline, for `CommandTimeout`
+        collected: List[Union[str, bytes]] = []
+        with supervised(process, command, deadline, lambda: tail("".join(map(decode, collected)))):
+            try:
+                output, errors = process.communicate(timeout=deadline.remaining())
+            except subprocess.TimeoutExpired as error:
+                collected.append(error.stderr or "")
+                raise
+        errors = decode(errors)
+        result = subprocess.CompletedProcess(args, process.returncode, output, errors)
+        if result.returncode == 0 or not is_transient(errors):
+            return result
+        delay = retry.delay(attempt, deadline)
+        if delay is None:
+            return result
+        time.sleep(delay)
+        attempt += 1
+        if stdin is not None:
+            stdin.seek(0)
+        if stdout is not None:
+            stdout.seek(0)
+            stdout.truncate()
@@ -0,0 +1,241 @@
+"""
+No-op fast path of `start`.
+
+After every start, hash of the effective configuration of a project (content
+of compose and env files, values of environment variables the compose file
+references, services asked for), hash of every service's interpolated
+configuration and IDs of local images of services are kept in
+~/.dockswap/configs.json. Next start compares them to the current ones,
+listing containers and images once: if nothing changed and all services are
+running, `docker-compose up` is not run at all, if only some services changed
+(or are not running, or their image was pulled again, e.g. by `prefetch`) only
+those are recreated with `up --no-deps`, otherwise the whole project is
+brought up as usual.
+
+Any other `up` (`start --force`, `--pipeline`, `--standby`, groups...) drops
+the recorded configuration of the project, as it is not known what runs
+after it; the next start then brings the whole project up and records it.
+
+Files referenced from compose file (`env_file` of services, build contexts)
+are not hashed: `up` itself does not rebuild images either.
+"""
+import os
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from .compose import content_hash, environment_hash, referenced_variables
+from .core import Composer, DockSwapRepo
+from .doctor import normalize_image
+from .engine import get_engine
+from .errors import DockSwapError
+from .fs import atomic_write, file_lock
+
+
+class ConfigRepo(object):
+    """Configuration hashes of every project as of its last start."""
+
+    FILE_NAME = "configs.json"
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path or DockSwapRepo.get_dockswap_folder() / self.FILE_NAME
+        self.lock_path = self.path.with_name(self.path.name + ".lock")
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path, "r") as configs_file:
+                return json.load(configs_file)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, project_name: str) -> Optional[Dict[str, Any]]:
+        return self.load().get(project_name)
+
+    def save(self, project_name: str, state: Dict[str, Any]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with file_lock(self.lock_path):
+            configs = self.load()
+            configs[project_name] = state
+            atomic_write(self.path, json.dumps(configs))
+
+    def forget(self, project_name: str):
+        if project_name not in self.load():
+            return
+        with file_lock(self.lock_path):
+            configs = self.load()
+            if configs.pop(project_name, None) is not None:
+                atomic_write(self.path, json.dumps(configs))
+
+
+def read_bytes(path: Optional[str]) -> bytes:
+    try:
+        with open(path, "rb") as content_file:
+            return content_file.read()
+    except (OSError, TypeError):
+        return b""
+
+
+def config_state(composer: Composer, only: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Hash of compose file, env file (or `.env` docker-compose reads next to
+    compose file), environment variables compose file references and `only`,
+    and hash of every service of `composer`.
+    """
+    env_path = composer.env_path or os.path.join(
+        os.path.dirname(composer.docker_compose_path), ".env"
+    )
+    spec = composer.spec
+    content = read_bytes(composer.docker_compose_path)
+    return {
+        "hash": content_hash(
+            content,
+            read_bytes(env_path),
+            environment_hash(referenced_variables(content.decode(errors="replace"))).encode(),
+            json.dumps(sorted(only or [])).encode(),
+        ),
+        "services": {
+            name: service.config_hash for name, service in spec.services.items()
+        },
+    }
+
+
+def image_ids(composer: Composer, engine) -> Dict[str, Optional[str]]:
+    """IDs of local images of services of `composer` which are not built (`None` if missing)."""
+    images = {
+        name: normalize_image(service.image)
+        for name, service in composer.spec.services.items()
+        if service.image and not service.build
+    }
+    local = engine.image_ids() if images else {}
+    return {name: local.get(image) for name, image in images.items()}
+
+
+def required_services(composer: Composer, services: List[str]) -> Set[str]:
+    """`services` and everything they (transitively) depend on."""
+    spec = composer.spec
+    required: Set[str] = set()
+    pending = list(services)
+    while pending:
+        name = pending.pop()
+        if name in required or name not in spec.services:
+            continue
+        required.add(name)
+        pending.extend(spec.services[name].depends_on)
+    return required
+
+
+class StartPlan(object):
+    """
+    What `start` has to do: nothing (`up_to_date`), recreate only `services`,
+    or bring up the whole project (`services` is `None`).
+    """
+
+    def __init__(
+        self,
+        state: Optional[Dict[str, Any]] = None,
+        up_to_date: bool = False,
+        services: Optional[List[str]] = None,
+        reason: str = "",
+    ):
+        self.state = state
+        self.up_to_date = up_to_date
+        self.services = services
+        self.reason = reason
+
+    def describe(self) -> str:
+        if self.up_to_date:
+            return "configuration is unchanged and all services are running"
+        if self.services is not None:
+            return "recreating changed service(s): {}".format(", ".join(self.services))
+        return self.reason
+
+
+def plan_start(
+    composer: Composer,
+    only: Optional[List[str]] = None,
+    engine=None,
+    configs: Optional[ConfigRepo] = None,
+) -> StartPlan:
+    """
+    Compare configuration of `composer` with the one of its last start and
+    check which of its services run. Anything that can not be checked
+    (compose file can not be read, docker is not reachable) means full `up`.
+    """
+    configs = configs or ConfigRepo()
+    try:
+        state = config_state(composer, only)
+    except DockSwapError as error:
+        return StartPlan(reason="could not read configuration: {}".format(error))
+
+    previous = configs.get(composer.project_name)
+    if not previous:
+        return StartPlan(state, reason="project was never started by dockswap")
+
+    needed = [name for name in only or state["services"] if name in state["services"]]
+    engine = engine or get_engine()
+    try:
+        containers = engine.list_containers()
+        state["images"] = image_ids(composer, engine)
+    except (DockSwapError, OSError) as error:
+        return StartPlan(state, reason="could not list containers: {}".format(error))
+    compose_project = composer.compose_project_name
+    running = {c.service for c in containers if c.project == compose_project and c.running}
+    previous_images = previous.get("images") or {}
+    pulled = {
+        name for name in needed if previous_images.get(name) != state["images"].get(name)
+    }
+
+    if (
+        previous.get("hash") == state["hash"]
+        and all(name in running for name in needed)
+        and not pulled
+    ):
+        return StartPlan(state, up_to_date=True)
+
+    previous_services = previous.get("services") or {}
+    changed = [
+        name
+        for name in needed
+        if name not in running
+        or name in pulled
+        or state["services"][name] is None
+        or previous_services.get(name) != state["services"][name]
+    ]
+    if not changed:
+        # something outside of services changed (networks, volumes...)
+        return StartPlan(state, reason="project configuration changed")
+    if len(changed) == len(needed):
+        return StartPlan(state, reason="all services changed or are not running")
+    missing = required_services(composer, changed) - running - set(changed)
+    if missing:
+        return StartPlan(
+            state, reason="dependencies are not running: {}".format(", ".join(sorted(missing)))
+        )
+    return StartPlan(state, services=changed)
+
+
+def fast_start(
+    composer: Composer,
+    only: Optional[List[str]] = None,
+    engine=None,
+    configs: Optional[ConfigRepo] = None,
+) -> StartPlan:
+    """Start `composer` doing as little as `plan_start` found necessary."""
+    configs = configs or ConfigRepo()
+    engine = engine or get_engine()
+    plan = plan_start(composer, only, engine, configs)
+    if plan.up_to_date:
+        return plan
+
+    if plan.services is not None:
+        composer.update(plan.services)
+    else:
+        composer.start(only=only)
+    if plan.state is not None:
+        # `up` may have pulled images, record the ones containers run now
+        try:
+            plan.state["images"] = image_ids(composer, engine)
+        except (DockSwapError, OSError):
+            plan.state.pop("images", None)
+        configs.save(composer.project_name, plan.state)
+    return plan
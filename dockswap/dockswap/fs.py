@@ -0,0 +1,67 @@
+import os
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover (not available on Windows)
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path: Path, shared: bool = False):
+    """
+    Hold advisory lock on file at `path` (created if missing) while in context.
+    If `shared` then multiple holders are allowed, otherwise lock is exclusive.
+    On platforms without `fcntl` this is a no-op.
+    """
+    with open(path, "a") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def atomic_write(path: Path, content: str):
+    """
+    Write `content` to a temporary file next to `path` and rename it over `path`,
+    so readers see either old or new content, never a partially written file.
+    """
+    path = Path(path)
+    # unique per call, so that threads writing the same file do not share it
+    fd, temp_name = tempfile.mkstemp(
+        prefix=".{}.".format(path.name), suffix=".tmp", dir=str(path.parent)
+    )
+    temp_path = Path(temp_name)
+
+    try:
+        # mkstemp creates files readable by owner only, keep usual permissions
+        os.chmod(temp_name, path.stat().st_mode & 0o777 if path.exists() else 0o644)
+        with os.fdopen(fd, "w") as temp_file:
+            temp_file.write(content)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(str(temp_path), str(path))
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+
+    fsync_dir(path.parent)
+
+
+def fsync_dir(path: Path):
+    """Make a rename inside directory at `path` durable (best effort)."""
+    try:
+        dir_fd = os.open(str(path), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
@@ -0,0 +1,220 @@
+import json
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .core import Composer, DockSwapRepo
+from .engine import Container, get_engine
+from .errors import DockSwapError
+from .fs import atomic_write, file_lock
+from .timing import phase
+
+DEFAULT_GROUP_WORKERS = 4
+
+
+class Group(object):
+    """
+    Named group of registered composers started together. `dependencies` maps
+    member to members that must be started before it, members that do not
+    depend on each other are started in parallel.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        members: List[str],
+        dependencies: Optional[Dict[str, List[str]]] = None,
+    ):
+        self.name = name
+        self.members = list(OrderedDict.fromkeys(members))
+        self.dependencies = {
+            member: list(OrderedDict.fromkeys(dependencies.get(member, [])))
+            for member in self.members
+            if dependencies and dependencies.get(member)
+        }
+        unknown = [
+            member for member in (dependencies or {}) if member not in self.members
+        ] + [
+            dependency
+            for member_dependencies in self.dependencies.values()
+            for dependency in member_dependencies
+            if dependency not in self.members
+        ]
+        if unknown:
+            raise DockSwapError(
+                'Group "{}" has dependencies on non-members: {}'.format(
+                    name, ", ".join(OrderedDict.fromkeys(unknown))
+                )
+            )
+        self.levels()  # reject cycles early
+
+    def depends_on(self, member: str) -> List[str]:
+        return self.dependencies.get(member, [])
+
+    def levels(self) -> List[List[str]]:
+        """
+        Members split into stages: every member depends only on members of
+        previous stages. Raise `DockSwapError` if dependencies have a cycle.
+        """
+        levels = []
+        placed = set()
+        remaining = list(self.members)
+        while remaining:
+            level = [
+                member
+                for member in remaining
+                if all(dependency in placed for dependency in self.depends_on(member))
+            ]
+            if not level:
+                raise DockSwapError(
+                    'Dependencies of group "{}" have a cycle between: {}'.format(
+                        self.name, ", ".join(remaining)
+                    )
+                )
+            levels.append(level)
+            placed.update(level)
+            remaining = [member for member in remaining if member not in placed]
+        return levels
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "members": self.members,
+            "dependencies": self.dependencies,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Group":
+        return cls(data["name"], data["members"], data.get("dependencies"))
+
+    def represent(self) -> str:
+        return "{}: {}".format(
+            self.name,
+            ", ".join(
+                "{} (after {})".format(member, ", ".join(self.depends_on(member)))
+                if self.depends_on(member)
+                else member
+                for member in self.members
+            ),
+        )
+
+
+class GroupRepo(object):
+    """Groups of composers stored in ~/.dockswap/groups.json next to composers storage."""
+
+    FILE_NAME = "groups.json"
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path or DockSwapRepo.get_dockswap_folder() / self.FILE_NAME
+        self.lock_path = self.path.with_name(self.path.name + ".lock")
+
+    def load(self) -> "OrderedDict[str, Group]":
+        try:
+            with open(self.path, "r") as groups_file:
+                data = json.load(groups_file)
+        except OSError:
+            return OrderedDict()
+        except ValueError:
+            raise DockSwapError(
+                "Groups file {} is corrupted. Fix or remove it manually".format(self.path)
+            )
+        return OrderedDict((item["name"], Group.from_dict(item)) for item in data)
+
+    def save(self, groups: "OrderedDict[str, Group]"):
+        atomic_write(self.path, json.dumps([group.to_dict() for group in groups.values()]))
+
+    def get_all(self) -> List[Group]:
+        return list(self.load().values())
+
+    def get(self, name: str) -> Group:
+        group = self.load().get(name)
+        if group is None:
+            raise DockSwapError('No group found for "{}". May be create it first?'.format(name))
+        return group
+
+    def persist(self, group: Group):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with file_lock(self.lock_path):
+            groups = self.load()
+            groups[group.name] = group
+            self.save(groups)
+
+    def delete(self, name: str) -> bool:
+        if not self.path.exists():
+            return False
+        with file_lock(self.lock_path):
+            groups = self.load()
+            deleted = groups.pop(name, None) is not None
+            if deleted:
+                self.save(groups)
+        return deleted
+
+
+def start_group(
+    group: Group,
+    composers: Dict[str, Composer],
+    workers: int = DEFAULT_GROUP_WORKERS,
+):
+    """
+    Start `composers` of `group` members, each one as soon as members it depends
+    on are started, running at most `workers` of them at once. So the group
+    comes up in time of its longest dependency chain instead of sum of all.
+
+    After a failure no more members are started (already started ones are
+    waited for) and `DockSwapError` listing failed and skipped members is raised.
+    """
+    started, done, failures = set(), set(), OrderedDict()
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+
+        def submit_ready():
+            for member in group.members:
+                if member in started:
+                    continue
+                if all(dependency in done for dependency in group.depends_on(member)):
+                    started.add(member)
+                    running[executor.submit(composers[member].start)] = member
+
+        submit_ready()
+        while running:
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                member = running.pop(future)
+                try:
+                    future.result()
+                except DockSwapError as error:
+                    failures[member] = str(error)
+                else:
+                    done.add(member)
+            if not failures:
+                submit_ready()
+
+    if failures:
+        skipped = [member for member in group.members if member not in started]
+        raise DockSwapError(
+            'Could not start group "{}":\n{}{}'.format(
+                group.name,
+                "\n".join("{}: {}".format(member, error) for member, error in failures.items()),
+                "\nnot started: {}".format(", ".join(skipped)) if skipped else "",
+            )
+        )
+
+
+def start_group_commands(group: Group, composers: Dict[str, Composer]) -> List[str]:
+    """Lines describing stages of `start_group` with commands of every member."""
+    lines = []
+    for number, level in enumerate(group.levels(), start=1):
+        lines.append("# stage {}: {}".format(number, ", ".join(level)))
+        lines.extend(composers[member].start(dry=True) for member in level)
+    return lines
+
+
+def foreign_containers(composers: List[Composer], engine=None) -> List[Container]:
+    """Containers that do not belong to projects of `composers`."""
+    engine = engine or get_engine()
+    projects = {composer.compose_project_name for composer in composers}
+    with phase("list"):
+        containers = engine.list_containers(all=True)
+    return [container for container in containers if container.project not in projects]
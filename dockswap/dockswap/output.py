@@ -0,0 +1,259 @@
+"""
+Running child processes (docker-compose) with their output streamed line by line.
+
+stdout and stderr are read through non-blocking pipes as soon as data is there
+and are exposed as an iterator of lines, so nothing is buffered beyond one
+read chunk and one partial line (which is cut at `MAX_LINE_BYTES`). Lines can be
+printed with a "project/phase" prefix, so that output of processes running in
+parallel stays readable, and copied to a rotating log under ~/.dockswap/logs
+(enabled with `DOCKSWAP_LOG=1`). Processes are started and supervised by
+execution.py, so reading their output is bounded by a deadline.
+"""
+import os
+import sys
+import time
+import selectors
+import threading
+import subprocess
+import logging
+import logging.handlers
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from .errors import CommandError
+from .execution import (
+    TAIL_LINES,
+    Deadline,
+    RetryPolicy,
+    is_transient,
+    phase_timeout,
+    spawn,
+    supervised,
+)
+
+CHUNK_SIZE = 64 * 1024
+MAX_LINE_BYTES = 64 * 1024
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUPS = 3
+
+STDOUT = "stdout"
+STDERR = "stderr"
+
+
+class Line(object):
+    __slots__ = ("source", "text")
+
+    def __init__(self, source: str, text: str):
+        self.source = source
+        self.text = text
+
+    def __repr__(self):
+        return "Line({!r}, {!r})".format(self.source, self.text)
+
+
+class LineBuffer(object):
+    """Bytes of a stream split into lines, partial line is kept up to `limit` bytes."""
+
+    def __init__(self, limit: int = MAX_LINE_BYTES):
+        self.limit = limit
+        self.partial = b""
+
+    def feed(self, data: bytes) -> List[str]:
+        lines = (self.partial + data).split(b"\n")
+        self.partial = lines.pop()
+        while len(self.partial) > self.limit:
+            lines.append(self.partial[:self.limit])
+            self.partial = self.partial[self.limit:]
+        return [decode(line) for line in lines]
+
+    def flush(self) -> List[str]:
+        partial, self.partial = self.partial, b""
+        return [decode(partial)] if partial else []
+
+
+def decode(line: bytes) -> str:
+    # progress output uses carriage returns, only the last state of a line matters
+    return line.decode(errors="replace").rstrip("\r").rsplit("\r", 1)[-1]
+
+
+class StreamedProcess(object):
+    """
+    Child process which output is read incrementally. Iterating over it yields
+    `Line`s of stdout and stderr in order they are read, `returncode` is set
+    once iteration is over. Last lines of stderr are kept in `stderr_tail`.
+    If `deadline` passes before process exits, its process group is
+    terminated and `CommandTimeout` is raised.
+    """
+
+    def __init__(
+        self,
+        args: List[str],
+        env: Optional[Dict[str, str]] = None,
+        deadline: Optional[Deadline] = None,
+    ):
+        self.args = args
+        self.deadline = deadline or Deadline(None)
+        self.process = spawn(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+        self.returncode: Optional[int] = None
+        self.stderr_tail: deque = deque(maxlen=TAIL_LINES)
+
+    def __iter__(self) -> Iterator[Line]:
+        selector = selectors.DefaultSelector()
+        buffers = {}
+        for source, pipe in ((STDOUT, self.process.stdout), (STDERR, self.process.stderr)):
+            os.set_blocking(pipe.fileno(), False)
+            selector.register(pipe, selectors.EVENT_READ, source)
+            buffers[source] = LineBuffer()
+
+        try:
+            with supervised(
+                self.process,
+                " ".join(self.args),
+                self.deadline,
+                lambda: "\n".join(self.stderr_tail),
+            ):
+                while selector.get_map():
+                    remaining = self.deadline.remaining()
+                    if remaining is not None and remaining <= 0:
+                        raise subprocess.TimeoutExpired(self.args, self.deadline.timeout)
+                    for key, _ in selector.select(remaining):
+                        source = key.data
+                        try:
+                            data = os.read(key.fd, CHUNK_SIZE)
+                        except BlockingIOError:
+                            continue
+                        if not data:
+                            selector.unregister(key.fileobj)
+                            lines = buffers[source].flush()
+                        else:
+                            lines = buffers[source].feed(data)
+                        for text in lines:
+                            if source == STDERR:
+                                self.stderr_tail.append(text)
+                            yield Line(source, text)
+        finally:
+            selector.close()
+            self.process.stdout.close()
+            self.process.stderr.close()
+            self.returncode = self.process.wait()
+
+    def wait(self) -> int:
+        """Wait for process to exit, discarding the rest of its output."""
+        if self.returncode is None:
+            for _ in self:
+                pass
+        return self.returncode
+
+
+class LinePrinter(object):
+    """Print lines prefixed with their origin, one whole line at a time."""
+
+    lock = threading.Lock()
+
+    def __init__(self, prefix: str = ""):
+        self.prefix = "{} | ".format(prefix) if prefix else ""
+
+    def __call__(self, line: Line):
+        stream = sys.stderr if line.source == STDERR else sys.stdout
+        with self.lock:
+            stream.write(self.prefix + line.text + "\n")
+            stream.flush()
+
+
+_logger: Optional[logging.Logger] = None
+_logger_lock = threading.Lock()
+
+
+def log_path() -> Path:
+    from .core import DockSwapRepo
+
+    return DockSwapRepo.get_dockswap_folder() / "logs" / "output.log"
+
+
+def get_output_log() -> Optional[logging.Logger]:
+    """Logger writing to rotating output log, `None` unless `DOCKSWAP_LOG` is on."""
+    global _logger
+    if os.environ.get("DOCKSWAP_LOG", "0") in ("0", "false", "no", ""):
+        return None
+
+    with _logger_lock:
+        if _logger is None:
+            path = log_path()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                str(path), maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS
+            )
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            logger = logging.getLogger("dockswap.output")
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+            logger.addHandler(handler)
+            _logger = logger
+    return _logger
+
+
+def run(
+    args: List[str], prefix: str = "", echo: bool = True, deadline: Optional[Deadline] = None
+) -> int:
+    """
+    Run `args` printing (if `echo`) and logging every line of output
+    prefixed with `prefix`. Return exit code.
+    """
+    return follow(StreamedProcess(args, deadline=deadline), prefix, echo)
+
+
+def follow(process: StreamedProcess, prefix: str = "", echo: bool = True) -> int:
+    """Print and log output of `process` until it exits, return its exit code."""
+    printer = LinePrinter(prefix) if echo else None
+    logger = get_output_log()
+    started = time.monotonic()
+    if logger:
+        logger.info("%s $ %s", prefix, " ".join(process.args))
+
+    for line in process:
+        if printer:
+            printer(line)
+        if logger:
+            logger.info("%s %s %s", prefix, line.source, line.text)
+
+    if logger:
+        logger.info(
+            "%s exited with %s in %.2fs", prefix, process.returncode, time.monotonic() - started
+        )
+    return process.returncode
+
+
+def run_checked(
+    args: List[str],
+    prefix: str = "",
+    phase: str = "compose",
+    echo: bool = True,
+    retry: Optional[RetryPolicy] = None,
+):
+    """
+    Run `args` like `run` within deadline of `phase`, retrying it when it
+    fails with a transient daemon error. Raise `CommandError` (with the last
+    lines of stderr) if it still fails.
+    """
+    deadline = Deadline(phase_timeout(phase))
+    retry = retry or RetryPolicy.from_env()
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        process = StreamedProcess(args, deadline=deadline)
+        returncode = follow(process, prefix, echo)
+        if returncode == 0:
+            return
+        stderr_tail = "\n".join(process.stderr_tail)
+        delay = retry.delay(attempt, deadline) if is_transient(stderr_tail) else None
+        if delay is None:
+            raise CommandError(
+                " ".join(args), returncode, stderr_tail, time.monotonic() - started
+            )
+        if echo:
+            LinePrinter(prefix)(
+                Line(STDERR, "retrying in {:g}s after transient error".format(delay))
+            )
+        time.sleep(delay)
+        attempt += 1
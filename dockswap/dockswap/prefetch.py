@@ -0,0 +1,201 @@
+"""
+Pulling images of registered composers ahead of time, so that `start` after an
+upstream image update does not wait for the network.
+
+Images shared by several projects are pulled once, images of projects that are
+started most often (recently) go first and at most `workers` pulls run at
+once. Progress is stored in ~/.dockswap/prefetch.json after every pull, so an
+interrupted run is resumed by the next one instead of starting over.
+"""
+import json
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .core import Composer, DockSwapRepo
+from .doctor import normalize_image
+from .engine import get_engine
+from .errors import DockSwapError
+from .fs import atomic_write, file_lock
+from .timing import History
+
+DEFAULT_PREFETCH_WORKERS = 3
+# starts this old count half as much as starts made now
+FREQUENCY_HALF_LIFE = 7 * 24 * 60 * 60
+# unfinished run older than this is started over instead of resumed
+RESUME_WINDOW = 12 * 60 * 60
+
+
+class PrefetchItem(object):
+    def __init__(self, image: str, projects: List[str], score: float = 0.0):
+        self.image = image
+        self.projects = projects
+        self.score = score
+
+    def __repr__(self):
+        return "PrefetchItem({!r}, {!r}, {:.2f})".format(self.image, self.projects, self.score)
+
+
+def swap_frequency(
+    records: List[Dict[str, Any]], now: Optional[float] = None
+) -> Dict[str, float]:
+    """
+    Number of successful starts per project in history `records`,
+    every start weighted down by its age (see `FREQUENCY_HALF_LIFE`).
+    """
+    now = time.time() if now is None else now
+    frequency: Dict[str, float] = {}
+    for record in records:
+        if record.get("command") != "start" or not record.get("ok") or not record.get("project"):
+            continue
+        age = max(0.0, now - record.get("time", now))
+        weight = 0.5 ** (age / FREQUENCY_HALF_LIFE)
+        frequency[record["project"]] = frequency.get(record["project"], 0.0) + weight
+    return frequency
+
+
+def prefetch_plan(
+    composers: List[Composer], frequency: Optional[Dict[str, float]] = None
+) -> List[PrefetchItem]:
+    """
+    Images of services of `composers` that are not built locally, each one once,
+    ordered by summed `frequency` of projects using it (then by name).
+    Composers which compose files can not be read are skipped.
+    """
+    frequency = frequency or {}
+    items: "OrderedDict[str, PrefetchItem]" = OrderedDict()
+    for composer in composers:
+        try:
+            spec = composer.spec
+        except DockSwapError:
+            continue
+        for service in spec.services.values():
+            if not service.image or service.build:
+                continue
+            image = normalize_image(service.image)
+            item = items.setdefault(image, PrefetchItem(image, []))
+            if composer.project_name not in item.projects:
+                item.projects.append(composer.project_name)
+                item.score += frequency.get(composer.project_name, 0.0)
+    return sorted(items.values(), key=lambda item: (-item.score, item.image))
+
+
+class PrefetchState(object):
+    """Images pulled and failed by the current (possibly interrupted) run."""
+
+    FILE_NAME = "prefetch.json"
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path or DockSwapRepo.get_dockswap_folder() / self.FILE_NAME
+        self.lock_path = self.path.with_name(self.path.name + ".lock")
+        self.started = time.time()
+        self.pulled: Dict[str, float] = {}
+        self.failed: Dict[str, str] = {}
+
+    def load(self, restart: bool = False) -> bool:
+        """Load unfinished run unless `restart` or it is too old, return if it was resumed."""
+        try:
+            with open(self.path, "r") as state_file:
+                data = json.load(state_file)
+        except (OSError, ValueError):
+            return False
+        if restart or data.get("started", 0) < time.time() - RESUME_WINDOW:
+            return False
+        self.started = data["started"]
+        self.pulled = data.get("pulled") or {}
+        return True
+
+    def save(self):
+        atomic_write(
+            self.path,
+            json.dumps({"started": self.started, "pulled": self.pulled, "failed": self.failed}),
+        )
+
+    def finish(self):
+        """Forget finished run, so the next one pulls everything again."""
+        if self.path.exists():
+            self.path.unlink()
+
+
+class PrefetchResult(object):
+    def __init__(self):
+        self.pulled: List[str] = []
+        self.skipped: List[str] = []
+        self.failed: Dict[str, str] = OrderedDict()
+        self.resumed = False
+
+
+def prefetch(
+    composers: List[Composer],
+    workers: int = DEFAULT_PREFETCH_WORKERS,
+    restart: bool = False,
+    engine=None,
+    history: Optional[History] = None,
+    state: Optional[PrefetchState] = None,
+    on_pulled=None,
+) -> PrefetchResult:
+    """
+    Pull images of `composers` (see `prefetch_plan`) with at most `workers`
+    pulls at once, skipping images already pulled by an interrupted run
+    (unless `restart`). `on_pulled(item, error)` is called after every pull.
+    Concurrent prefetches (cron and daemon) run one after another.
+    """
+    engine = engine or get_engine()
+    history = history or History()
+    state = state or PrefetchState()
+    plan = prefetch_plan(composers, swap_frequency(history.records()))
+    result = PrefetchResult()
+
+    state.path.parent.mkdir(parents=True, exist_ok=True)
+    with file_lock(state.lock_path):
+        result.resumed = state.load(restart)
+        result.skipped = [item.image for item in plan if item.image in state.pulled]
+        todo = [item for item in plan if item.image not in state.pulled]
+
+        def pull(item: PrefetchItem):
+            try:
+                engine.pull(item.image)
+            except DockSwapError as error:
+                return item, str(error)
+            return item, None
+
+        def record(item: PrefetchItem, error: Optional[str]):
+            if error:
+                state.failed[item.image] = error
+                result.failed[item.image] = error
+            else:
+                state.pulled[item.image] = time.time()
+                result.pulled.append(item.image)
+            state.save()
+
+        state.save()
+        # pool picks items in submission order, so more frequent images start first
+        executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        futures = [executor.submit(pull, item) for item in todo]
+        recorded = set()
+        try:
+            for future in as_completed(futures):
+                recorded.add(future)
+                item, error = future.result()
+                record(item, error)
+                if on_pulled:
+                    on_pulled(item, error)
+        except BaseException:
+            # interrupted (e.g. Ctrl+C): queued pulls are not started at all,
+            # pulls that finish meanwhile are kept for the next run to skip
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+            for future in futures:
+                if future in recorded or future.cancelled() or future.exception():
+                    continue
+                record(*future.result())
+            state.save()
+            raise
+        executor.shutdown()
+
+        if not result.failed:
+            state.finish()
+    return result
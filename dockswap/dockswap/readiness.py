@@ -0,0 +1,179 @@
+"""
+Waiting until services of a started project are ready.
+
+Containers are inspected once and then docker events are followed, so
+nothing is polled: container is ready once it runs and its healthcheck (if it
+has one) reports healthy, or when it exits with code 0 (one-off jobs).
+Container dying with other code or turning unhealthy fails the wait at once.
+Containers of `docker-compose run` (one-off) are not waited for: `up` does not
+start them and old ones may have exited with any code. For the same reason
+containers that exited before the start being waited for (left over from an
+earlier run and not started again) are ignored.
+"""
+import re
+import time
+import queue
+import calendar
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from .core import Composer
+from .engine import (
+    COMPOSE_ONEOFF_LABEL,
+    COMPOSE_PROJECT_LABEL,
+    COMPOSE_SERVICE_LABEL,
+    Event,
+    get_engine,
+)
+from .errors import DockSwapError
+from .timing import phase
+
+DEFAULT_WAIT_TIMEOUT = 60
+# `State.FinishedAt` of docker inspect, e.g. 2021-03-04T10:20:30.123456789Z
+FINISHED_AT = re.compile(r"(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(\.\d+)?Z$")
+
+READY = "ready"
+WAITING = "waiting"
+
+
+class ServiceState(object):
+    def __init__(self, service: str, running: bool, health: Optional[str]):
+        self.service = service
+        self.running = running
+        self.health = health
+        self.status = WAITING
+        self.update()
+
+    def update(self):
+        if self.running and self.health in (None, "healthy"):
+            self.status = READY
+
+    @classmethod
+    def from_inspect(cls, service: str, data: Dict) -> "ServiceState":
+        state = data.get("State") or {}
+        health = (state.get("Health") or {}).get("Status")
+        service_state = cls(service, state.get("Status") == "running", health)
+        if state.get("Status") in ("exited", "dead"):
+            service_state.exit(state.get("ExitCode", 1))
+        return service_state
+
+    def exit(self, code):
+        if str(code) == "0":
+            self.status = READY
+        else:
+            raise DockSwapError(
+                'Service "{}" died with exit code {}'.format(self.service, code)
+            )
+
+    def apply(self, event: Event):
+        if event.status == "start":
+            self.running = True
+        elif event.status == "die":
+            self.running = False
+            self.exit(event.attributes.get("exitCode", "unknown"))
+        elif event.status == "health_status":
+            self.health = event.action.split(":", 1)[1].strip()
+            if self.health == "unhealthy":
+                raise DockSwapError('Service "{}" is unhealthy'.format(self.service))
+        self.update()
+
+
+def finished_at(data: Dict) -> Optional[float]:
+    """Time (UNIX) inspected container exited at, `None` if it is not known."""
+    match = FINISHED_AT.match((data.get("State") or {}).get("FinishedAt") or "")
+    if not match:
+        return None
+    seconds = calendar.timegm(time.strptime(match.group(1), "%Y-%m-%dT%H:%M:%S"))
+    return seconds + float("0" + (match.group(2) or ""))
+
+
+def exited_before(data: Dict, since: float) -> bool:
+    """Whether inspected container is not running since before `since`."""
+    state = data.get("State") or {}
+    finished = finished_at(data)
+    return state.get("Status") in ("exited", "dead") and finished is not None and finished < since
+
+
+def wait_until_ready(
+    composer: Composer,
+    only: Optional[List[str]] = None,
+    timeout: float = DEFAULT_WAIT_TIMEOUT,
+    engine=None,
+    since: Optional[float] = None,
+) -> List[str]:
+    """
+    Wait until containers of `composer` (or of `only` services) are ready
+    and return their services. Raise `DockSwapError` if a container dies
+    or if they are not ready in `timeout` seconds. Containers that exited
+    before `since` (time the project was started at) are not waited for.
+    """
+    engine = engine or get_engine()
+    project = composer.compose_project_name
+    deadline = time.monotonic() + timeout
+
+    def wanted(labels: Dict[str, str]) -> bool:
+        return (
+            labels.get(COMPOSE_PROJECT_LABEL) == project
+            and labels.get(COMPOSE_ONEOFF_LABEL, "False") != "True"
+            and (not only or labels.get(COMPOSE_SERVICE_LABEL) in only)
+        )
+
+    with phase("wait"):
+        # subscribe before looking at containers, so that no change is missed
+        stream = engine.events()
+        events: "queue.Queue[Optional[Event]]" = queue.Queue()
+
+        def read():
+            for event in stream:
+                events.put(event)
+            events.put(None)
+
+        reader = threading.Thread(target=read, daemon=True)
+        reader.start()
+        try:
+            states: Dict[str, ServiceState] = OrderedDict()
+            for container in engine.list_containers(all=True):
+                if not wanted(container.labels):
+                    continue
+                data = engine.inspect(container.id)
+                if since is not None and exited_before(data, since):
+                    # left over from an earlier run, `up` did not start it again
+                    continue
+                states[container.id] = ServiceState.from_inspect(
+                    container.service or container.name, data
+                )
+
+            while any(state.status != READY for state in states.values()):
+                try:
+                    event = events.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    raise DockSwapError(
+                        "Services are not ready after {} seconds: {}".format(
+                            timeout,
+                            ", ".join(
+                                state.service
+                                for state in states.values()
+                                if state.status != READY
+                            ),
+                        )
+                    )
+                if event is None:
+                    raise DockSwapError("Docker events stream ended unexpectedly")
+
+                if event.id in states and event.status == "destroy":
+                    # replaced by a recreated container, which is followed by its start
+                    del states[event.id]
+                elif event.id in states:
+                    states[event.id].apply(event)
+                elif event.status == "start" and wanted(event.attributes):
+                    # container (re)created by docker-compose after we looked
+                    states[event.id] = ServiceState.from_inspect(
+                        event.attributes.get(COMPOSE_SERVICE_LABEL, event.id),
+                        engine.inspect(event.id),
+                    )
+        finally:
+            stream.close()
+            reader.join(timeout=1)
+
+    return [state.service for state in states.values()]
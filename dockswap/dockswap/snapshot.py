@@ -0,0 +1,431 @@
+"""
+Snapshots of named volumes of a project, so that a seeded database can be
+brought back in seconds instead of seeding it again.
+
+Volumes declared in compose file are copied by a short-lived helper container
+(`DOCKSWAP_SNAPSHOT_IMAGE`, GNU coreutils and tar are needed) while containers
+of the project are stopped:
+
+* `reflink` - into a new docker volume with `cp --reflink=always`, which only
+  clones extents on copy-on-write filesystems (btrfs, xfs, zfs...) and takes
+  no extra space until files change.
+* `tar` - as gzipped tar streamed into ~/.dockswap/snapshots/<project>/.
+
+`auto` method tries `reflink` and falls back to `tar` where docker's volume
+filesystem can not clone files. Hardlinks are never used: databases modify
+files in place, which would modify the snapshot as well.
+
+Snapshots of every project are listed in ~/.dockswap/snapshots/<project>/index.json.
+"""
+import os
+import re
+import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import IO, Any, Dict, List, Optional
+
+from .core import Composer, DockSwapRepo
+from .engine import docker_binary, get_engine
+from .errors import CommandError, DockSwapError
+from .execution import run_captured, tail
+from .fs import atomic_write, file_lock
+from .timing import phase
+
+METHODS = ("auto", "reflink", "tar")
+DEFAULT_IMAGE = "debian:stable-slim"
+DEFAULT_WORKERS = 4
+SNAPSHOT_LABEL = "dockswap.snapshot"
+NAME_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+# directory in restored volume the snapshot is copied into before it replaces content
+RESTORE_STAGING = ".dockswap_restore"
+
+
+def snapshot_image() -> str:
+    return os.environ.get("DOCKSWAP_SNAPSHOT_IMAGE", DEFAULT_IMAGE)
+
+
+def snapshots_dir() -> Path:
+    return DockSwapRepo.get_dockswap_folder() / "snapshots"
+
+
+class SnapshotIndex(object):
+    """Snapshots of one project: name -> creation time and copies of its volumes."""
+
+    FILE_NAME = "index.json"
+
+    def __init__(self, project_name: str, directory: Optional[Path] = None):
+        self.project_name = project_name
+        self.directory = directory or snapshots_dir() / project_name
+        self.path = self.directory / self.FILE_NAME
+        self.lock_path = self.directory / (self.FILE_NAME + ".lock")
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path, "r") as index_file:
+                return json.load(index_file)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, name: str) -> Dict[str, Any]:
+        snapshot = self.load().get(name)
+        if snapshot is None:
+            raise DockSwapError(
+                'No snapshot "{}" of "{}". Available snapshots: {}'.format(
+                    name, self.project_name, ", ".join(sorted(self.load())) or "none"
+                )
+            )
+        return snapshot
+
+    def save(self, name: str, snapshot: Dict[str, Any]):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with file_lock(self.lock_path):
+            snapshots = self.load()
+            snapshots[name] = snapshot
+            atomic_write(self.path, json.dumps(snapshots, indent=2, sort_keys=True))
+
+    def delete(self, name: str):
+        if not self.path.exists():
+            return
+        with file_lock(self.lock_path):
+            snapshots = self.load()
+            snapshots.pop(name, None)
+            atomic_write(self.path, json.dumps(snapshots, indent=2, sort_keys=True))
+
+
+def docker(
+    args: List[str],
+    phase_name: str = "docker",
+    stdin: Optional[IO[bytes]] = None,
+    stdout: Optional[IO[bytes]] = None,
+) -> str:
+    """
+    Run docker command within deadline of `phase_name` (see execution.py),
+    `stdin` and `stdout` can be files to stream volume content through.
+    Raise `CommandError` if it fails, return its output otherwise.
+    """
+    args = [docker_binary()] + args
+    started = time.monotonic()
+    result = run_captured(args, phase_name, stdin=stdin, stdout=stdout)
+    if result.returncode != 0:
+        raise CommandError(
+            " ".join(args),
+            result.returncode,
+            tail(result.stderr),
+            time.monotonic() - started,
+        )
+    return result.stdout or ""
+
+
+def helper(mounts: Dict[str, str], script: str, interactive: bool = False) -> List[str]:
+    """Arguments of `docker run` running `script` with volumes mounted as `mounts`."""
+    args = ["run", "--rm"] + (["-i"] if interactive else [])
+    for volume, target in mounts.items():
+        args += ["-v", "{}:{}".format(volume, target)]
+    return args + [snapshot_image(), "sh", "-c", script]
+
+
+def validate_name(name: str):
+    if not NAME_PATTERN.match(name):
+        raise DockSwapError(
+            'Invalid snapshot name "{}": use letters, digits, "_", "." and "-"'.format(name)
+        )
+
+
+def project_volumes(composer: Composer) -> Dict[str, str]:
+    """Named volumes declared in compose file of `composer`: name in file -> docker volume."""
+    spec = composer.spec
+    project = composer.compose_project_name
+    return {volume: spec.volume_name(volume, project) for volume in spec.volumes}
+
+
+def existing_volumes() -> List[str]:
+    return docker(["volume", "ls", "-q"]).split()
+
+
+def ensure_stopped(composer: Composer, engine=None):
+    """Volumes are copied only while no container of the project uses them."""
+    project = composer.compose_project_name
+    running = [
+        container.name or container.id
+        for container in (engine or get_engine()).list_containers()
+        if container.project == project
+    ]
+    if running:
+        raise DockSwapError(
+            'Containers of "{}" are running ({}), stop it first: dockswap stop {}'.format(
+                composer.project_name, ", ".join(sorted(running)), composer.project_name
+            )
+        )
+
+
+def snapshot_volume_name(compose_project: str, name: str, volume: str) -> str:
+    """Name of volume holding copy of `volume`, made of names docker accepts in volume names."""
+    return "dockswap_snapshot_{}_{}_{}".format(compose_project, name, volume)
+
+
+def copy_reflink(source: str, target: str, label: str):
+    """Clone `source` into new volume `target`, raises `CommandError` if filesystem can not."""
+    docker(["volume", "create", "--label", "{}={}".format(SNAPSHOT_LABEL, label), target])
+    try:
+        docker(
+            helper(
+                {source: "/from:ro", target: "/to"},
+                "cp -a --reflink=always /from/. /to/",
+            ),
+            "volume_snapshot",
+        )
+    except DockSwapError:
+        remove_volume(target)
+        raise
+
+
+def copy_tar(source: str, archive: Path):
+    """Stream `source` as gzipped tar into `archive` (replaced only when complete)."""
+    partial = archive.with_name(archive.name + ".partial")
+    try:
+        with open(partial, "wb") as archive_file:
+            docker(
+                helper({source: "/volume:ro"}, "tar -C /volume -czf - ."),
+                "volume_snapshot",
+                stdout=archive_file,
+            )
+        os.replace(str(partial), str(archive))
+    finally:
+        if partial.exists():
+            partial.unlink()
+
+
+def remove_volume(volume: str):
+    try:
+        docker(["volume", "rm", "-f", volume])
+    except DockSwapError:
+        pass
+
+
+def snapshot_one(
+    index: SnapshotIndex,
+    compose_project: str,
+    name: str,
+    storage: str,
+    volume: str,
+    source: str,
+    method: str,
+) -> Dict[str, Any]:
+    """Copy `volume` of snapshot `name`, naming the copy after `storage`."""
+    label = "{}/{}".format(index.project_name, name)
+    if method in ("auto", "reflink"):
+        target = snapshot_volume_name(compose_project, storage, volume)
+        try:
+            copy_reflink(source, target, label)
+        except DockSwapError:
+            if method == "reflink":
+                raise
+        else:
+            return {"source": source, "method": "reflink", "volume": target}
+
+    archive = index.directory / storage / "{}.tar.gz".format(volume)
+    archive.parent.mkdir(parents=True, exist_ok=True)
+    copy_tar(source, archive)
+    return {
+        "source": source,
+        "method": "tar",
+        "archive": str(archive),
+        "size": archive.stat().st_size,
+    }
+
+
+def drop_copies(volumes: Dict[str, Dict[str, Any]], directory: Optional[Path] = None):
+    """Remove copies of `volumes`, then directories of archives (and `directory`) if empty."""
+    directories = {directory} if directory else set()
+    for copy in volumes.values():
+        if copy["method"] == "reflink":
+            remove_volume(copy["volume"])
+            continue
+        archive = Path(copy["archive"])
+        directories.add(archive.parent)
+        if archive.exists():
+            archive.unlink()
+    for empty in directories:
+        try:
+            empty.rmdir()
+        except OSError:
+            pass
+
+
+def create_snapshot(
+    composer: Composer,
+    name: str,
+    method: str = "auto",
+    replace: bool = False,
+    workers: int = DEFAULT_WORKERS,
+    engine=None,
+) -> Dict[str, Any]:
+    """
+    Copy named volumes of `composer` into snapshot `name` using `method`
+    (see module docstring) and add it to index of the project. With `replace`,
+    copies of the existing snapshot are dropped only after the new ones are
+    made and indexed, so a failed replace keeps the old snapshot.
+    """
+    validate_name(name)
+    if method not in METHODS:
+        raise DockSwapError(
+            'Unknown snapshot method "{}", use one of: {}'.format(method, ", ".join(METHODS))
+        )
+    index = SnapshotIndex(composer.project_name)
+    previous = index.load().get(name)
+    if previous is not None and not replace:
+        raise DockSwapError(
+            'Snapshot "{}" of "{}" already exists, use --replace to overwrite it'.format(
+                name, composer.project_name
+            )
+        )
+    volumes = project_volumes(composer)
+    if not volumes:
+        raise DockSwapError(
+            'Compose file of "{}" declares no named volumes'.format(composer.project_name)
+        )
+    ensure_stopped(composer, engine)
+    existing = set(existing_volumes())
+    missing = [source for source in volumes.values() if source not in existing]
+    if missing:
+        raise DockSwapError(
+            "Volume(s) {} do not exist yet, start project at least once".format(
+                ", ".join(missing)
+            )
+        )
+
+    # copies replacing an existing snapshot must not overwrite the ones it uses
+    storage = name if previous is None else "{}.{}".format(name, uuid.uuid4().hex[:8])
+    project = composer.compose_project_name
+    copies: Dict[str, Dict[str, Any]] = {}
+    with phase("snapshot"), ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {
+            volume: executor.submit(
+                snapshot_one, index, project, name, storage, volume, source, method
+            )
+            for volume, source in volumes.items()
+        }
+        errors = []
+        for volume, future in futures.items():
+            try:
+                copies[volume] = future.result()
+            except DockSwapError as error:
+                errors.append("  {}: {}".format(volume, error))
+    if errors:
+        drop_copies(copies, index.directory / storage)
+        raise DockSwapError("Failed to snapshot volume(s):\n{}".format("\n".join(errors)))
+
+    snapshot = {"created": time.time(), "volumes": copies}
+    index.save(name, snapshot)
+    if previous is not None:
+        drop_copies(previous["volumes"])
+    return snapshot
+
+
+def restore_script(fill: str) -> str:
+    """
+    Script of helper container restoring volume mounted at /volume: `fill` copies
+    snapshot into staging directory on the same filesystem and only if it succeeds,
+    current content is dropped and staged files are moved (renamed) in its place.
+    A failed copy (corrupt archive, full disk, deadline) leaves current content intact.
+    """
+    return (
+        "set -e; cd /volume; rm -rf {staging}; mkdir {staging}; "
+        "if ! ({fill}); then rm -rf {staging}; exit 1; fi; "
+        "find . -mindepth 1 -maxdepth 1 ! -name {staging} -exec rm -rf {{}} +; "
+        "find {staging} -mindepth 1 -maxdepth 1 -exec mv {{}} . \\;; "
+        "chmod --reference={staging} . && chown --reference={staging} .; "
+        "rmdir {staging}"
+    ).format(staging=RESTORE_STAGING, fill=fill)
+
+
+def restore_one(project: str, volume: str, copy: Dict[str, Any]):
+    target = copy["source"]
+    if target not in existing_volumes():
+        # labelled like docker-compose would, so that it adopts the volume
+        docker(
+            [
+                "volume",
+                "create",
+                "--label",
+                "com.docker.compose.project={}".format(project),
+                "--label",
+                "com.docker.compose.volume={}".format(volume),
+                target,
+            ]
+        )
+    if copy["method"] == "reflink":
+        docker(
+            helper(
+                {copy["volume"]: "/from:ro", target: "/volume"},
+                restore_script("cp -a --reflink=auto /from/. {}/".format(RESTORE_STAGING)),
+            ),
+            "volume_restore",
+        )
+        return
+
+    with open(copy["archive"], "rb") as archive_file:
+        docker(
+            helper(
+                {target: "/volume"},
+                restore_script("tar -C {} -xzf -".format(RESTORE_STAGING)),
+                interactive=True,
+            ),
+            "volume_restore",
+            stdin=archive_file,
+        )
+
+
+def restore_snapshot(
+    composer: Composer, name: str, workers: int = DEFAULT_WORKERS, engine=None
+) -> Dict[str, Any]:
+    """Replace content of volumes of `composer` with the one of snapshot `name`."""
+    snapshot = SnapshotIndex(composer.project_name).get(name)
+    missing = [
+        copy["archive"]
+        for copy in snapshot["volumes"].values()
+        if copy["method"] == "tar" and not os.path.exists(copy["archive"])
+    ]
+    if missing:
+        raise DockSwapError(
+            'Snapshot "{}" is incomplete, missing: {}'.format(name, ", ".join(missing))
+        )
+    ensure_stopped(composer, engine)
+
+    project = composer.compose_project_name
+    with phase("restore"), ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {
+            volume: executor.submit(restore_one, project, volume, copy)
+            for volume, copy in snapshot["volumes"].items()
+        }
+        errors = []
+        for volume, future in futures.items():
+            try:
+                future.result()
+            except DockSwapError as error:
+                errors.append("  {}: {}".format(volume, error))
+    if errors:
+        raise DockSwapError("Failed to restore volume(s):\n{}".format("\n".join(errors)))
+    return snapshot
+
+
+def delete_snapshot(composer: Composer, name: str):
+    index = SnapshotIndex(composer.project_name)
+    snapshot = index.get(name)
+    drop_copies(snapshot["volumes"])
+    index.delete(name)
+
+
+def describe(name: str, snapshot: Dict[str, Any]) -> str:
+    copies = snapshot["volumes"]
+    methods = sorted({copy["method"] for copy in copies.values()})
+    size = sum(copy.get("size", 0) for copy in copies.values())
+    return "{} ({}, {} volume(s), {}{})".format(
+        name,
+        time.strftime("%Y-%m-%d %H:%M", time.localtime(snapshot["created"])),
+        len(copies),
+        "+".join(methods),
+        ", {:.1f}MB".format(size / 1024 / 1024) if size else "",
+    )
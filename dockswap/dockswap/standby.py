@@ -0,0 +1,359 @@
+import os
+import json
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from .core import Composer, DockSwapRepo
+from .engine import docker_binary, get_engine, parse_size
+from .errors import DockSwapError
+from .fs import atomic_write, file_lock
+from .swap import plan_swap
+from .teardown import DEFAULT_STOP_TIMEOUT, DEFAULT_WORKERS, teardown, teardown_command
+from .timing import phase
+from .top import CgroupSampler
+
+DEFAULT_STANDBY_COUNT = 2
+
+
+class StandbyPool(object):
+    """
+    Projects kept in warm standby: their containers are paused instead of being
+    stopped, so swapping back to them only needs `docker unpause`.
+    Pool is stored in ~/.dockswap/standby.json ordered from least
+    to most recently used project and is limited by number of projects
+    (`DOCKSWAP_STANDBY_COUNT`) and their total memory (`DOCKSWAP_STANDBY_MEMORY`).
+    """
+
+    FILE_NAME = "standby.json"
+
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        count: Optional[int] = None,
+        memory: Optional[str] = None,
+    ):
+        self.path = path or DockSwapRepo.get_dockswap_folder() / self.FILE_NAME
+        self.lock_path = self.path.with_name(self.path.name + ".lock")
+
+        if count is None:
+            count = int(os.environ.get("DOCKSWAP_STANDBY_COUNT", DEFAULT_STANDBY_COUNT))
+        if memory is None:
+            memory = os.environ.get("DOCKSWAP_STANDBY_MEMORY")
+        self.count = count
+        self.memory = parse_size(memory) if memory else None
+
+        self.entries: Dict[str, Dict] = self.load()
+
+    def load(self) -> "OrderedDict[str, Dict]":
+        try:
+            with open(self.path, "r") as pool_file:
+                entries = json.load(pool_file)
+        except (OSError, ValueError):
+            entries = []
+        return OrderedDict((entry["project_name"], entry) for entry in entries)
+
+    @contextmanager
+    def locked(self):
+        """
+        Hold lock of the pool while in context. Entries are loaded again under
+        the lock, so that changes made and saved in context are not lost to
+        concurrent runs.
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with file_lock(self.lock_path):
+            self.entries = self.load()
+            yield self
+
+    def save(self):
+        """Write entries, must be called in `locked` context."""
+        atomic_write(self.path, json.dumps(list(self.entries.values())))
+
+    def add(self, project_name: str, compose_project: str, memory: int):
+        """Put project into pool as the most recently used one."""
+        self.entries.pop(project_name, None)
+        self.entries[project_name] = {
+            "project_name": project_name,
+            "compose_project": compose_project,
+            "memory": memory,
+            "paused_at": time.time(),
+        }
+
+    def remove(self, project_name: str) -> Optional[Dict]:
+        return self.entries.pop(project_name, None)
+
+    @property
+    def total_memory(self) -> int:
+        return sum(entry["memory"] for entry in self.entries.values())
+
+    def over_budget(self) -> List[str]:
+        """Least recently used projects that have to be evicted to fit the budget."""
+        evicted = []
+        names = list(self.entries)
+        memory = self.total_memory
+        while names and (
+            len(names) > self.count or (self.memory is not None and memory > self.memory)
+        ):
+            name = names.pop(0)
+            memory -= self.entries[name]["memory"]
+            evicted.append(name)
+        return evicted
+
+
+def memory_usage(engine, ids: List[str]) -> Dict[str, int]:
+    """
+    Memory (in bytes) of containers with `ids` read from cgroup filesystem,
+    containers not found there are sampled with one `docker stats`.
+    """
+    sampler = CgroupSampler()
+    usage = {}
+    for container_id in ids:
+        counters = sampler.read(container_id)
+        if counters is not None:
+            usage[container_id] = counters[0]
+    missing = [container_id for container_id in ids if container_id not in usage]
+    if missing:
+        usage.update(engine.memory_usage(missing))
+    return usage
+
+
+def raise_for_failures(action: str, name: str, failures: Dict[str, str]):
+    """Raise error for containers of project `name` that docker failed to `action`."""
+    if failures:
+        raise DockSwapError(
+            'Could not {} containers of "{}": {}'.format(
+                action, name, "; ".join(failures.values())
+            )
+        )
+
+
+def pause_and_evict(
+    result: "StandbyResult",
+    pool: StandbyPool,
+    engine,
+    registered: Dict[str, Composer],
+    plan,
+    to_pause: Dict[str, List[str]],
+    not_paused: Set[str],
+    evicted: List[str],
+    dry: bool,
+    timeout: int,
+    workers: int,
+):
+    """
+    Pause containers of `to_pause` projects and stop `evicted` ones. Projects are
+    discarded from `not_paused` as soon as they are paused, evicted ones are
+    removed from `pool` only once they are stopped.
+    """
+    docker = docker_binary()
+    for name, running in to_pause.items():
+        if name in evicted:
+            continue
+        result.commands.append("{} pause {}".format(docker, " ".join(running)))
+        if not dry:
+            with phase("pause"):
+                paused, failures = engine.pause(running)
+            if paused:
+                # partially paused project stays in pool, evicting it unpauses them
+                not_paused.discard(name)
+            raise_for_failures("pause", name, failures)
+        result.paused.append(name)
+
+    for name in evicted:
+        entry = pool.entries[name]
+        other = registered.get(entry["compose_project"])
+        containers = plan.foreign.get(entry["compose_project"], [])
+        paused = [c.id for c in containers if c.state == "paused"]
+        if paused:
+            result.commands.append("{} unpause {}".format(docker, " ".join(paused)))
+        if other:
+            result.commands.append(other.stop(dry=True))
+        else:
+            result.commands.append(
+                teardown_command(remove=True, timeout=timeout, containers=containers)
+            )
+        if not dry:
+            # project stays in pool until its containers are resumed and stopped
+            with phase("unpause"):
+                _, failures = engine.unpause(paused)
+            raise_for_failures("unpause", name, failures)
+            if other:
+                other.stop()
+            else:
+                teardown(
+                    remove=True,
+                    timeout=timeout,
+                    workers=workers,
+                    engine=engine,
+                    containers=containers,
+                ).raise_for_failures()
+        pool.remove(name)
+        result.evicted.append(name)
+
+
+def published_ports(composer: Composer) -> Set[str]:
+    """Host ports published by services of `composer` (empty if compose file can not be read)."""
+    try:
+        spec = composer.spec
+    except DockSwapError:
+        return set()
+
+    ports = set()
+    for service in spec.services.values():
+        for port in service.ports:
+            parts = port.split(":")
+            # "8000:80" or "127.0.0.1:8000:80", but not just "80" (random host port)
+            if len(parts) >= 2 and parts[-2]:
+                ports.add(parts[-2])
+    return ports
+
+
+class StandbyResult(object):
+    def __init__(self):
+        self.paused: List[str] = []
+        self.evicted: List[str] = []
+        self.warm = False
+        self.commands: List[str] = []
+
+
+def standby_swap(
+    composer: Composer,
+    repo: DockSwapRepo,
+    pool: Optional[StandbyPool] = None,
+    engine=None,
+    only: Optional[List[str]] = None,
+    remove_other: bool = False,
+    dry: bool = False,
+    timeout: int = DEFAULT_STOP_TIMEOUT,
+    workers: int = DEFAULT_WORKERS,
+) -> StandbyResult:
+    """
+    Swap to `composer` pausing running registered projects instead of stopping them.
+    If `composer` itself is paused in the pool it is just unpaused.
+    Projects over pool budget (least recently used first) and projects publishing
+    the same host ports as `composer` are really stopped.
+    Containers of unregistered projects are torn down only if `remove_other`.
+    """
+    engine = engine or get_engine()
+    pool = pool or StandbyPool()
+    with pool.locked():
+        return swap_with_pool(
+            composer, repo, pool, engine, only, remove_other, dry, timeout, workers
+        )
+
+
+def swap_with_pool(
+    composer: Composer,
+    repo: DockSwapRepo,
+    pool: StandbyPool,
+    engine,
+    only: Optional[List[str]],
+    remove_other: bool,
+    dry: bool,
+    timeout: int,
+    workers: int,
+) -> StandbyResult:
+    result = StandbyResult()
+    docker = docker_binary()
+
+    plan = plan_swap(composer, engine)
+    registered = {
+        other.compose_project_name: other
+        for other in repo.get_all()
+        if other.project_name != composer.project_name
+    }
+
+    # running registered projects go to pool, the rest is unregistered
+    to_pause: Dict[str, List[str]] = OrderedDict()
+    compose_projects: Dict[str, str] = {}
+    unregistered = []
+    for project, containers in plan.foreign.items():
+        other = registered.get(project)
+        if other is None:
+            unregistered.extend(containers)
+            continue
+
+        running = [c.id for c in containers if c.running]
+        if running:
+            to_pause[other.project_name] = running
+            compose_projects[other.project_name] = project
+
+    # memory of paused projects is only measured when it is limited
+    usage: Dict[str, int] = {}
+    if pool.memory is not None and to_pause:
+        with phase("stats"):
+            usage = memory_usage(engine, [i for ids in to_pause.values() for i in ids])
+    for name, running in to_pause.items():
+        pool.add(name, compose_projects[name], sum(usage.get(i, 0) for i in running))
+
+    # evict projects that do not fit and those that would clash on ports
+    target_entry = pool.remove(composer.project_name)
+    target_ports = published_ports(composer)
+    evicted = pool.over_budget()
+    for name, entry in pool.entries.items():
+        other = registered.get(entry["compose_project"])
+        if name not in evicted and other and published_ports(other) & target_ports:
+            evicted.append(name)
+
+    paused_target = [c.id for c in plan.keep if c.state == "paused"]
+    stopped_target = [c.id for c in plan.keep if c.state not in ("paused", "running")]
+    # until they really are paused, projects being paused must not stay in pool,
+    # and until paused target is resumed, it must stay there (see `finally`)
+    not_paused = set(to_pause)
+    if not paused_target:
+        target_entry = None
+    try:
+        pause_and_evict(
+            result,
+            pool,
+            engine,
+            registered,
+            plan,
+            to_pause,
+            not_paused,
+            evicted,
+            dry,
+            timeout,
+            workers,
+        )
+
+        if remove_other and unregistered:
+            result.commands.append(
+                teardown_command(remove=True, timeout=timeout, containers=unregistered)
+            )
+            if not dry:
+                teardown(
+                    remove=True,
+                    timeout=timeout,
+                    workers=workers,
+                    engine=engine,
+                    containers=unregistered,
+                ).raise_for_failures()
+
+        # resume target project
+        result.warm = bool(paused_target) and not stopped_target and not only
+        if paused_target:
+            result.commands.append("{} unpause {}".format(docker, " ".join(paused_target)))
+            if not dry:
+                with phase("unpause"):
+                    _, failures = engine.unpause(paused_target)
+                raise_for_failures("unpause", composer.project_name, failures)
+            target_entry = None
+        if not result.warm:
+            result.commands.append(composer.start(dry=True, only=only))
+            if not dry:
+                composer.start(only=only)
+    finally:
+        # pool is saved even if swap failed half way, so that projects paused
+        # so far are not left paused outside of it
+        if not dry:
+            for name in not_paused:
+                pool.remove(name)
+            if target_entry is not None:
+                pool.entries[composer.project_name] = target_entry
+            pool.save()
+
+    result.commands = [command for command in result.commands if command]
+    return result
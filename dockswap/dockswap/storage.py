@@ -0,0 +1,446 @@
+import os
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple, Type
+from pathlib import Path
+
+from .core import Composer, DockSwapRepo
+from .errors import DockSwapError
+from .fs import atomic_write, file_lock
+
+
+class SQLiteDockSwapRepo(DockSwapRepo):
+    """
+    Repo that keeps composers in SQLite database indexed by project name,
+    so lookups do not load every registered composer and adding or deleting
+    a composer touches only one row.
+
+    Database file is placed next to JSON storage and named after it
+    (e.g. storage.json -> storage.sqlite3). On first use composers
+    from existing JSON storage are migrated into database.
+    SQLite connections can not be shared between threads, so every thread
+    using the repo gets its own connection.
+    """
+
+    DATABASE_SUFFIX = ".sqlite3"
+    MIGRATED_KEY = "migrated_from_json"
+
+    @classmethod
+    def get_database_path(cls) -> Path:
+        return cls.get_dockswap_folder() / Path(cls.STORAGE_PATH).with_suffix(
+            cls.DATABASE_SUFFIX
+        )
+
+    @classmethod
+    def prune(cls):
+        database_path = cls.get_database_path()
+        if not database_path.exists():
+            return
+
+        connection = sqlite3.connect(str(database_path))
+        try:
+            with connection:
+                connection.execute("DELETE FROM composers")
+        finally:
+            connection.close()
+        cls.drop_completion_index()
+
+    def setup(self):
+        self.database_path = self.get_database_path()
+        self.local = threading.local()
+
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS composers ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " project_name TEXT NOT NULL UNIQUE,"
+                " dc_path TEXT NOT NULL,"
+                " env_path TEXT"
+                ")"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS meta ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT"
+                ")"
+            )
+
+        self.migrate()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Connection of the current thread, opened on first use."""
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(str(self.database_path))
+            connection.row_factory = sqlite3.Row
+            self.local.connection = connection
+        return connection
+
+    def migrate(self):
+        """
+        Copy composers from JSON storage into database. This is done only once,
+        JSON storage itself is left untouched. Raise `DockSwapError` if it is corrupted.
+        """
+        with self.connection:
+            # take write lock so that concurrent runs do not migrate twice
+            self.connection.execute("BEGIN IMMEDIATE")
+            migrated = self.connection.execute(
+                "SELECT value FROM meta WHERE key = ?", (self.MIGRATED_KEY,)
+            ).fetchone()
+            if migrated:
+                return
+
+            legacy_data = []
+            if self.storage_path.exists():
+                with open(self.storage_path, "r") as storage_file:
+                    # corrupted storage is an error here too, nothing is migrated
+                    # (and migration is retried) until it is fixed or removed
+                    legacy_data = self.decode(storage_file.read())
+
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO composers (project_name, dc_path, env_path)"
+                " VALUES (:project_name, :dc_path, :env_path)",
+                [
+                    composer.to_dict()
+                    for composer in map(Composer.from_dict, legacy_data)
+                    if composer
+                ],
+            )
+            self.connection.execute(
+                "INSERT INTO meta (key, value) VALUES (?, ?)",
+                (self.MIGRATED_KEY, str(self.storage_path)),
+            )
+
+    @property
+    def loaded_data(self) -> List[Dict[str, str]]:
+        rows = self.connection.execute(
+            "SELECT project_name, dc_path, env_path FROM composers ORDER BY id"
+        )
+        return [dict(row) for row in rows]
+
+    def commit(self, data: List[Dict[str, str]]):
+        with self.connection:
+            self.connection.execute("DELETE FROM composers")
+            self.connection.executemany(
+                "INSERT INTO composers (project_name, dc_path, env_path)"
+                " VALUES (:project_name, :dc_path, :env_path)",
+                data,
+            )
+        self.write_completion_index(data)
+
+    def persist(self, composer: Composer):
+        try:
+            with self.connection:
+                self.connection.execute(
+                    "INSERT INTO composers (project_name, dc_path, env_path)"
+                    " VALUES (:project_name, :dc_path, :env_path)",
+                    composer.to_dict(),
+                )
+        except sqlite3.IntegrityError:
+            raise DockSwapError(
+                'Composer for project "{name}" is already registered.'
+                " Consider removing it first".format(name=composer.project_name)
+            )
+        self.update_completion_index(added=[composer.to_dict()])
+
+    def persist_all(self, composers: List[Composer], rewrite: bool = False):
+        if rewrite:
+            self.commit([c.to_dict() for c in composers])
+            return
+
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO composers (project_name, dc_path, env_path)"
+                " VALUES (:project_name, :dc_path, :env_path)",
+                [c.to_dict() for c in composers],
+            )
+        self.update_completion_index(added=[c.to_dict() for c in composers])
+
+    def get(
+        self, project_name: str, silent_not_found=False
+    ) -> Optional[Composer]:
+        row = self.connection.execute(
+            "SELECT project_name, dc_path, env_path FROM composers"
+            " WHERE project_name = ?",
+            (project_name,),
+        ).fetchone()
+
+        if row:
+            return Composer.from_dict(dict(row))
+
+        if silent_not_found:
+            return None
+
+        raise DockSwapError(
+            'No composer found for "{}". May be register it first?'.format(project_name)
+        )
+
+    def delete(self, project_name: str) -> bool:
+        with self.connection:
+            cursor = self.connection.execute(
+                "DELETE FROM composers WHERE project_name = ?", (project_name,)
+            )
+        if cursor.rowcount > 0:
+            self.update_completion_index(deleted=[project_name])
+        return cursor.rowcount > 0
+
+    def delete_many(self, project_names: List[str]) -> List[str]:
+        deleted = []
+        with self.connection:
+            for project_name in project_names:
+                cursor = self.connection.execute(
+                    "DELETE FROM composers WHERE project_name = ?", (project_name,)
+                )
+                if cursor.rowcount > 0:
+                    deleted.append(project_name)
+        if deleted:
+            self.update_completion_index(deleted=deleted)
+        return deleted
+
+
+class JournalDockSwapRepo(DockSwapRepo):
+    """
+    Repo that never rewrites whole storage on change. Every change is appended
+    as a record to a journal file (e.g. storage.json.journal) under exclusive
+    file lock, so concurrent writers do not lose each other's changes.
+    Once journal grows to `COMPACT_EVERY` records it is compacted into snapshot
+    (JSON storage file itself) which is written atomically with rename.
+    Readers replay snapshot plus journal tail under shared lock.
+    """
+
+    JOURNAL_SUFFIX = ".journal"
+    LOCK_SUFFIX = ".lock"
+    COMPACT_EVERY = int(os.environ.get("DOCKSWAP_JOURNAL_COMPACT_EVERY", "100"))
+
+    @classmethod
+    def get_journal_path(cls) -> Path:
+        storage_path = cls.get_storage_path()
+        return storage_path.with_name(storage_path.name + cls.JOURNAL_SUFFIX)
+
+    @classmethod
+    def get_lock_path(cls) -> Path:
+        storage_path = cls.get_storage_path()
+        return storage_path.with_name(storage_path.name + cls.LOCK_SUFFIX)
+
+    @classmethod
+    def prune(cls):
+        with file_lock(cls.get_lock_path()):
+            for path in (cls.get_storage_path(), cls.get_journal_path()):
+                if path.exists():
+                    path.unlink()
+            cls.drop_completion_index()
+
+    def setup(self):
+        super().setup()
+        self.journal_path = self.get_journal_path()
+        self.lock_path = self.get_lock_path()
+
+    @staticmethod
+    def apply(state: "OrderedDict[str, Dict[str, str]]", record: Dict):
+        """Apply single journal `record` to `state` (composers data by project name)."""
+        op = record.get("op")
+
+        if op == "add":
+            data = record["composer"]
+            state.pop(data["project_name"], None)
+            state[data["project_name"]] = data
+        elif op == "delete":
+            state.pop(record["project_name"], None)
+        elif op == "reset":
+            state.clear()
+            for data in record["composers"]:
+                state[data["project_name"]] = data
+
+    def replay(self) -> Tuple["OrderedDict[str, Dict[str, str]]", int]:
+        """
+        Read snapshot and apply journal records on top of it.
+        Return resulting state and number of records in journal.
+        Must be called while holding the lock.
+        """
+        with open(self.storage_path, "r") as storage_file:
+            snapshot = self.decode(storage_file.read())
+
+        state = OrderedDict(
+            (data["project_name"], data)
+            for data in snapshot
+            if data.get("project_name")
+        )
+
+        records = 0
+        if self.journal_path.exists():
+            with open(self.journal_path, "r") as journal_file:
+                for line in journal_file:
+                    if not line.endswith("\n"):
+                        # torn write of a writer that was killed, skip it
+                        break
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.apply(state, record)
+                    records += 1
+
+        return state, records
+
+    @property
+    def loaded_data(self) -> List[Dict[str, str]]:
+        if not self._loaded_data:
+            with file_lock(self.lock_path, shared=True):
+                state, _ = self.replay()
+            self._loaded_data = list(state.values())
+
+        return self._loaded_data
+
+    def append(
+        self,
+        records: List[Dict],
+        check: Optional[Callable[["OrderedDict[str, Dict[str, str]]"], bool]] = None,
+    ):
+        """
+        Append `records` to journal. `check` is called with current state
+        while holding the lock and may raise to reject the change
+        or return `False` if there is nothing to change.
+        """
+        with file_lock(self.lock_path):
+            state, journal_size = self.replay()
+            if check and check(state) is False:
+                self._loaded_data = list(state.values())
+                return
+
+            for record in records:
+                self.apply(state, record)
+
+            if journal_size + len(records) >= self.COMPACT_EVERY:
+                self.compact(state)
+            else:
+                self.write_records(records)
+            self._loaded_data = list(state.values())
+            self.index_records(records)
+
+    def index_records(self, records: List[Dict]):
+        """Apply `records` to completion index, only reset regenerates all of it."""
+        if any(record.get("op") == "reset" for record in records):
+            self.write_completion_index(self._loaded_data)
+            return
+
+        self.update_completion_index(
+            added=[record["composer"] for record in records if record.get("op") == "add"],
+            deleted=[record["project_name"] for record in records if record.get("op") == "delete"],
+        )
+
+    def write_records(self, records: List[Dict]):
+        payload = "".join(json.dumps(record) + "\n" for record in records)
+
+        with open(self.journal_path, "a+b") as journal_file:
+            journal_file.seek(0, os.SEEK_END)
+            if journal_file.tell():
+                journal_file.seek(-1, os.SEEK_END)
+                if journal_file.read(1) != b"\n":
+                    # terminate torn record so it does not swallow ours
+                    payload = "\n" + payload
+            journal_file.write(payload.encode())
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+
+    def compact(self, state: "OrderedDict[str, Dict[str, str]]"):
+        """
+        Write `state` as new snapshot and truncate journal.
+        If process dies in between, replaying old journal over new
+        snapshot gives the same state, so nothing is lost.
+        """
+        atomic_write(self.storage_path, json.dumps(list(state.values())))
+        with open(self.journal_path, "w") as journal_file:
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+
+    def commit(self, data: List[Dict[str, str]]):
+        self.append([{"op": "reset", "composers": data}])
+
+    def persist(self, composer: Composer):
+        def check(state):
+            if composer.project_name in state:
+                raise DockSwapError(
+                    'Composer for project "{name}" is already registered.'
+                    " Consider removing it first".format(name=composer.project_name)
+                )
+
+        self.append([{"op": "add", "composer": composer.to_dict()}], check=check)
+
+    def persist_all(self, composers: List[Composer], rewrite: bool = False):
+        if rewrite:
+            self.commit([c.to_dict() for c in composers])
+        else:
+            self.append([{"op": "add", "composer": c.to_dict()} for c in composers])
+
+    def delete(self, project_name: str) -> bool:
+        existed = []
+
+        def check(state):
+            existed.append(project_name in state)
+            return existed[0]
+
+        self.append([{"op": "delete", "project_name": project_name}], check=check)
+        return existed[0]
+
+    def delete_many(self, project_names: List[str]) -> List[str]:
+        records = [{"op": "delete", "project_name": name} for name in project_names]
+
+        def check(state):
+            # journal only deletions of composers that exist
+            records[:] = [record for record in records if record["project_name"] in state]
+            return bool(records)
+
+        self.append(records, check=check)
+        return [record["project_name"] for record in records]
+
+
+BACKENDS: Dict[str, Type[DockSwapRepo]] = {
+    "json": DockSwapRepo,
+    "sqlite": SQLiteDockSwapRepo,
+    "journal": JournalDockSwapRepo,
+}
+
+
+def get_repo_class(backend: Optional[str] = None) -> Type[DockSwapRepo]:
+    """
+    Get repo class for storage `backend`. If `backend` is not specified then
+    it is taken from `DOCKSWAP_STORAGE_BACKEND` environment variable (defaults to json).
+    """
+    backend = backend or os.environ.get("DOCKSWAP_STORAGE_BACKEND", "json")
+
+    try:
+        return BACKENDS[backend.lower()]
+    except KeyError:
+        raise DockSwapError(
+            'Unknown storage backend "{}". Choose one of: {}'.format(
+                backend, ", ".join(BACKENDS)
+            )
+        )
+
+
+class LazyRepo(object):
+    """
+    Proxy to a repo of configured storage backend. Repo itself (and so
+    ~/.dockswap folder) is created only when proxy is used for the first time.
+    """
+
+    def __init__(self, backend: Optional[str] = None):
+        object.__setattr__(self, "_backend", backend)
+        object.__setattr__(self, "_repo", None)
+
+    def get_repo(self) -> DockSwapRepo:
+        if self._repo is None:
+            object.__setattr__(self, "_repo", get_repo_class(self._backend)())
+        return self._repo
+
+    def __getattr__(self, name):
+        return getattr(self.get_repo(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.get_repo(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self.get_repo(), name)
@@ -0,0 +1,157 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from .core import Composer
+from .engine import Container, get_engine
+from .teardown import DEFAULT_STOP_TIMEOUT, DEFAULT_WORKERS, TeardownReport
+from .teardown import teardown, teardown_command
+from .timing import phase
+
+UNLABELLED = ""
+
+
+class SwapPlan(object):
+    """
+    Minimal set of changes needed to swap to `composer`: containers of other
+    projects are torn down, while containers of target project are kept
+    as is (docker-compose leaves already running services alone).
+    """
+
+    def __init__(
+        self,
+        composer: Composer,
+        keep: List[Container],
+        foreign: "OrderedDict[str, List[Container]]",
+    ):
+        self.composer = composer
+        self.keep = keep
+        self.foreign = foreign
+
+    @property
+    def project(self) -> str:
+        return self.composer.compose_project_name
+
+    @property
+    def teardown_containers(self) -> List[Container]:
+        return [c for containers in self.foreign.values() for c in containers]
+
+    @property
+    def running_services(self) -> List[str]:
+        return sorted({c.service or c.name for c in self.keep if c.running})
+
+    def describe(self) -> List[str]:
+        """Human readable lines describing the plan."""
+        lines = []
+        if self.keep:
+            lines.append(
+                'keep project "{}": {}'.format(
+                    self.project, ", ".join(self.running_services) or "no running services"
+                )
+            )
+        for project, containers in self.foreign.items():
+            lines.append(
+                "tear down {}: {}".format(
+                    'project "{}"'.format(project) if project else "containers without project",
+                    ", ".join(c.name or c.id for c in containers),
+                )
+            )
+        if not lines:
+            lines.append("nothing to tear down")
+        return lines
+
+    def command(self, timeout: int = DEFAULT_STOP_TIMEOUT) -> Optional[str]:
+        """Docker command(s) tearing down foreign containers, `None` if there are none."""
+        return teardown_command(
+            remove=True, timeout=timeout, containers=self.teardown_containers
+        )
+
+    def execute(
+        self,
+        timeout: int = DEFAULT_STOP_TIMEOUT,
+        workers: int = DEFAULT_WORKERS,
+        engine=None,
+    ) -> TeardownReport:
+        return teardown(
+            remove=True,
+            timeout=timeout,
+            workers=workers,
+            engine=engine,
+            containers=self.teardown_containers,
+        )
+
+
+def group_by_project(containers: List[Container]) -> Dict[str, List[Container]]:
+    """Group containers by docker-compose project label (`UNLABELLED` for the rest)."""
+    groups: Dict[str, List[Container]] = OrderedDict()
+    for container in containers:
+        groups.setdefault(container.project or UNLABELLED, []).append(container)
+    return groups
+
+
+def plan_swap(composer: Composer, engine=None) -> SwapPlan:
+    engine = engine or get_engine()
+    with phase("list"):
+        containers = engine.list_containers(all=True)
+    groups = group_by_project(containers)
+    keep = groups.pop(composer.compose_project_name, [])
+    return SwapPlan(composer, keep, groups)
+
+
+def prepare(composer: Composer, only: Optional[List[str]] = None, create: bool = False):
+    """Pull images of `composer` and, if `create`, create its containers."""
+    composer.pull(only=only)
+    if create:
+        composer.create(only=only)
+
+
+def pipelined_swap(
+    composer: Composer,
+    plan: Optional[SwapPlan] = None,
+    only: Optional[List[str]] = None,
+    create: bool = False,
+    timeout: int = DEFAULT_STOP_TIMEOUT,
+    workers: int = DEFAULT_WORKERS,
+):
+    """
+    Swap to `composer` overlapping teardown of other projects (if there is a `plan`)
+    with pulling (and creating) containers of `composer`. Final `up` then only
+    has to start already present containers, so swap takes about
+    max(teardown, pull) instead of their sum.
+    """
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        prepared = executor.submit(prepare, composer, only, create)
+        torn_down = executor.submit(plan.execute, timeout, workers) if plan else None
+
+        # wait for both before raising, so nothing is left running in background
+        errors = [future.exception() for future in (prepared, torn_down) if future]
+
+    for error in errors:
+        if error:
+            raise error
+    if torn_down:
+        torn_down.result().raise_for_failures()
+
+    composer.start(only=only)
+
+
+def pipelined_swap_command(
+    composer: Composer,
+    plan: Optional[SwapPlan] = None,
+    only: Optional[List[str]] = None,
+    create: bool = False,
+    timeout: int = DEFAULT_STOP_TIMEOUT,
+) -> str:
+    """Shell form of what `pipelined_swap` would run."""
+    prepare_command = composer.pull(dry=True, only=only)
+    if create:
+        prepare_command += " && " + composer.create(dry=True, only=only)
+
+    start_command = composer.start(dry=True, only=only)
+    teardown_part = plan.command(timeout) if plan else None
+    if not teardown_part:
+        return " && ".join([prepare_command, start_command])
+
+    return "({}) & ({}) && wait && {}".format(
+        teardown_part, prepare_command, start_command
+    )
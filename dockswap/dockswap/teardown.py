@@ -0,0 +1,157 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from .engine import Container, docker_binary, get_engine
+from .errors import DockSwapError
+from .timing import phase
+
+DEFAULT_STOP_TIMEOUT = 10
+DEFAULT_WORKERS = 4
+
+
+class TeardownReport(object):
+    """Result of a teardown: which containers were stopped/removed and which failed."""
+
+    def __init__(self):
+        self.stopped: List[str] = []
+        self.removed: List[str] = []
+        self.failures: Dict[str, str] = {}
+
+    @property
+    def ok(self) -> bool:
+        return not self.failures
+
+    def merge(self, other: "TeardownReport"):
+        self.stopped.extend(other.stopped)
+        self.removed.extend(other.removed)
+        self.failures.update(other.failures)
+
+    def raise_for_failures(self):
+        if self.ok:
+            return
+
+        raise DockSwapError(
+            "Failed to tear down {} container(s):\n{}".format(
+                len(self.failures),
+                "\n".join(
+                    "  {}: {}".format(container_id, error)
+                    for container_id, error in sorted(self.failures.items())
+                ),
+            )
+        )
+
+
+def shard(ids: List[str], shards: int) -> List[List[str]]:
+    """Split `ids` into at most `shards` lists of (almost) equal size."""
+    shards = max(1, min(shards, len(ids)))
+    return [ids[i::shards] for i in range(shards)] if ids else []
+
+
+def teardown_shard(
+    engine, ids: List[str], running: List[str], remove: bool, timeout: int
+) -> TeardownReport:
+    """Gracefully stop `running` containers of a shard, then force remove all its `ids`."""
+    report = TeardownReport()
+
+    with phase("stop"):
+        report.stopped, report.failures = engine.stop(running, timeout)
+
+    if remove:
+        # force also kills containers that failed to stop gracefully
+        with phase("remove"):
+            report.removed, remove_failures = engine.remove(ids, force=True)
+        for container_id in report.removed:
+            report.failures.pop(container_id, None)
+        report.failures.update(remove_failures)
+
+    return report
+
+
+def targets(
+    engine,
+    remove: bool,
+    ids: Optional[List[str]] = None,
+    containers: Optional[List[Container]] = None,
+) -> Tuple[List[str], List[str]]:
+    """
+    Return ids of running containers to stop and ids of all containers to tear down.
+    If `ids` are given then only those containers are considered.
+    If `containers` are given then they are used instead of listing containers.
+    """
+    if containers is None:
+        with phase("list"):
+            containers = engine.list_containers(all=remove)
+    if ids is not None:
+        wanted = set(ids)
+        containers = [c for c in containers if c.id in wanted]
+
+    running = [c.id for c in containers if c.running]
+    return running, ([c.id for c in containers] if remove else running)
+
+
+def teardown(
+    remove: bool = False,
+    timeout: int = DEFAULT_STOP_TIMEOUT,
+    workers: int = DEFAULT_WORKERS,
+    ids: Optional[List[str]] = None,
+    engine=None,
+    containers: Optional[List[Container]] = None,
+) -> TeardownReport:
+    """
+    Stop running containers and, if `remove`, force remove all containers.
+    Containers are split across `workers` shards processed in parallel and every
+    container gets `timeout` seconds to stop gracefully.
+    Failed containers are collected in the report instead of aborting.
+
+    If `ids` are given then only those containers are torn down.
+    Already listed `containers` may be passed to avoid listing them again.
+    """
+    engine = engine or get_engine()
+    running, all_ids = targets(engine, remove, ids, containers)
+
+    running_set = set(running)
+    report = TeardownReport()
+    shards = shard(all_ids, workers)
+    if not shards:
+        return report
+
+    with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+        futures = [
+            executor.submit(
+                teardown_shard,
+                engine,
+                shard_ids,
+                [container_id for container_id in shard_ids if container_id in running_set],
+                remove,
+                timeout,
+            )
+            for shard_ids in shards
+        ]
+        for future in futures:
+            report.merge(future.result())
+
+    return report
+
+
+def teardown_command(
+    remove: bool = False,
+    timeout: int = DEFAULT_STOP_TIMEOUT,
+    ids: Optional[List[str]] = None,
+    engine=None,
+    containers: Optional[List[Container]] = None,
+) -> Optional[str]:
+    """
+    Return docker command(s) `teardown` would run (in a single shard form),
+    or `None` if there is nothing to tear down.
+    """
+    running, all_ids = targets(engine or get_engine(), remove, ids, containers)
+
+    commands = []
+    if running:
+        commands.append(
+            "{} stop -t {} {}".format(docker_binary(), timeout, " ".join(running))
+        )
+    if remove and all_ids:
+        commands.append("{} rm -f {}".format(docker_binary(), " ".join(all_ids)))
+
+    return " && ".join(commands) or None
@@ -0,0 +1,196 @@
+"""
+Timing of swap phases (storage load, container listing, stop, remove,
+docker-compose calls) with monotonic clock.
+
+Phases may run in parallel threads (e.g. teardown shards), so time of a phase
+is the wall-clock time during which at least one such phase was running,
+not the sum of all of them.
+"""
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .fs import atomic_write, file_lock
+
+
+def covered(intervals: List[Tuple[float, float]]) -> float:
+    """Total length of union of (start, end) `intervals`."""
+    total = 0.0
+    current_start = current_end = None
+    for start, end in sorted(intervals):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        total += current_end - current_start
+    return total
+
+
+class Profiler(object):
+    def __init__(self):
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        self.intervals: Dict[str, List[Tuple[float, float]]] = OrderedDict()
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.intervals.setdefault(name, []).append((started, time.monotonic()))
+
+    def finish(self):
+        self.finished = time.monotonic()
+
+    @property
+    def total(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def phases(self) -> Dict[str, float]:
+        with self.lock:
+            return OrderedDict(
+                (name, covered(intervals)) for name, intervals in self.intervals.items()
+            )
+
+    def describe(self) -> List[str]:
+        lines = [
+            "{:<16} {:>8.3f}s".format(name, seconds) for name, seconds in self.phases.items()
+        ]
+        lines.append("{:<16} {:>8.3f}s".format("total", self.total))
+        return lines
+
+
+_profiler = Profiler()
+
+
+def start() -> Profiler:
+    """Start new profiler that collects all phases from now on."""
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+
+def phase(name: str):
+    """Context manager timing phase `name` in current profiler."""
+    return _profiler.phase(name)
+
+
+class History(object):
+    """
+    History of timings, one JSON line per run in ~/.dockswap/history.jsonl.
+    File is trimmed to last `LIMIT` runs once it grows over `TRIM_SIZE` bytes.
+    """
+
+    FILE_NAME = "history.jsonl"
+    LIMIT = 1000
+    TRIM_SIZE = 512 * 1024
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else self.default_path()
+        self.lock_path = self.path.with_name(self.path.name + ".lock")
+
+    @classmethod
+    def default_path(cls) -> Path:
+        from .core import DockSwapRepo
+
+        return DockSwapRepo.get_dockswap_folder() / cls.FILE_NAME
+
+    def append(
+        self,
+        command: str,
+        profiler: Profiler,
+        project: Optional[str] = None,
+        ok: bool = True,
+    ):
+        record = {
+            "time": time.time(),
+            "command": command,
+            "project": project,
+            "ok": ok,
+            "total": profiler.total,
+            "phases": profiler.phases,
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with file_lock(self.lock_path):
+            with open(self.path, "a") as history_file:
+                history_file.write(json.dumps(record) + "\n")
+                history_file.flush()
+                position = history_file.tell()
+
+            if position > self.TRIM_SIZE:
+                self.trim()
+
+    def trim(self):
+        with open(self.path, "r") as history_file:
+            lines = history_file.readlines()
+        if len(lines) > self.LIMIT:
+            atomic_write(self.path, "".join(lines[-self.LIMIT:]))
+
+    def records(self) -> List[Dict[str, Any]]:
+        if not self.path.exists():
+            return []
+
+        records = []
+        with open(self.path, "r") as history_file:
+            for line in history_file:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+        return records[-self.LIMIT:]
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Nearest-rank percentile of `values`."""
+    ordered = sorted(values)
+    rank = max(1, int(round(percent / 100.0 * len(ordered) + 0.5 - 1e-9)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(
+    records: List[Dict[str, Any]], project: Optional[str] = None
+) -> List[Tuple[str, str, int, float, float, float]]:
+    """
+    Rows (project, phase, runs, p50, p95, max) for successful runs in `records`,
+    optionally only for `project`.
+    """
+    samples: Dict[Tuple[str, str], List[float]] = OrderedDict()
+    for record in records:
+        if not record.get("ok", True):
+            continue
+        name = record.get("project") or "-"
+        if project and name != project:
+            continue
+        for phase_name, seconds in list(record.get("phases", {}).items()) + [
+            ("total", record["total"])
+        ]:
+            samples.setdefault((name, phase_name), []).append(seconds)
+
+    return [
+        (
+            name,
+            phase_name,
+            len(values),
+            percentile(values, 50),
+            percentile(values, 95),
+            max(values),
+        )
+        for (name, phase_name), values in sorted(samples.items())
+    ]
+
+
+def enabled() -> bool:
+    """History can be turned off with `DOCKSWAP_HISTORY=0`."""
+    return os.environ.get("DOCKSWAP_HISTORY", "1") not in ("0", "false", "no")
@@ -0,0 +1,333 @@
+"""
+Live resource usage of containers aggregated per registered project (`dockswap top`).
+
+Usage is sampled without forking a process per refresh: cgroup files of
+containers are read directly where they are reachable (cgroup v1 and v2, both
+cgroupfs and systemd drivers), the other containers are sampled from one
+long-running `docker stats` stream. List of containers is kept current from
+docker events, without them it is listed again once in `LIST_INTERVAL` seconds.
+Screen is redrawn incrementally, only lines that changed are rewritten.
+"""
+import os
+import re
+import json
+import time
+import threading
+import subprocess
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from .core import Composer
+from .engine import Container, docker_binary, match_ids, parse_percent, parse_size
+from .errors import DockSwapError
+from .execution import spawn, terminate
+
+DEFAULT_CGROUP_ROOT = "/sys/fs/cgroup"
+# seconds a listing of containers is used for when docker events are not watched
+LIST_INTERVAL = 10
+OTHER = "(other)"
+
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*[A-Za-z]")
+
+
+class ContainerStats(object):
+    """Memory in bytes, CPU in cores and total bytes read and written by a container."""
+
+    __slots__ = ("memory", "cpu", "io")
+
+    def __init__(self, memory: int = 0, cpu: float = 0.0, io: int = 0):
+        self.memory = memory
+        self.cpu = cpu
+        self.io = io
+
+    def __repr__(self):
+        return "ContainerStats(memory={}, cpu={:.2f}, io={})".format(
+            self.memory, self.cpu, self.io
+        )
+
+
+def read_number(path: str) -> Optional[int]:
+    try:
+        with open(path, "r") as number_file:
+            return int(number_file.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def read_keyed(path: str) -> List[Tuple[str, ...]]:
+    try:
+        with open(path, "r") as keyed_file:
+            return [tuple(line.split()) for line in keyed_file]
+    except OSError:
+        return []
+
+
+class CgroupSampler(object):
+    """Reads counters of containers from cgroup filesystem mounted at `root`."""
+
+    def __init__(self, root: str = DEFAULT_CGROUP_ROOT):
+        self.root = root
+        self.directories: Dict[str, Optional[Tuple[str, str]]] = {}
+        # previous CPU time (seconds) and wall time of every container
+        self.previous: Dict[str, Tuple[float, float]] = {}
+
+    def locate(self, container_id: str) -> Optional[Tuple[str, str]]:
+        """Cgroup version and directory of container, cached (`None` if not found)."""
+        if container_id not in self.directories:
+            located = None
+            for version, template in (
+                ("v2", "system.slice/docker-{}.scope"),
+                ("v2", "docker/{}"),
+                ("v1", "memory/system.slice/docker-{}.scope"),
+                ("v1", "memory/docker/{}"),
+            ):
+                path = os.path.join(self.root, template.format(container_id))
+                if os.path.isdir(path):
+                    located = (version, path)
+                    break
+            self.directories[container_id] = located
+        return self.directories[container_id]
+
+    def read(self, container_id: str) -> Optional[Tuple[int, float, int]]:
+        """Memory, CPU seconds and IO bytes counters of container."""
+        located = self.locate(container_id)
+        if located is None:
+            return None
+        version, path = located
+
+        if version == "v2":
+            memory = read_number(os.path.join(path, "memory.current"))
+            cpu = 0.0
+            for key, *values in read_keyed(os.path.join(path, "cpu.stat")):
+                if key == "usage_usec":
+                    cpu = int(values[0]) / 1e6
+            io = 0
+            for line in read_keyed(os.path.join(path, "io.stat")):
+                for field in line[1:]:
+                    key, _, value = field.partition("=")
+                    if key in ("rbytes", "wbytes"):
+                        io += int(value)
+        else:
+            # v1 controllers are mounted separately, but use the same layout below them
+            relative = os.path.relpath(path, os.path.join(self.root, "memory"))
+            memory = read_number(os.path.join(path, "memory.usage_in_bytes"))
+            usage = read_number(os.path.join(self.root, "cpuacct", relative, "cpuacct.usage"))
+            cpu = (usage or 0) / 1e9
+            io = sum(
+                int(line[2])
+                for line in read_keyed(
+                    os.path.join(self.root, "blkio", relative, "blkio.throttle.io_service_bytes")
+                )
+                if len(line) == 3 and line[1] in ("Read", "Write")
+            )
+
+        if memory is None:
+            # container is gone
+            self.directories.pop(container_id, None)
+            return None
+        return memory, cpu, io
+
+    def sample(self, ids: List[str]) -> Dict[str, ContainerStats]:
+        now = time.monotonic()
+        stats = {}
+        for container_id in ids:
+            counters = self.read(container_id)
+            if counters is None:
+                continue
+            memory, cpu_time, io = counters
+            previous_cpu, previous_time = self.previous.get(container_id, (cpu_time, now))
+            elapsed = now - previous_time
+            cpu = (cpu_time - previous_cpu) / elapsed if elapsed > 0 else 0.0
+            self.previous[container_id] = (cpu_time, now)
+            stats[container_id] = ContainerStats(memory, max(0.0, cpu), io)
+        return stats
+
+    def close(self):
+        pass
+
+
+def parse_io(block_io: str) -> int:
+    """Parse `docker stats` block IO like `1.2MB / 3.4kB` into total bytes."""
+    total = 0
+    for part in block_io.split("/"):
+        try:
+            total += parse_size(part)
+        except DockSwapError:
+            pass
+    return total
+
+
+class StreamSampler(object):
+    """
+    Follows one `docker stats` process streaming usage of all running
+    containers and keeps the latest values of each.
+    """
+
+    def __init__(self, binary: Optional[str] = None):
+        self.process = spawn(
+            [binary or docker_binary(), "stats", "--no-trunc", "--format", "{{json .}}"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        )
+        self.latest: Dict[str, ContainerStats] = {}
+        self.lock = threading.Lock()
+        self.reader = threading.Thread(target=self.read, daemon=True)
+        self.reader.start()
+
+    def read(self):
+        for line in self.process.stdout:
+            # frames are separated by terminal control sequences
+            line = ANSI_ESCAPE.sub("", line).strip()
+            if not line:
+                continue
+            try:
+                data = json.loads(line)
+                stats = ContainerStats(
+                    parse_size(data.get("MemUsage", "0B").split("/")[0]),
+                    parse_percent(data.get("CPUPerc", "0%")),
+                    parse_io(data.get("BlockIO", "0B / 0B")),
+                )
+            except (ValueError, DockSwapError):
+                continue
+            if data.get("ID"):
+                with self.lock:
+                    self.latest[data["ID"]] = stats
+
+    def sample(self, ids: List[str]) -> Dict[str, ContainerStats]:
+        with self.lock:
+            latest = dict(self.latest)
+        return match_ids(ids, latest)
+
+    def close(self):
+        terminate(self.process, grace=0)
+
+
+class MixedSampler(object):
+    """
+    Samples containers from cgroup files where they can be read and the rest
+    (e.g. on hosts where only some cgroups are visible) from `docker stats`
+    stream, which is started only once such container shows up.
+    """
+
+    def __init__(self, cgroup: Optional[CgroupSampler] = None, stream_factory=StreamSampler):
+        self.cgroup = cgroup or CgroupSampler()
+        self.stream_factory = stream_factory
+        self.stream: Optional[StreamSampler] = None
+
+    def sample(self, ids: List[str]) -> Dict[str, ContainerStats]:
+        stats = self.cgroup.sample(ids)
+        unreadable = [container_id for container_id in ids if container_id not in stats]
+        if unreadable:
+            if self.stream is None:
+                self.stream = self.stream_factory()
+            stats.update(self.stream.sample(unreadable))
+        return stats
+
+    def close(self):
+        self.cgroup.close()
+        if self.stream is not None:
+            self.stream.close()
+
+
+class ProjectRow(object):
+    def __init__(self, name: str):
+        self.name = name
+        self.containers = 0
+        self.memory = 0
+        self.cpu = 0.0
+        self.io_rate = 0.0
+
+
+def aggregate(
+    containers: List[Container],
+    stats: Dict[str, ContainerStats],
+    composers: List[Composer],
+    io_rates: Dict[str, float],
+) -> List[ProjectRow]:
+    """
+    Usage summed per registered project (by compose project label), containers
+    of other projects are summed as `OTHER`. Rows are sorted by CPU, then memory.
+    """
+    names = {composer.compose_project_name: composer.project_name for composer in composers}
+    rows: Dict[str, ProjectRow] = OrderedDict()
+    for container in containers:
+        if container.id not in stats:
+            continue
+        name = names.get(container.project or "", OTHER)
+        row = rows.setdefault(name, ProjectRow(name))
+        row.containers += 1
+        row.memory += stats[container.id].memory
+        row.cpu += stats[container.id].cpu
+        row.io_rate += io_rates.get(container.id, 0.0)
+    return sorted(rows.values(), key=lambda row: (-row.cpu, -row.memory, row.name))
+
+
+def format_size(size: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(size) < 1024:
+            return "{:.1f}{}".format(size, unit)
+        size /= 1024
+    return "{:.1f}TiB".format(size)
+
+
+def format_rows(rows: List[ProjectRow]) -> List[str]:
+    lines = ["{:<24} {:>5} {:>8} {:>10} {:>11}".format("PROJECT", "CONT", "CPU%", "MEM", "IO/s")]
+    for row in rows:
+        lines.append(
+            "{:<24} {:>5} {:>7.1f}% {:>10} {:>11}".format(
+                row.name[:24],
+                row.containers,
+                row.cpu * 100,
+                format_size(row.memory),
+                format_size(row.io_rate),
+            )
+        )
+    return lines
+
+
+class Renderer(object):
+    """
+    Turns frames (lists of lines) into terminal output that rewrites only
+    lines that differ from the previous frame.
+    """
+
+    def __init__(self):
+        self.previous: List[str] = []
+
+    def render(self, lines: List[str]) -> str:
+        output = []
+        for number, line in enumerate(lines):
+            if number >= len(self.previous) or self.previous[number] != line:
+                output.append("\x1b[{};1H{}\x1b[K".format(number + 1, line))
+        if len(lines) < len(self.previous):
+            # clear what is left of a longer previous frame
+            output.append("\x1b[{};1H\x1b[J".format(len(lines) + 1))
+        self.previous = list(lines)
+        return "".join(output)
+
+
+class Top(object):
+    """Samples usage of `containers()` every interval and computes IO rates."""
+
+    def __init__(self, sampler, containers, composers: List[Composer]):
+        self.sampler = sampler
+        self.containers = containers
+        self.composers = composers
+        self.previous_io: Dict[str, Tuple[int, float]] = {}
+
+    def frame(self) -> List[str]:
+        containers = [c for c in self.containers() if c.running]
+        stats = self.sampler.sample([c.id for c in containers])
+        now = time.monotonic()
+        io_rates = {}
+        for container_id, container_stats in stats.items():
+            previous_io, previous_time = self.previous_io.get(
+                container_id, (container_stats.io, now)
+            )
+            elapsed = now - previous_time
+            io_rates[container_id] = (
+                max(0, container_stats.io - previous_io) / elapsed if elapsed > 0 else 0.0
+            )
+            self.previous_io[container_id] = (container_stats.io, now)
+        return format_rows(aggregate(containers, stats, self.composers, io_rates))
@@ -1,5 +1,7 @@
 from pathlib import Path
+from typing import List, Optional
 
+from .compose import get_compose_spec
 from .errors import DockSwapError
 
 
@@ -13,19 +15,37 @@ def validate_path(path: Path):
         )
 
 
-def validate_docker_compose_path(path: Path):
+def validate_docker_compose_path(path: Path, env_path: Optional[Path] = None):
     """
-    Check if file's extension is .yml or .json. Although this is a very
-    naive approach, as the file could be YAML of JSON, but not a valid docker composer.
+    Check if file's extension is .yml, .yaml or .json and that it can be parsed
+    (with variables from `env_path` file). Parsed file is cached, so
+    it is not parsed again until it changes.
     """
     validate_path(path)
 
-    # TODO: Add better validation here
-    if path.suffix.lstrip(".") not in ["yml", "json"]:
+    if path.suffix.lstrip(".") not in ["yml", "yaml", "json"]:
         raise DockSwapError(
             '"{path}" is not a valid YAML/JSON path'.format(path=path)
         )
 
+    get_compose_spec(str(path), str(env_path) if env_path else None)
+
+
+def validate_services(composer, services: List[str]):
+    """
+    Check if all `services` are defined in compose file of `composer`.
+    """
+    spec = composer.spec
+    unknown = [service for service in services if service not in spec.services]
+    if unknown:
+        raise DockSwapError(
+            'Unknown service(s) {} for project "{}". Available services: {}'.format(
+                ", ".join(unknown),
+                composer.project_name,
+                ", ".join(spec.service_names) or "none",
+            )
+        )
+
 
 def validate_project_name(repo, name: str):
     """
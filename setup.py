@@ -28,7 +28,8 @@ setup(
     description="Tool for easier switching between projects that uses docker containers to set up working environment",
     entry_points={
         "console_scripts": [
-            "dockswap=dockswap.cli:app",
+            "dockswap=dockswap.__main__:main",
+            "dockswapd=dockswap.dockswap.daemon:main",
         ],
     },
     install_requires=requirements,
@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+from pathlib import Path
+
+import pytest
+
+FAKE_DOCKER = Path(__file__).parent / "fake_docker.py"
+
+
+@pytest.fixture(autouse=True)
+def isolated_home(tmp_path_factory, monkeypatch):
+    """
+    Point home directory to a temporary one, so that storage, caches and
+    indexes written under ~/.dockswap never touch the real one.
+    """
+    home = tmp_path_factory.mktemp("home")
+    monkeypatch.setenv("HOME", str(home))
+    # parsed compose files are cached in directory chosen on first use
+    monkeypatch.setattr("dockswap.dockswap.compose._cache", None)
+    return home
+
+
+@pytest.fixture(autouse=True)
+def footprint_sampler(mocker):
+    """
+    Keep starts from leaving detached footprint samplers behind
+    (see `admission.schedule_footprints`), the mock tells which were scheduled.
+    """
+    return mocker.patch("dockswap.dockswap.admission.schedule_footprints")
+
+
+class FakeDocker(object):
+    """Handle to state of fake `docker` command (see fake_docker.py)."""
+
+    def __init__(self, binary: Path, state_path: Path):
+        self.binary = str(binary)
+        self.state_path = state_path
+
+    def set_containers(self, containers):
+        self.state = {"containers": containers}
+
+    @property
+    def state(self):
+        with open(self.state_path) as state_file:
+            return json.load(state_file)
+
+    @state.setter
+    def state(self, value):
+        with open(self.state_path, "w") as state_file:
+            json.dump(value, state_file)
+
+    @property
+    def containers(self):
+        return self.state["containers"]
+
+    @property
+    def calls(self):
+        return self.state.get("calls", [])
+
+
+@pytest.fixture
+def fake_docker(tmp_path, monkeypatch):
+    """Point `DOCKSWAP_DOCKER_CLI` to fake docker with no containers."""
+    binary = tmp_path / "docker"
+    binary.write_text(
+        '#!/bin/sh\nexec "{}" "{}" "$@"\n'.format(sys.executable, FAKE_DOCKER)
+    )
+    os.chmod(str(binary), 0o755)
+
+    docker = FakeDocker(binary, tmp_path / "docker-state.json")
+    docker.set_containers([])
+    monkeypatch.setenv("FAKE_DOCKER_STATE", str(docker.state_path))
+    monkeypatch.setenv("DOCKSWAP_DOCKER_CLI", docker.binary)
+    return docker
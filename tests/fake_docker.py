@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+"""
+Fake `docker` command used by tests. Containers are kept in a JSON file
+pointed by `FAKE_DOCKER_STATE` environment variable::
+
+    {"containers": [{"id": "abc", "running": true, "fail": false, "labels": {}}]}
+
+Containers with `"fail": true` can not be stopped, removed, paused or unpaused. Optional
+`"paused"`, `"labels"`, `"name"`, `"memory"` and `"cpu"` (as `docker stats` prints them),
+`"block_io"`, `"health"`, `"exit_code"` and `"finished_at"` fields are supported as well.
+`events` prints `"events"` list of the state and exits. `pull` adds image to
+`"images"` list unless it is in `"unknown_images"`, `image ls` lists them
+with IDs taken from `"image_ids"` mapping (image name -> ID).
+Volumes are kept as ``{"volumes": {"name": {"labels": {}, "files": {"path": "content"}}}}``,
+`run` only understands scripts of helper containers of snapshot.py: files
+are copied between volumes (cloning fails unless state has `"reflink": true`)
+or streamed as gzipped JSON in place of a tar archive. Restored volume keeps
+its files if the copy fails (e.g. archive is corrupt).
+Every call is appended to `calls` list of the state.
+Each call takes at least `FAKE_DOCKER_LATENCY` seconds (0 by default) to
+simulate round trip to docker daemon.
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import fcntl
+
+
+def load_state():
+    with open(os.environ["FAKE_DOCKER_STATE"]) as state_file:
+        return json.load(state_file)
+
+
+def save_state(state):
+    with open(os.environ["FAKE_DOCKER_STATE"], "w") as state_file:
+        json.dump(state, state_file)
+
+
+def find(state, container_id):
+    for container in state["containers"]:
+        if container["id"] == container_id:
+            return container
+
+
+def state_of(container):
+    if container.get("paused"):
+        return "paused"
+    return "running" if container.get("running") else "exited"
+
+
+def ps(state, args):
+    show_all = "-a" in args or "-aq" in args
+    for container in state["containers"]:
+        if not (show_all or container.get("running")):
+            continue
+        if "--format" in args:
+            labels = container.get("labels", {})
+            print(
+                json.dumps(
+                    {
+                        "ID": container["id"],
+                        "State": state_of(container),
+                        "Names": container.get("name", container["id"]),
+                        "Image": container.get("image", ""),
+                        "Labels": ",".join(
+                            "{}={}".format(key, value) for key, value in labels.items()
+                        ),
+                    }
+                )
+            )
+        else:
+            print(container["id"])
+    return 0
+
+
+def stop(state, args):
+    code = 0
+    ids = [arg for arg in args if not arg.startswith("-") and not arg.isdigit()]
+    for container_id in ids:
+        container = find(state, container_id)
+        if not container or container.get("fail"):
+            sys.stderr.write(
+                "Error response from daemon: cannot stop container: {}\n".format(
+                    container_id
+                )
+            )
+            code = 1
+            continue
+        container["running"] = False
+        container["paused"] = False
+        print(container_id)
+    return code
+
+
+def rm(state, args):
+    code = 0
+    force = "-f" in args
+    for container_id in [arg for arg in args if not arg.startswith("-")]:
+        container = find(state, container_id)
+        if not container or container.get("fail") or (
+            container.get("running") and not force
+        ):
+            sys.stderr.write(
+                "Error response from daemon: cannot remove container: {}\n".format(
+                    container_id
+                )
+            )
+            code = 1
+            continue
+        state["containers"].remove(container)
+        print(container_id)
+    return code
+
+
+def set_paused(paused):
+    def command(state, args):
+        code = 0
+        for container_id in args:
+            container = find(state, container_id)
+            if not container or not container.get("running") or container.get("fail"):
+                sys.stderr.write(
+                    "Error response from daemon: container {} is not running\n".format(
+                        container_id
+                    )
+                )
+                code = 1
+                continue
+            container["paused"] = paused
+            print(container_id)
+        return code
+
+    return command
+
+
+def stats(state, args):
+    if "{{json .}}" in args:
+        # streaming mode, print one frame of running containers
+        sys.stdout.write("\x1b[2J\x1b[H")
+        for container in state["containers"]:
+            if container.get("running"):
+                print(
+                    json.dumps(
+                        {
+                            "ID": container["id"],
+                            "MemUsage": container.get("memory", "0B / 1GiB"),
+                            "CPUPerc": container.get("cpu", "0.00%"),
+                            "BlockIO": container.get("block_io", "0B / 0B"),
+                        }
+                    )
+                )
+        return 0
+
+    for container_id in [arg for arg in args if not arg.startswith("-")][1:]:
+        container = find(state, container_id)
+        if container:
+            line = "{}\t{}".format(container_id[:12], container.get("memory", "0B / 1GiB"))
+            if "CPUPerc" in " ".join(args):
+                line += "\t{}".format(container.get("cpu", "0.00%"))
+            print(line)
+    return 0
+
+
+def events(state, args):
+    """Print events listed in state (as `docker events` would) and exit."""
+    for event in state.get("events", []):
+        print(json.dumps(event))
+    return 0
+
+
+def inspect(state, args):
+    data = []
+    for container_id in args:
+        container = find(state, container_id)
+        if container:
+            container_state = {
+                "Status": state_of(container),
+                "ExitCode": container.get("exit_code", 0),
+            }
+            if "finished_at" in container:
+                container_state["FinishedAt"] = container["finished_at"]
+            if "health" in container:
+                container_state["Health"] = {"Status": container["health"]}
+            data.append({"Id": container_id, "State": container_state})
+    print(json.dumps(data))
+    return 0 if len(data) == len(args) else 1
+
+
+def pull(state, args):
+    image = [arg for arg in args if not arg.startswith("-")][0]
+    if image in state.get("unknown_images", []):
+        sys.stderr.write("Error response from daemon: manifest for {} not found\n".format(image))
+        return 1
+    state.setdefault("images", []).append(image)
+    print(image)
+    return 0
+
+
+def image(state, args):
+    image_ids = state.get("image_ids", {})
+    names = [*image_ids] + [name for name in state.get("images", []) if name not in image_ids]
+    for name in names:
+        if "{{.ID}}" in args[-1]:
+            print("{} {}".format(name, image_ids.get(name, "sha256:" + name)))
+        else:
+            print(name)
+    return 0
+
+
+def volume(state, args):
+    volumes = state.setdefault("volumes", {})
+    command, args = args[0], args[1:]
+    if command == "ls":
+        for name in volumes:
+            print(name)
+    elif command == "create":
+        labels = dict(args[i + 1].split("=", 1) for i, arg in enumerate(args) if arg == "--label")
+        volumes.setdefault(args[-1], {"labels": labels, "files": {}})
+        print(args[-1])
+    elif command == "rm":
+        for name in [arg for arg in args if not arg.startswith("-")]:
+            volumes.pop(name, None)
+    return 0
+
+
+def run(state, args):
+    volumes = state.setdefault("volumes", {})
+    mounts = {}
+    for i, arg in enumerate(args):
+        if arg == "-v":
+            name, target = args[i + 1].split(":")[:2]
+            mounts[target] = volumes.setdefault(name, {"labels": {}, "files": {}})
+    script = args[-1]
+    if "--reflink=always" in script and not state.get("reflink"):
+        sys.stderr.write("cp: failed to clone '/to/data': Operation not supported\n")
+        return 1
+    if "cp -a" in script:
+        files = dict(mounts["/from"]["files"])
+        if "/volume" in mounts:
+            # restore replaces content only once everything is copied
+            mounts["/volume"]["files"] = files
+        else:
+            mounts["/to"]["files"].update(files)
+    elif "-czf -" in script:
+        sys.stdout.buffer.write(gzip.compress(json.dumps(mounts["/volume"]["files"]).encode()))
+    elif "-xzf -" in script:
+        try:
+            files = json.loads(gzip.decompress(sys.stdin.buffer.read()))
+        except (OSError, ValueError):
+            sys.stderr.write("gzip: stdin: not in gzip format\n")
+            return 1
+        mounts["/volume"]["files"] = files
+    return 0
+
+
+COMMANDS = {
+    "ps": ps,
+    "stop": stop,
+    "rm": rm,
+    "pause": set_paused(True),
+    "unpause": set_paused(False),
+    "stats": stats,
+    "events": events,
+    "inspect": inspect,
+    "pull": pull,
+    "image": image,
+    "volume": volume,
+    "run": run,
+}
+
+
+def main(argv):
+    # sleep outside of the lock, so parallel calls are slow in parallel
+    time.sleep(float(os.environ.get("FAKE_DOCKER_LATENCY", "0")))
+    with open(os.environ["FAKE_DOCKER_STATE"] + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        state = load_state()
+        state.setdefault("calls", []).append(argv)
+        code = COMMANDS[argv[0]](state, argv[1:])
+        save_state(state)
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+"""
+Fake `docker-compose` command used by benchmarks. It only takes
+`FAKE_DOCKER_COMPOSE_LATENCY` seconds (0 by default) and succeeds.
+If `FAKE_DOCKER_STATE` is set, calls are appended to `compose_calls`
+list of fake docker state (see fake_docker.py). Calls having an argument
+that contains `FAKE_DOCKER_COMPOSE_FAIL` (if it is set) fail.
+"""
+import os
+import sys
+import json
+import time
+import fcntl
+
+
+def main(argv):
+    time.sleep(float(os.environ.get("FAKE_DOCKER_COMPOSE_LATENCY", "0")))
+
+    state_path = os.environ.get("FAKE_DOCKER_STATE")
+    if state_path:
+        with open(state_path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            with open(state_path) as state_file:
+                state = json.load(state_file)
+            state.setdefault("compose_calls", []).append(argv)
+            with open(state_path, "w") as state_file:
+                json.dump(state, state_file)
+
+    fail = os.environ.get("FAKE_DOCKER_COMPOSE_FAIL")
+    if fail and any(fail in arg for arg in argv):
+        sys.stderr.write("ERROR: Service failed to start\n")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
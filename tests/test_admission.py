@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+from collections import OrderedDict
+
+import pytest
+
+from dockswap.dockswap.admission import (
+    Capacity,
+    FootprintRepo,
+    SAMPLES_LIMIT,
+    admit,
+    last_used,
+    plan_admission,
+    record_footprint,
+    sample_later,
+    schedule_footprints,
+)
+from dockswap.dockswap.core import Composer, DockSwapRepo
+from dockswap.dockswap.engine import CLIEngine, Usage
+from dockswap.dockswap.errors import DockSwapError
+from dockswap.dockswap.timing import History
+
+GIB = 1024 ** 3
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("DOCKSWAP_DOCKER_COMPOSE_CLI", "true")
+    monkeypatch.setenv("DOCKSWAP_FIT_RESERVE", "0")
+    repo = DockSwapRepo()
+    repo.persist_all(
+        [
+            Composer(
+                docker_compose_path=str(tmp_path / name / "docker-compose.yml"),
+                project_name=name,
+            )
+            for name in ["foo", "bar", "baz", "new"]
+        ]
+    )
+    return repo
+
+
+def container(container_id, project, memory="1GiB / 8GiB", cpu="50.00%"):
+    return {
+        "id": container_id,
+        "running": True,
+        "memory": memory,
+        "cpu": cpu,
+        "labels": {"com.docker.compose.project": project},
+    }
+
+
+def composers(*names):
+    return OrderedDict(
+        (name, Composer("/{}/dc.yml".format(name), project_name=name)) for name in names
+    )
+
+
+def test_capacity_read(tmp_path):
+    meminfo = tmp_path / "meminfo"
+    meminfo.write_text("MemTotal:       16000000 kB\nMemAvailable:    2048 kB\n")
+    loadavg = tmp_path / "loadavg"
+    loadavg.write_text("1.50 1.00 0.50 2/300 12345\n")
+
+    capacity = Capacity.read(str(meminfo), str(loadavg))
+    assert capacity.memory_available == 2048 * 1024
+    assert capacity.load == 1.5
+    assert capacity.cpu_free == max(0.0, capacity.cpus - 1.5)
+
+    with pytest.raises(DockSwapError):
+        Capacity.read(str(tmp_path / "missing"), str(loadavg))
+
+
+def test_footprints(tmp_path):
+    footprints = FootprintRepo(tmp_path / "footprints.json")
+    assert footprints.estimate("foo") is None
+
+    for memory in range(1, SAMPLES_LIMIT + 11):
+        footprints.record({"foo": Usage(memory, memory / 10)})
+    samples = footprints.load()["foo"]
+    assert len(samples) == SAMPLES_LIMIT
+    assert samples[0]["memory"] == 11
+    assert footprints.estimate("foo") == Usage(28, 2.8)
+
+
+def test_last_used():
+    records = [
+        {"time": 1, "command": "start", "project": "foo", "ok": True},
+        {"time": 3, "command": "start", "project": "bar", "ok": True},
+        {"time": 5, "command": "start", "project": "foo", "ok": False},
+        {"time": 6, "command": "stop", "project": "bar", "ok": True},
+    ]
+    assert last_used(records) == {"foo": 1, "bar": 3}
+
+
+def test_plan_admission_evicts_least_recently_used_until_it_fits():
+    registered = composers("foo", "bar", "baz", "new")
+    running = OrderedDict(
+        [("foo", Usage(2 * GIB, 0.1)), ("bar", Usage(1 * GIB, 0.1)), ("baz", Usage(3 * GIB, 0))]
+    )
+    used = {"foo": 30, "bar": 10, "baz": 20}
+    capacity = Capacity(memory_available=1 * GIB, cpus=4, load=1)
+
+    plan = plan_admission(registered["new"], running, registered, capacity, Usage(4 * GIB, 1))
+    assert [c.project_name for c in plan.evict] == ["foo", "bar"]  # never used, stable order
+
+    plan = plan_admission(
+        registered["new"], running, registered, capacity, Usage(4 * GIB, 1), used
+    )
+    assert [c.project_name for c in plan.evict] == ["bar", "baz"]
+    assert plan.shortfall == Usage()
+
+    plan = plan_admission(
+        registered["new"], running, registered, capacity, Usage(1 * GIB, 1), used, GIB // 2
+    )
+    assert [c.project_name for c in plan.evict] == ["bar"]
+
+    plan = plan_admission(registered["new"], running, registered, capacity, None, used)
+    assert plan.evict == []
+    assert "unknown (never sampled)" in "\n".join(plan.describe())
+
+
+def test_plan_admission_cpu_and_shortfall():
+    registered = composers("foo", "bar", "new")
+    running = OrderedDict(
+        [("foo", Usage(0, 1.5)), ("bar", Usage(GIB, 0)), ("new", Usage(GIB, 1))]
+    )
+    capacity = Capacity(memory_available=8 * GIB, cpus=2, load=1.9)
+
+    # new already runs and uses one of its two CPUs, bar frees no CPU
+    plan = plan_admission(registered["new"], running, registered, capacity, Usage(GIB, 2))
+    assert [c.project_name for c in plan.evict] == ["foo"]
+    assert plan.shortfall == Usage()
+
+    plan = plan_admission(registered["new"], running, registered, capacity, Usage(GIB, 4))
+    assert [c.project_name for c in plan.evict] == ["foo"]
+    assert plan.shortfall.cpu == pytest.approx(1.4)
+    assert "still short of" in plan.describe()[-1]
+
+
+def test_admit(repo, fake_docker, tmp_path):
+    fake_docker.set_containers(
+        [
+            container("f1", "foo", memory="2GiB / 8GiB"),
+            container("b1", "bar"),
+            container("b2", "bar"),
+            container("x1", "unregistered", memory="4GiB / 8GiB"),
+        ]
+    )
+    footprints = FootprintRepo(tmp_path / "footprints.json")
+    footprints.record({"new": Usage(3 * GIB, 0)})
+    history = History(tmp_path / "history.jsonl")
+
+    plan = admit(
+        repo.get("new"),
+        repo,
+        engine=CLIEngine(),
+        footprints=footprints,
+        capacity=Capacity(memory_available=GIB, cpus=8, load=0),
+        history=history,
+        dry=True,
+    )
+    assert [c.project_name for c in plan.evict] == ["foo"]
+    assert "foo" not in footprints.load()
+
+    plan = admit(
+        repo.get("new"),
+        repo,
+        engine=CLIEngine(),
+        footprints=footprints,
+        capacity=Capacity(memory_available=GIB, cpus=8, load=0),
+        history=history,
+    )
+    assert [c.project_name for c in plan.evict] == ["foo"]
+    samples = footprints.load()
+    assert samples["foo"][0]["memory"] == 2 * GIB
+    assert samples["bar"][0]["memory"] == 2 * GIB
+    assert samples["bar"][0]["cpu"] == 1.0
+    assert "unregistered" not in samples
+    # one `docker stats` call for all running containers
+    assert [call[0] for call in fake_docker.calls].count("stats") == 2
+
+
+def test_record_footprint(repo, fake_docker, tmp_path):
+    fake_docker.set_containers([container("n1", "new"), container("f1", "foo")])
+    footprints = FootprintRepo(tmp_path / "footprints.json")
+    record_footprint(repo.get("new"), CLIEngine(), footprints)
+    assert list(footprints.load()) == ["new"]
+    assert footprints.estimate("new") == Usage(GIB, 0.5)
+
+
+def test_admit_footprint_write_failure(repo, fake_docker, tmp_path, mocker):
+    fake_docker.set_containers([container("f1", "foo", memory="2GiB / 8GiB")])
+    footprints = FootprintRepo(tmp_path / "footprints.json")
+    footprints.record({"new": Usage(3 * GIB, 0)})
+    mocker.patch.object(footprints, "record", side_effect=OSError("disk full"))
+    plan = admit(
+        repo.get("new"),
+        repo,
+        engine=CLIEngine(),
+        footprints=footprints,
+        capacity=Capacity(memory_available=GIB, cpus=8, load=0),
+        history=History(tmp_path / "history.jsonl"),
+    )
+    assert [c.project_name for c in plan.evict] == ["foo"]
+
+
+def test_sample_later(fake_docker, tmp_path):
+    fake_docker.set_containers([container("n1", "new_project"), container("f1", "foo")])
+    footprints = FootprintRepo(tmp_path / "footprints.json")
+    sample_later(0, {"new_project": "new"}, CLIEngine(), footprints)
+    assert footprints.estimate("new") == Usage(GIB, 0.5)
+
+    # failures are ignored, nobody waits for the sample
+    (tmp_path / "file").write_text("")
+    sample_later(0, {"new_project": "new"}, CLIEngine(), FootprintRepo(tmp_path / "file" / "f"))
+    sample_later(0, {"new_project": "new"}, CLIEngine(str(tmp_path / "missing")), footprints)
+
+
+def test_schedule_footprints(repo, mocker, monkeypatch):
+    monkeypatch.setenv("DOCKSWAP_FOOTPRINT_DELAY", "5")
+    popen = mocker.patch("subprocess.Popen")
+    schedule_footprints([repo.get("new")])
+    args = popen.call_args[0][0]
+    assert args[1:] == [
+        "-m",
+        "dockswap.dockswap.admission",
+        "5.0",
+        "{}=new".format(repo.get("new").compose_project_name),
+    ]
+    assert popen.call_args[1]["start_new_session"]
+
+    popen.side_effect = OSError("no python")
+    schedule_footprints([repo.get("new")])
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+import os
+import sys
+import json
+from pathlib import Path
+
+import pytest
+
+from dockswap.api import DockSwap
+from dockswap.dockswap.core import Composer, DockSwapRepo
+from dockswap.dockswap.engine import CLIEngine
+
+FAKE_DOCKER_COMPOSE = Path(__file__).parent / "fake_docker_compose.py"
+
+
+def container(id, project, service="app", running=True):
+    return {
+        "id": id,
+        "running": running,
+        "labels": {
+            "com.docker.compose.project": project,
+            "com.docker.compose.service": service,
+        },
+    }
+
+
+@pytest.fixture
+def dockswap(tmp_path, monkeypatch, fake_docker):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("DOCKSWAP_STORAGE_FILE_NAME", DockSwapRepo.STORAGE_PATH)
+    binary = tmp_path / "docker-compose"
+    binary.write_text(
+        '#!/bin/sh\nexec "{}" "{}" "$@"\n'.format(sys.executable, FAKE_DOCKER_COMPOSE)
+    )
+    os.chmod(str(binary), 0o755)
+    monkeypatch.setenv("DOCKSWAP_DOCKER_COMPOSE_CLI", str(binary))
+
+    composers = []
+    for name in ("shop", "blog", "broken"):
+        (tmp_path / name).mkdir()
+        compose_path = tmp_path / name / "docker-compose.json"
+        compose_path.write_text(json.dumps({"services": {"app": {"image": name}}}))
+        composers.append(Composer(str(compose_path), project_name=name))
+    DockSwapRepo().persist_all(composers)
+    monkeypatch.setenv("FAKE_DOCKER_COMPOSE_FAIL", str(tmp_path / "broken"))
+    return DockSwap(engine=CLIEngine())
+
+
+def compose_commands(fake_docker):
+    return sorted(
+        (Path(call[call.index("-f") + 1]).parent.name, call[call.index("-f") + 2])
+        for call in fake_docker.state.get("compose_calls", [])
+    )
+
+
+def test_start_many(dockswap, fake_docker, capsys, footprint_sampler):
+    results = dockswap.start_many(["shop", "broken", "missing", "blog"], workers=3)
+
+    assert [result.project for result in results] == ["shop", "broken", "missing", "blog"]
+    assert [result.ok for result in results] == [True, False, False, True]
+    assert results[0].details == {"mode": "up", "services": []}
+    assert results[1].error.endswith("ERROR: Service failed to start")
+    assert results[2].error.startswith('No composer found for "missing"')
+    assert compose_commands(fake_docker) == [("blog", "up"), ("broken", "up"), ("shop", "up")]
+    # output of docker-compose is not printed
+    assert capsys.readouterr().out == ""
+    assert footprint_sampler.call_count == 2
+
+    fake_docker.set_containers([container("shop_app", "shop")])
+    result = dockswap.start("shop")
+    assert result.to_dict()["mode"] == "unchanged"
+    assert result.to_dict()["ok"] is True
+    assert footprint_sampler.call_count == 2
+
+
+def test_unexpected_errors_are_reported(dockswap, mocker):
+    start = DockSwap._start
+
+    def flaky_start(self, project, *args):
+        if project == "blog":
+            raise PermissionError("[Errno 13] Permission denied: 'docker-compose.json'")
+        return start(self, project, *args)
+
+    mocker.patch.object(DockSwap, "_start", flaky_start)
+    results = dockswap.start_many(["shop", "blog"], workers=2)
+    assert [result.ok for result in results] == [True, False]
+    assert results[1].error == (
+        "PermissionError: [Errno 13] Permission denied: 'docker-compose.json'"
+    )
+
+
+def test_swap_and_stop(dockswap, fake_docker):
+    fake_docker.set_containers(
+        [container("shop_app", "shop"), container("blog_app", "blog"), container("other", "x")]
+    )
+    result = dockswap.swap("shop")
+    assert result.ok, result.error
+    assert sorted(result.details["removed"]) == ["blog_app", "other"]
+    assert [c["id"] for c in fake_docker.containers] == ["shop_app"]
+
+    results = dockswap.stop_many(["shop", "blog"])
+    assert all(result.ok for result in results)
+    assert ("blog", "down") in compose_commands(fake_docker)
+
+    result = dockswap.stop_all(remove=True)
+    assert result.to_dict()["removed"] == ["shop_app"]
+    assert dockswap.start_many([]) == []
@@ -0,0 +1,33 @@
+import json
+
+from benchmarks import run
+
+
+def test_compare_reports_only_slower_cases():
+    previous = {"list/10/0": 1.0, "start/10/0": 1.0}
+    current = {"list/10/0": 1.1, "start/10/0": 1.5, "add/10/0": 9.0}
+    assert run.compare(previous, current, 0.2) == ["start/10/0: 1.000s -> 1.500s (+50%)"]
+
+
+def test_benchmarks_are_recorded_and_compared(tmp_path, capsys):
+    results = tmp_path / "results.jsonl"
+    args = [
+        "--composers", "10",
+        "--containers", "0,5",
+        "--commands", "add,start,stopall",
+        "--repeat", "1",
+        "--results", str(results),
+    ]
+    assert run.main(args) == 0
+
+    [recorded] = [json.loads(line) for line in results.read_text().splitlines()]
+    assert sorted(recorded["results"]) == [
+        "add/10/0", "start/10/0", "start/10/5", "stopall/10/0", "stopall/10/5"
+    ]
+
+    # make previous run impossibly fast, so that the next one is a regression
+    recorded["results"] = {case: 1e-6 for case in recorded["results"]}
+    results.write_text(json.dumps(recorded) + "\n")
+    assert run.main(args + ["--no-save"]) == 1
+    assert "REGRESSION start/10/5" in capsys.readouterr().out
+    assert len(results.read_text().splitlines()) == 1
@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 import os
+import json
 from typing import Union
 
 import pytest
@@ -8,7 +9,8 @@ from typer.testing import CliRunner, Result
 
 os.environ["DOCKSWAP_STORAGE_FILE_NAME"] = "_storage_test.json"
 
-from dockswap import cli  # noqa: E402
+from dockswap import api, cli  # noqa: E402
+from dockswap.dockswap.errors import CommandTimeout  # noqa: E402
 
 app = cli.app
 runner = CliRunner()
@@ -120,6 +122,13 @@ def mock_persist(mocker):
     mocker.patch("dockswap.cli.repo.persist", persist)
 
 
+@pytest.fixture(autouse=True)
+def history_path(mocker, tmp_path):
+    path = tmp_path / "history.jsonl"
+    mocker.patch.object(cli.timing.History, "default_path", staticmethod(lambda: path))
+    return path
+
+
 @pytest.fixture
 def concrete_storage(fake_storage_data):
     def _concrete_storage(names, files=None, envs=None):
@@ -175,11 +184,52 @@ def test_add_composer(mock_path_validators, mocker, mock_empty_repo):
     assert "success" in result.stdout.lower()
 
 
+def test_discover(mocker, fake_storage_data, tmp_path):
+    mocker.patch("dockswap.cli.repo._loaded_data", [fake_storage_data(name="foo")])
+    persist_all = mocker.patch("dockswap.cli.repo.persist_all")
+    for name in ["foo", "bar", "node_modules"]:
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "docker-compose.json").write_text('{"services": {}}')
+
+    result = run_command("discover {} --ignore bar --dry".format(tmp_path))
+    assert result.stdout.startswith("Skipped {}".format(tmp_path / "foo"))
+    assert len(result.stdout.splitlines()) == 1
+    persist_all.assert_not_called()
+
+    result = run_command("discover {}".format(tmp_path))
+    (composers,), _ = persist_all.call_args
+    assert [c.project_name for c in composers] == ["bar"]
+    assert "no free project name" in result.stdout
+    assert "Successfully registered 1 composer(s)" in result.stdout
+
+
 def test_list_composer_with_existing_composers(mock_full_repo, mocker):
     result = run_command("list")
     assert len(result.stdout.splitlines()) == 5
 
 
+def test_json_output(mock_full_repo, mocker):
+    lines = run_command("list --json").stdout.splitlines()
+    assert len(lines) == 5
+    assert set(json.loads(lines[0])) == {"project_name", "dc_path", "env_path"}
+
+    project_name = json.loads(lines[0])["project_name"]
+    mocker.patch.object(
+        api.DockSwap, "stop", lambda self, project: api.Result("stop", project)
+    )
+    result = json.loads(run_command("stop {} --json".format(project_name)).stdout)
+    assert result["ok"] and result["project"] == project_name
+
+    result = run_command("start missing --json", 1)
+    assert json.loads(result.stdout.splitlines()[0])["error"].startswith("No composer found")
+    result = run_command("start {} --json --dry --wait".format(project_name), 1)
+    assert json.loads(result.stdout.splitlines()[0]) == {
+        "ok": False,
+        "error": "--json can not be combined with --dry, --wait",
+        "exit_code": 1,
+    }
+
+
 def test_add_composer_with_used_name(mocker, fake_storage_data):
     mocker.patch(
         "dockswap.cli.repo._loaded_data", [fake_storage_data(name="foo")]
@@ -190,6 +240,23 @@ def test_add_composer_with_used_name(mocker, fake_storage_data):
     assert "already registered" in result.stdout
 
 
+def test_command_timeout_exit_code(mocker, fake_storage_data):
+    mocker.patch("dockswap.cli.repo._loaded_data", [fake_storage_data(name="foo")])
+    mocker.patch(
+        "dockswap.cli.start_composer",
+        side_effect=CommandTimeout("docker-compose up -d", 900, "pulling web"),
+    )
+    result = run_command("start foo", 124)
+    assert 'Command "docker-compose up -d" did not finish in 900s' in result.stdout
+
+
+def test_missing_docker_binary(mocker, concrete_storage, monkeypatch):
+    mocker.patch("dockswap.cli.repo._loaded_data", concrete_storage(names=["foo"]))
+    monkeypatch.setenv("DOCKSWAP_DOCKER_CLI", "/nonexistent/docker")
+    result = run_command("start foo --remove-other", 127)
+    assert 'Could not run "/nonexistent/docker ps' in result.stdout
+
+
 def test_delete_composer(mocker, fake_storage_data):
     mocker.patch(
         "dockswap.cli.repo._loaded_data", [fake_storage_data(name="foo")]
@@ -230,3 +297,273 @@ def test_start_unexisting_composer(mocker, concrete_storage):
     )
     result = run_command("start bar", 1)
     assert "no composer" in result.stdout.lower()
+
+
+def test_start_composer_remove_other_dry(mocker, concrete_storage, fake_docker):
+    mocker.patch(
+        "dockswap.cli.repo._loaded_data",
+        concrete_storage(
+            names=["foo"], files=["/srv/foo/docker-compose.yml"], envs=["env"]
+        ),
+    )
+    fake_docker.set_containers(
+        [
+            {
+                "id": "a1",
+                "name": "foo_db_1",
+                "running": True,
+                "labels": {
+                    "com.docker.compose.project": "foo",
+                    "com.docker.compose.service": "db",
+                },
+            },
+            {
+                "id": "b1",
+                "name": "bar_web_1",
+                "running": True,
+                "labels": {"com.docker.compose.project": "bar"},
+            },
+            {"id": "c1", "name": "lonely", "running": False},
+        ]
+    )
+    result = run_command("start foo --remove-other --dry --stop-timeout 3")
+    docker = fake_docker.binary
+    assert result.stdout.splitlines() == [
+        '# keep project "foo": db',
+        '# tear down project "bar": bar_web_1',
+        "# tear down containers without project: lonely",
+        "{docker} stop -t 3 b1 && {docker} rm -f b1 c1 && "
+        "docker-compose --env-file env -f /srv/foo/docker-compose.yml up -d".format(
+            docker=docker
+        ),
+    ]
+
+
+def test_start_composer_pipeline_dry(mocker, concrete_storage, fake_docker):
+    mocker.patch(
+        "dockswap.cli.repo._loaded_data",
+        concrete_storage(names=["foo"], files=["/srv/foo/dc.yml"], envs=["env"]),
+    )
+    compose = "docker-compose --env-file env -f /srv/foo/dc.yml"
+
+    result = run_command("start foo --pipeline --create --dry")
+    assert result.stdout == _(
+        "{dc} pull && {dc} up --no-start && {dc} up -d".format(dc=compose)
+    )
+
+    fake_docker.set_containers([{"id": "b1", "name": "bar_web_1", "running": True}])
+    result = run_command("start foo --pipeline --remove-other --dry")
+    assert result.stdout.splitlines()[-1] == (
+        "({docker} stop -t 10 b1 && {docker} rm -f b1) & ({dc} pull) "
+        "&& wait && {dc} up -d".format(docker=fake_docker.binary, dc=compose)
+    )
+
+
+def test_start_composer_unknown_service(mocker, concrete_storage, tmp_path):
+    compose_path = tmp_path / "docker-compose.json"
+    compose_path.write_text('{"services": {"db": {"image": "postgres"}}}')
+    mocker.patch(
+        "dockswap.cli.repo._loaded_data",
+        concrete_storage(names=["foo"], files=[str(compose_path)]),
+    )
+    result = run_command("start foo --service db --dry")
+    assert result.stdout.strip().endswith("up -d db")
+
+    result = run_command("start foo --service web --dry", 1)
+    assert "unknown service(s) web" in result.stdout.lower()
+
+
+def test_start_composer_profile_and_stats(mocker, concrete_storage, history_path):
+    mocker.patch(
+        "dockswap.cli.repo._loaded_data", concrete_storage(names=["foo"])
+    )
+    result = run_command("stats")
+    assert "no timings" in result.stdout.lower()
+
+    result = run_command("start foo --profile")
+    assert "storage" in result.stdout
+    assert "total" in result.stdout
+
+    run_command("start foo --dry")
+    run_command("stop foo")
+    assert len(history_path.read_text().splitlines()) == 2
+
+    result = run_command("stats foo")
+    lines = result.stdout.splitlines()
+    assert lines[0].split() == ["PROJECT", "PHASE", "RUNS", "P50", "P95", "MAX"]
+    assert ["foo", "total", "2"] in [line.split()[:3] for line in lines[1:]]
+
+
+def test_group_start_dry(mocker, concrete_storage, monkeypatch, tmp_path):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    mocker.patch(
+        "dockswap.cli.repo._loaded_data",
+        concrete_storage(
+            names=["infra", "app"], files=["infra.yml", "app.yml"], envs=["env", "env"]
+        ),
+    )
+    run_command("group add stack infra missing", 1)
+    run_command("group add stack app infra --after app:nope", 1)
+    result = run_command("group add stack app infra --after app:infra")
+    assert "success" in result.stdout.lower()
+
+    result = run_command("group list")
+    assert result.stdout == _("1. stack: app (after infra), infra")
+
+    result = run_command("group start stack --dry")
+    assert result.stdout.splitlines() == [
+        "# stage 1: infra",
+        "docker-compose --env-file env -f infra.yml up -d",
+        "# stage 2: app",
+        "docker-compose --env-file env -f app.yml up -d",
+    ]
+    result = run_command("group start stack")
+    assert "success" in result.stdout.lower()
+
+    run_command("group delete stack")
+    run_command("group start stack", 1)
+
+
+def test_start_composer_wait(mocker, concrete_storage, fake_docker):
+    mocker.patch(
+        "dockswap.cli.repo._loaded_data",
+        concrete_storage(names=["foo"], files=["/srv/foo/dc.yml"]),
+    )
+    fake_docker.set_containers(
+        [
+            {
+                "id": "f1",
+                "running": True,
+                "labels": {
+                    "com.docker.compose.project": "foo",
+                    "com.docker.compose.service": "web",
+                },
+            }
+        ]
+    )
+    result = run_command("start foo --wait")
+    assert result.stdout.splitlines()[-2:] == ["Ready: web", "Successfully swapped a project!"]
+
+
+def test_doctor(mocker, concrete_storage, tmp_path):
+    compose_path = tmp_path / "docker-compose.json"
+    compose_path.write_text('{"services": {"db": {"image": "postgres"}}}')
+    env_path = tmp_path / "env"
+    env_path.write_text("")
+    mocker.patch(
+        "dockswap.cli.repo._loaded_data",
+        concrete_storage(
+            names=["foo", "gone"],
+            files=[str(compose_path), str(tmp_path / "gone.yml")],
+            envs=[str(env_path), str(env_path)],
+        ),
+    )
+    result = run_command("doctor", 1)
+    assert "gone (stale):" in result.stdout
+    assert "1 of 2 composer(s) have problems" in result.stdout
+
+    delete_many = mocker.patch("dockswap.cli.repo.delete_many", return_value=["gone"])
+    result = run_command("doctor --prune")
+    delete_many.assert_called_once_with(["gone"])
+    assert "Pruned 1 stale composer(s): gone" in result.stdout
+    assert "All 1 composer(s) are fine" in result.stdout
+
+
+def test_prefetch_dry(mocker, concrete_storage, tmp_path):
+    compose_path = tmp_path / "docker-compose.json"
+    compose_path.write_text('{"services": {"db": {"image": "postgres"}, "web": {"build": "."}}}')
+    env_path = tmp_path / "env"
+    env_path.write_text("")
+    mocker.patch(
+        "dockswap.cli.repo._loaded_data",
+        concrete_storage(
+            names=["foo", "bar"], files=[str(compose_path)] * 2, envs=[str(env_path)] * 2
+        ),
+    )
+    result = run_command("prefetch --dry")
+    assert result.stdout == _("postgres:latest (foo, bar)")
+
+
+def test_start_composer_fit_dry(mocker, concrete_storage, fake_docker, tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    mocker.patch(
+        "dockswap.cli.repo._loaded_data",
+        concrete_storage(names=["foo"], files=["/srv/foo/dc.yml"], envs=["env"]),
+    )
+    result = run_command("start foo --fit --dry")
+    lines = result.stdout.splitlines()
+    assert lines[0].startswith("# free: ")
+    assert lines[1] == '# project "foo" needs: unknown (never sampled)'
+    assert lines[-1] == "docker-compose --env-file env -f /srv/foo/dc.yml up -d"
+
+    result = run_command("start foo --fit --standby", 1)
+    assert "can not be combined" in result.stdout
+
+
+def test_start_composer_samples_footprint_after_up(
+    mocker, concrete_storage, fake_docker, footprint_sampler
+):
+    mocker.patch(
+        "dockswap.cli.repo._loaded_data",
+        concrete_storage(names=["foo"], files=["/srv/foo/dc.yml"], envs=["env"]),
+    )
+    run_command("start foo")
+    # sampled later by a detached process, not on the start path
+    assert [c.project_name for c in footprint_sampler.call_args[0][0]] == ["foo"]
+    assert "stats" not in [call[0] for call in fake_docker.calls]
+
+    run_command("start foo --force --fit")
+    assert footprint_sampler.call_count == 2
+
+
+def test_start_composer_up_to_date_does_not_sample(
+    mocker, concrete_storage, fake_docker, footprint_sampler, tmp_path
+):
+    compose_path = tmp_path / "foo" / "docker-compose.json"
+    compose_path.parent.mkdir()
+    compose_path.write_text('{"services": {"web": {"build": "."}}}')
+    mocker.patch(
+        "dockswap.cli.repo._loaded_data",
+        concrete_storage(names=["foo"], files=[str(compose_path)]),
+    )
+    run_command("start foo")
+    assert footprint_sampler.call_count == 1
+
+    fake_docker.set_containers(
+        [
+            {
+                "id": "w1",
+                "running": True,
+                "labels": {
+                    "com.docker.compose.project": "foo",
+                    "com.docker.compose.service": "web",
+                },
+            }
+        ]
+    )
+    result = run_command("start foo")
+    assert "foo: configuration is unchanged and all services are running" in result.stdout
+    assert footprint_sampler.call_count == 1
+    # containers are listed once by the fast path, nothing is sampled
+    assert [call[0] for call in fake_docker.calls] == ["ps"]
+
+
+def test_top_once(mocker, concrete_storage, fake_docker):
+    mocker.patch(
+        "dockswap.cli.repo._loaded_data",
+        concrete_storage(names=["foo"], files=["/srv/foo/dc.yml"], envs=["env"]),
+    )
+    fake_docker.set_containers(
+        [
+            {
+                "id": "f1",
+                "running": True,
+                "memory": "10MiB / 1GiB",
+                "labels": {"com.docker.compose.project": "foo"},
+            }
+        ]
+    )
+    result = run_command("top --once --stream --interval 0.5")
+    lines = result.stdout.splitlines()
+    assert lines[0].split()[0] == "PROJECT"
+    assert lines[1].split()[:2] == ["foo", "1"]
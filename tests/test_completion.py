@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+from dockswap import completion
+from dockswap.completion import candidates, complete, load_index, request_words
+from dockswap.dockswap.core import Composer, DockSwapRepo
+from dockswap.dockswap.storage import get_repo_class
+
+
+@pytest.fixture(autouse=True)
+def fake_home(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("DOCKSWAP_STORAGE_FILE_NAME", DockSwapRepo.STORAGE_PATH)
+    return tmp_path
+
+
+@pytest.fixture
+def compose_path(tmp_path):
+    path = tmp_path / "shop" / "docker-compose.json"
+    path.parent.mkdir()
+    path.write_text('{"services": {"web": {"image": "nginx"}, "worker": {}, "db": {}}}')
+    return path
+
+
+@pytest.fixture
+def index(compose_path):
+    repo = DockSwapRepo()
+    repo.persist_all(
+        [
+            Composer(str(compose_path), project_name="shop"),
+            Composer("/missing/docker-compose.yml", project_name="shell"),
+            Composer("/missing/docker-compose.yml", project_name="blog"),
+        ]
+    )
+    return load_index(str(DockSwapRepo.get_completion_index_path()))
+
+
+def test_index_is_written_on_commit(index, compose_path):
+    assert list(index) == ["shop", "shell", "blog"]
+    assert index["shop"]["services"] == ["web", "worker", "db"]
+    assert index["blog"]["services"] == []
+
+    DockSwapRepo().delete("shell")
+    index = load_index(str(DockSwapRepo.get_completion_index_path()))
+    assert list(index) == ["shop", "blog"]
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "journal"])
+def test_index_is_written_by_other_backends(backend, compose_path):
+    repo_class = get_repo_class(backend)
+    repo_class().persist(Composer(str(compose_path), project_name="shop"))
+    repo_class().persist_all([Composer(str(compose_path), project_name="copy")])
+    assert list(load_index(str(repo_class.get_completion_index_path()))) == ["shop", "copy"]
+
+    repo_class().delete_many(["shop"])
+    assert list(load_index(str(repo_class.get_completion_index_path()))) == ["copy"]
+
+
+def test_index_updates_changed_composers_only(index, compose_path, mocker):
+    spec = mocker.patch("dockswap.dockswap.core.get_compose_spec")
+    spec.return_value.service_names = ["app"]
+    repo = DockSwapRepo()
+    repo.persist(Composer("/missing/other.yml", project_name="other"))
+    repo.delete("shop")
+    # only the new composer is looked at, other entries are kept as they are
+    assert [call[0][0] for call in spec.call_args_list] == ["/missing/other.yml"]
+    assert list(load_index(str(repo.get_completion_index_path()))) == [
+        "shell",
+        "blog",
+        "other",
+    ]
+
+    # missing index is regenerated from all composers
+    spec.reset_mock()
+    DockSwapRepo.drop_completion_index()
+    repo.delete("shell")
+    assert [call[0][0] for call in spec.call_args_list] == [
+        "/missing/docker-compose.yml",
+        "/missing/other.yml",
+    ]
+    assert list(load_index(str(repo.get_completion_index_path()))) == ["blog", "other"]
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "journal"])
+def test_backend_updates_index_of_changed_composers_only(backend, compose_path, mocker):
+    repo = get_repo_class(backend)()
+    repo.persist_all(
+        [
+            Composer(str(compose_path), project_name="shop"),
+            Composer("/missing/docker-compose.yml", project_name="blog"),
+        ]
+    )
+    spec = mocker.patch("dockswap.dockswap.core.get_compose_spec")
+    spec.return_value.service_names = ["app"]
+    loaded_data = mocker.patch.object(
+        type(repo), "loaded_data", new_callable=mocker.PropertyMock
+    )
+
+    repo.persist(Composer("/missing/other.yml", project_name="other"))
+    repo.delete("shop")
+    assert [call[0][0] for call in spec.call_args_list] == ["/missing/other.yml"]
+    assert not loaded_data.called
+    index = load_index(str(repo.get_completion_index_path()))
+    assert list(index) == ["blog", "other"]
+    assert index["other"]["services"] == ["app"]
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite", "journal"])
+def test_prune_drops_index(backend, compose_path):
+    repo_class = get_repo_class(backend)
+    repo_class().persist(Composer(str(compose_path), project_name="shop"))
+    assert load_index(str(repo_class.get_completion_index_path()))
+
+    repo_class.prune()
+    assert load_index(str(repo_class.get_completion_index_path())) is None
+    environ = {
+        completion.COMPLETE_VAR: "complete_bash",
+        "COMP_WORDS": "dockswap start ",
+        "COMP_CWORD": "2",
+    }
+    # left to the cli, which rebuilds index from (empty) storage
+    assert complete(environ) is None
+
+
+def test_candidates(index, compose_path):
+    assert candidates(["start"], "s", index) == ["shop", "shell"]
+    assert candidates(["stop", "--remove"], "", index) == ["shop", "shell", "blog"]
+    assert candidates(["start", "--workers", "2"], "b", index) == ["blog"]
+    assert candidates(["start", "shop", "--service"], "w", index) == ["web", "worker"]
+    assert candidates(["start", "shop", "--service", "db", "--service"], "", index) == [
+        "web",
+        "worker",
+        "db",
+    ]
+    assert candidates(["start", "unknown", "--service"], "", index) == []
+
+    # left to typer
+    assert candidates([], "st", index) is None
+    assert candidates(["start"], "--", index) is None
+    assert candidates(["start", "shop"], "", index) is None
+    assert candidates(["start", "--workers"], "", index) is None
+    assert candidates(["add"], "", index) is None
+    assert candidates(["start"], "", None) is None
+
+    compose_path.write_text('{"services": {"web": {}}}')
+    assert candidates(["start", "shop", "--service"], "", index) is None
+
+
+def test_request_words():
+    assert request_words("bash", {"COMP_WORDS": "dockswap start sh", "COMP_CWORD": "2"}) == (
+        ["start"],
+        "sh",
+    )
+    assert request_words("bash", {"COMP_WORDS": "dockswap start", "COMP_CWORD": "2"}) == (
+        ["start"],
+        "",
+    )
+    assert request_words("zsh", {"_TYPER_COMPLETE_ARGS": "dockswap start "}) == (["start"], "")
+    assert request_words("fish", {"_TYPER_COMPLETE_ARGS": "dockswap stop b"}) == (["stop"], "b")
+    assert request_words(
+        "powershell",
+        {"_TYPER_COMPLETE_ARGS": "dockswap start s", "_TYPER_COMPLETE_WORD_TO_COMPLETE": "s"},
+    ) == (["start"], "s")
+
+
+def test_complete(index, capsys):
+    environ = {
+        completion.COMPLETE_VAR: "complete_bash",
+        "COMP_WORDS": "dockswap start s",
+        "COMP_CWORD": "2",
+    }
+    assert complete(environ) == 0
+    assert capsys.readouterr().out == "shop\nshell\n"
+
+    environ = {completion.COMPLETE_VAR: "complete_zsh", "_TYPER_COMPLETE_ARGS": "dockswap stop b"}
+    assert complete(environ) == 0
+    assert capsys.readouterr().out == "_arguments '*: :((\"blog\"))'\n"
+
+    environ = {
+        completion.COMPLETE_VAR: "complete_fish",
+        "_TYPER_COMPLETE_FISH_ACTION": "is-args",
+        "_TYPER_COMPLETE_ARGS": "dockswap stop x",
+    }
+    assert complete(environ) == 1
+
+    assert complete({completion.COMPLETE_VAR: "complete_bash", "COMP_WORDS": "dockswap "}) is None
+    assert complete({completion.COMPLETE_VAR: "source_bash"}) is None
+    assert complete({}) is None
+
+
+def test_completion_does_not_import_cli(index, tmp_path):
+    env = dict(
+        os.environ,
+        HOME=str(tmp_path),
+        _DOCKSWAP_COMPLETE="complete_bash",
+        COMP_WORDS="dockswap start sh",
+        COMP_CWORD="2",
+    )
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys;"
+            "from dockswap.__main__ import main;"
+            "main([]);"
+            "print(sorted(m for m in ('typer', 'click', 'dockswap.dockswap.core')"
+            " if m in sys.modules))",
+        ],
+        env=env,
+        stdout=subprocess.PIPE,
+        check=True,
+        universal_newlines=True,
+    ).stdout
+    assert output.splitlines() == ["shop", "shell", "[]"]
+
+
+def test_cli_completion_rebuilds_missing_index(index, compose_path, monkeypatch):
+    from dockswap import cli
+
+    monkeypatch.setattr(cli, "repo", DockSwapRepo())
+    DockSwapRepo.get_completion_index_path().unlink()
+    assert cli.complete_registered(["start", "shop", "--service"], "d") == ["db"]
+    assert json.loads(DockSwapRepo.get_completion_index_path().read_text())["projects"]
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+import json
+import os
+
+import pytest
+
+from dockswap.dockswap.compose import (
+    ComposeCache,
+    compose_project_name,
+    interpolate,
+    read_env_file,
+)
+from dockswap.dockswap.errors import DockSwapError
+
+
+def test_read_env_file(tmp_path):
+    env_path = tmp_path / ".env"
+    env_path.write_text("# comment\n\nexport A=1\nB = 'two'\nC=\"x=y\"\nbroken\n")
+    assert read_env_file(str(env_path)) == {"A": "1", "B": "two", "C": "x=y"}
+    assert read_env_file(str(tmp_path / "missing")) == {}
+
+
+def test_compose_project_name(tmp_path, monkeypatch):
+    monkeypatch.delenv("COMPOSE_PROJECT_NAME", raising=False)
+    project_dir = tmp_path / "My.Project"
+    project_dir.mkdir()
+    compose_path = str(project_dir / "docker-compose.yml")
+    assert compose_project_name(compose_path) == "myproject"
+
+    (project_dir / ".env").write_text("COMPOSE_PROJECT_NAME=FromDotEnv\n")
+    assert compose_project_name(compose_path) == "fromdotenv"
+
+    env_path = tmp_path / "custom.env"
+    env_path.write_text("COMPOSE_PROJECT_NAME=custom\n")
+    assert compose_project_name(compose_path, str(env_path)) == "custom"
+
+    monkeypatch.setenv("COMPOSE_PROJECT_NAME", "from_env")
+    assert compose_project_name(compose_path, str(env_path)) == "from_env"
+
+
+def test_interpolate():
+    env = {"A": "1", "EMPTY": ""}
+    assert interpolate("$A ${A} $$A ${B:-x} ${EMPTY:-y} ${EMPTY-z}", env) == "1 1 $A x y "
+    assert interpolate({"k": ["${A}", 2]}, env) == {"k": ["1", 2]}
+
+    with pytest.raises(DockSwapError, match="B"):
+        interpolate("${B:?must be set}", env)
+
+
+def write_compose(path, services):
+    path.write_text(json.dumps({"version": "3", "services": services}))
+
+
+def test_compose_cache(tmp_path, monkeypatch):
+    compose_path = tmp_path / "project" / "docker-compose.json"
+    compose_path.parent.mkdir()
+    write_compose(
+        compose_path,
+        {
+            "db": {"image": "postgres:${PG_VERSION:-12}", "ports": ["5432:5432"]},
+            "web": {"build": {"context": "./web"}, "depends_on": ["db"]},
+        },
+    )
+    (tmp_path / "env").write_text("PG_VERSION=13\n")
+
+    parsed = []
+    real_parse = ComposeCache.parse
+    monkeypatch.setattr(
+        ComposeCache,
+        "parse",
+        staticmethod(lambda *args: parsed.append(args) or real_parse(*args)),
+    )
+
+    cache = ComposeCache(tmp_path / "cache")
+    spec = cache.get(str(compose_path), str(tmp_path / "env"))
+    assert spec.service_names == ["db", "web"]
+    assert spec.images == ["postgres:13"]
+    assert spec.services["web"].build == str(compose_path.parent / "web")
+    assert spec.services["web"].depends_on == ["db"]
+
+    # new cache instance reads entry from disk instead of parsing
+    ComposeCache(tmp_path / "cache").get(str(compose_path), str(tmp_path / "env"))
+    assert len(parsed) == 1
+
+    # touched, but not changed file is not parsed again
+    os.utime(str(compose_path), (1, 1))
+    ComposeCache(tmp_path / "cache").get(str(compose_path), str(tmp_path / "env"))
+    assert len(parsed) == 1
+
+    # environment overrides env file, both in memory and on disk
+    monkeypatch.setenv("PG_VERSION", "14")
+    assert cache.get(str(compose_path), str(tmp_path / "env")).images == ["postgres:14"]
+    assert len(parsed) == 2
+    spec = ComposeCache(tmp_path / "cache").get(str(compose_path), str(tmp_path / "env"))
+    assert spec.images == ["postgres:14"]
+    monkeypatch.delenv("PG_VERSION")
+    assert cache.get(str(compose_path), str(tmp_path / "env")).images == ["postgres:13"]
+    assert len(parsed) == 3
+
+    write_compose(compose_path, {"db": {"image": "postgres"}})
+    spec = ComposeCache(tmp_path / "cache").get(str(compose_path), str(tmp_path / "env"))
+    assert spec.service_names == ["db"]
+    assert len(parsed) == 4
+
+
+def test_compose_cache_yaml(tmp_path):
+    pytest.importorskip("yaml")
+    compose_path = tmp_path / "docker-compose.yml"
+    compose_path.write_text("services:\n  db:\n    image: postgres\n")
+    assert ComposeCache(tmp_path / "cache").get(str(compose_path)).images == ["postgres"]
+
+    compose_path.write_text("services: [\n")
+    with pytest.raises(DockSwapError, match="Could not parse"):
+        ComposeCache(tmp_path / "cache").get(str(compose_path))
@@ -0,0 +1,185 @@
+import os
+import time
+import queue
+import threading
+import traceback
+
+import pytest
+
+from dockswap import cli, client
+from dockswap.dockswap.core import Composer
+from dockswap.dockswap.daemon import ContainerCache, Daemon
+from dockswap.dockswap.engine import CLIEngine, Container, Event
+from dockswap.dockswap.storage import LazyRepo
+
+
+class FakeEngine(object):
+    name = "fake"
+
+    def __init__(self, containers):
+        self.containers = containers
+        self.listed = 0
+
+    def list_containers(self, all=False):
+        self.listed += 1
+        return [Container(c.id, c.state, c.name, labels=c.labels) for c in self.containers]
+
+
+class EventsEngine(CLIEngine):
+    """CLI engine (fake docker) whose events are pushed by test."""
+
+    def __init__(self):
+        super().__init__()
+        self.queue = queue.Queue()
+        self.listed = 0
+
+    def list_containers(self, all=False):
+        self.listed += 1
+        return super().list_containers(all=all)
+
+    def events(self):
+        return iter(self.queue.get, None)
+
+
+def test_container_cache_follows_events():
+    engine = FakeEngine([Container("a", "running"), Container("b", "exited")])
+    cache = ContainerCache(engine)
+
+    # not watching events yet: every call lists containers
+    cache.list_containers()
+    cache.list_containers()
+    assert engine.listed == 2
+
+    cache.set_watching(True)
+    assert [c.id for c in cache.list_containers(all=True)] == ["a", "b"]
+    cache.apply(Event("die", "a"))
+    cache.apply(Event("start", "b"))
+    assert [c.id for c in cache.list_containers()] == ["b"]
+    cache.apply(Event("destroy", "a"))
+    assert [c.id for c in cache.list_containers(all=True)] == ["b"]
+    assert engine.listed == 3
+
+    # unknown container has to be listed
+    cache.apply(Event("create", "c"))
+    cache.list_containers()
+    assert engine.listed == 4
+
+
+def test_container_cache_max_age(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("dockswap.dockswap.daemon.time.monotonic", lambda: now[0])
+    engine = FakeEngine([Container("a", "running")])
+    cache = ContainerCache(engine, max_age=10)
+
+    # without events listing is reused until it is `max_age` old
+    cache.list_containers()
+    now[0] += 9
+    cache.list_containers()
+    assert engine.listed == 1
+    now[0] += 1
+    cache.list_containers()
+    assert engine.listed == 2
+
+
+@pytest.fixture
+def daemon(tmp_path, monkeypatch, fake_docker, capsys):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("DOCKSWAP_STORAGE_BACKEND", "json")
+    monkeypatch.setenv("DOCKSWAP_DAEMON_SOCKET", str(tmp_path / "dockswapd.sock"))
+    monkeypatch.setattr(cli, "repo", LazyRepo())
+    cli.repo.persist(Composer("/srv/foo/docker-compose.yml", project_name="foo"))
+
+    engine = EventsEngine()
+    daemon = Daemon(engine=engine)
+    errors = []
+
+    def serve():
+        try:
+            daemon.serve()
+        except BaseException:
+            errors.append(traceback.format_exc())
+            raise
+
+    # daemon thread, so that a daemon which never answers does not keep pytest running
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while client.send({"command": "ping"}) is None:
+        if not thread.is_alive() or time.monotonic() > deadline:
+            engine.queue.put(None)
+            pytest.fail(
+                "daemon did not start:\n{}{}".format(
+                    "".join(errors), capsys.readouterr().err
+                )
+            )
+        time.sleep(0.05)
+
+    yield daemon
+    engine.queue.put(None)
+    assert client.send({"command": "shutdown"}) is not None
+    thread.join()
+    assert not (tmp_path / "dockswapd.sock").exists()
+
+
+def test_daemon_serves_commands(daemon, fake_docker, capsys):
+    assert client.forward(["list"]) == 0
+    assert capsys.readouterr().out == "1. foo\n"
+
+    # registry changed by another process is reloaded
+    cli.repo.get_repo().persist_all(
+        [Composer("/srv/bar/docker-compose.yml", project_name="bar")]
+    )
+    assert client.forward(["list"]) == 0
+    assert capsys.readouterr().out == "1. foo\n2. bar\n"
+
+    assert client.forward(["start", "baz"]) == 1
+    assert "no composer" in capsys.readouterr().err.lower()
+
+    # not served by daemon
+    assert client.forward(["add", "baz"]) is None
+
+
+def test_daemon_streams_output_line_by_line(daemon, tmp_path, monkeypatch):
+    cli.repo.get_repo().persist_all(
+        [Composer("/srv/bar/docker-compose.yml", project_name="bar")]
+    )
+    received = threading.Event()
+    represent = Composer.represent
+
+    # second line is printed only once the first one reached the client
+    def represent_after_first(self, full=False):
+        if self.project_name == "bar":
+            assert received.wait(5)
+        return represent(self, full=full)
+
+    monkeypatch.setattr(Composer, "represent", represent_after_first)
+    messages = []
+
+    def output(message):
+        messages.append(message)
+        received.set()
+
+    response = client.send({"args": ["list"], "env": client.relevant_env()}, output=output)
+    assert messages == [{"stdout": "1. foo\n"}, {"stdout": "2. bar\n"}]
+    assert response == {"exit_code": 0}
+    assert os.stat(str(tmp_path / "dockswapd.sock")).st_mode & 0o777 == 0o600
+
+
+def test_daemon_uses_container_cache(daemon, fake_docker, capsys):
+    fake_docker.set_containers([{"id": "b1", "name": "bar_web_1", "running": True}])
+    assert client.forward(["stopall", "--remove"]) == 0
+    assert client.forward(["stopall", "--remove"]) == 0
+    assert client.forward(["start", "foo", "--remove-other", "--dry"]) == 0
+    assert "nothing to tear down" in capsys.readouterr().out
+    assert fake_docker.containers == []
+    assert daemon.cache.engine.listed == 1
+
+
+def test_client_falls_back_without_daemon(tmp_path, monkeypatch):
+    monkeypatch.setenv("DOCKSWAP_DAEMON_SOCKET", str(tmp_path / "missing.sock"))
+    assert client.forward(["list"]) is None
+
+
+def test_daemon_refuses_different_environment(daemon, monkeypatch):
+    monkeypatch.setenv("DOCKSWAP_STORAGE_BACKEND", "sqlite")
+    assert client.forward(["list"]) is None
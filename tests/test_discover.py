@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+import os
+
+import pytest
+
+from dockswap.dockswap.core import Composer
+from dockswap.dockswap.discover import (
+    DEFAULT_IGNORE,
+    discover_composers,
+    is_ignored,
+    project_names,
+    walk,
+)
+from dockswap.dockswap.errors import DockSwapError
+
+COMPOSE = '{"services": {"web": {"image": "nginx"}}}'
+
+
+def write(path, content=COMPOSE):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "repos"
+    write(root / "shop" / "docker-compose.json")
+    write(root / "shop" / ".env", "")
+    write(root / "shop" / "docker" / "compose.yml", "services:\n  db:\n    image: postgres\n")
+    write(root / "api" / "compose.yaml", "services:\n  api:\n    image: python\n")
+    write(root / "a" / "app" / "docker-compose.json")
+    write(root / "b" / "app" / "docker-compose.json")
+    write(root / "blog" / "docker-compose.json")
+    write(root / "old" / "docker-compose.json")
+    write(root / "broken" / "docker-compose.json", "{not json")
+    write(root / "node_modules" / "pkg" / "docker-compose.json")
+    write(root / ".git" / "docker-compose.json")
+    write(root / "notes" / "README")
+    os.symlink(str(root / "shop"), str(root / "link"))
+    return root
+
+
+def test_is_ignored():
+    assert is_ignored(".git", "a/.git", DEFAULT_IGNORE)
+    assert is_ignored("node_modules", "node_modules", DEFAULT_IGNORE)
+    assert is_ignored("app", "a/app", ["a/*"])
+    assert not is_ignored("app", "b/app", ["a/*"])
+
+
+def test_walk(tree):
+    found = walk(str(tree), DEFAULT_IGNORE, workers=4)
+    assert [os.path.relpath(item.compose_path, str(tree)) for item in found] == [
+        "a/app/docker-compose.json",
+        "api/compose.yaml",
+        "b/app/docker-compose.json",
+        "blog/docker-compose.json",
+        "broken/docker-compose.json",
+        "old/docker-compose.json",
+        "shop/docker-compose.json",
+        "shop/docker/compose.yml",
+    ]
+    assert found[6].env_path == str(tree / "shop" / ".env")
+    assert found[0].env_path is None
+
+    assert len(walk(str(tree), [".*", "a", "shop/*"], workers=1)) == 7
+
+
+def test_project_names(tree):
+    found = walk(str(tree))
+    names = project_names(found, str(tree), {"blog", "docker"})
+    assert [names[item.directory] for item in found] == [
+        "a-app",
+        "api",
+        "b-app",
+        None,
+        "broken",
+        "old",
+        "shop",
+        "shop-docker",
+    ]
+
+
+def test_discover_composers(tree):
+    registered = [
+        Composer("/elsewhere/docker-compose.yml", project_name="blog"),
+        Composer(str(tree / "old" / "docker-compose.json"), project_name="legacy"),
+    ]
+    discovery = discover_composers(str(tree), registered, workers=4)
+    assert [c.project_name for c in discovery.composers] == [
+        "a-app",
+        "api",
+        "b-app",
+        "shop",
+        "docker",
+    ]
+    assert discovery.composers[3].env_path == str(tree / "shop" / ".env")
+    skipped = {os.path.relpath(path, str(tree)): reason for path, reason in discovery.skipped}
+    assert skipped["old/docker-compose.json"] == "already registered"
+    assert skipped["blog/docker-compose.json"] == "no free project name"
+    assert "broken/docker-compose.json" in skipped
+
+    with pytest.raises(DockSwapError):
+        discover_composers(str(tree / "missing"), [])
@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+from dockswap.dockswap.core import Composer
+from dockswap.dockswap.doctor import StatCache, diagnose, diagnose_all, normalize_image
+
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / "app").mkdir()
+    compose_path = tmp_path / "docker-compose.json"
+    compose_path.write_text(
+        '{"services": {"web": {"build": "./app"}, "db": {"image": "postgres:12"},'
+        ' "cache": {"image": "redis"}, "worker": {"build": "./worker"}}}'
+    )
+    (tmp_path / "env").write_text("")
+    return tmp_path
+
+
+def test_normalize_image():
+    assert normalize_image("redis") == "redis:latest"
+    assert normalize_image("localhost:5000/app") == "localhost:5000/app:latest"
+    assert normalize_image("postgres:12") == "postgres:12"
+    assert normalize_image("redis@sha256:abc") == "redis@sha256:abc"
+
+
+def test_diagnose(project):
+    composer = Composer(str(project / "docker-compose.json"), project_name="foo")
+    diagnosis = diagnose(composer, StatCache())
+    assert not diagnosis.stale
+    assert diagnosis.problems == [
+        'build context {} of service "worker" does not exist'.format(project / "worker")
+    ]
+
+    diagnosis = diagnose(composer, StatCache(), images={"postgres:12"})
+    assert 'image redis of service "cache" is not pulled' in diagnosis.problems
+    assert len(diagnosis.problems) == 2
+
+
+def test_diagnose_stale_and_broken(project):
+    missing = Composer(str(project / "gone.yml"), project_name="gone")
+    assert diagnose(missing, StatCache()).stale
+
+    no_env = Composer(
+        str(project / "docker-compose.json"), str(project / "gone.env"), project_name="env"
+    )
+    diagnosis = diagnose(no_env, StatCache())
+    assert diagnosis.stale
+    assert diagnosis.problems == ["env file {} does not exist".format(project / "gone.env")]
+
+    (project / "broken.json").write_text("{oops")
+    broken = Composer(str(project / "broken.json"), project_name="broken")
+    diagnosis = diagnose(broken, StatCache())
+    assert not diagnosis.stale
+    assert "Could not parse" in diagnosis.problems[0]
+
+
+def test_stat_cache_stats_path_once(project, monkeypatch):
+    stat_calls = []
+    real_stat = os.stat
+
+    def counting_stat(path, *args, **kwargs):
+        stat_calls.append(path)
+        return real_stat(path, *args, **kwargs)
+
+    monkeypatch.setattr("dockswap.dockswap.doctor.os.stat", counting_stat)
+    stats = StatCache()
+    for _ in range(3):
+        assert stats.is_file(str(project / "env"))
+        assert not stats.is_dir(str(project / "env"))
+        assert not stats.is_file(str(project / "missing"))
+    assert stat_calls == [str(project / "env"), str(project / "missing")]
+
+
+def test_diagnose_all_keeps_order(project):
+    composers = [
+        Composer(str(project / "docker-compose.json"), str(project / "env"), project_name=str(i))
+        for i in range(50)
+    ]
+    diagnoses = diagnose_all(composers, workers=8)
+
+    assert [d.composer.project_name for d in diagnoses] == [str(i) for i in range(50)]
+    assert all(len(d.problems) == 1 and not d.stale for d in diagnoses)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+import json
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from dockswap.dockswap import teardown
+from dockswap.dockswap.errors import CommandError
+from dockswap.dockswap.engine import APIEngine, CLIEngine, get_engine, parse_labels
+
+
+class FakeDaemonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    @property
+    def containers(self):
+        return self.server.containers
+
+    def reply(self, status, data=None):
+        body = json.dumps(data).encode() if data is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def route(self, method):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = url.path.strip("/").split("/")[1:]
+        self.server.requests.append((method, "/".join(parts), query))
+
+        if parts == ["_ping"]:
+            return self.reply(200, "OK")
+        if parts == ["containers", "json"] and method == "GET":
+            show_all = query.get("all") == ["1"]
+            return self.reply(
+                200,
+                [
+                    {
+                        "Id": container_id,
+                        "Names": ["/" + container_id],
+                        "State": state,
+                        "Labels": {"com.docker.compose.project": "demo"},
+                    }
+                    for container_id, state in sorted(self.containers.items())
+                    if show_all or state == "running"
+                ],
+            )
+
+        container_id = parts[1] if len(parts) > 1 else None
+        if container_id not in self.containers:
+            return self.reply(404, {"message": "No such container: " + str(container_id)})
+        if parts[2:] == ["stop"] and method == "POST":
+            if self.containers[container_id] != "running":
+                return self.reply(304)
+            self.containers[container_id] = "exited"
+            return self.reply(204)
+        if parts[2:] == ["json"] and method == "GET":
+            return self.reply(200, {"Id": container_id, "State": {"Status": "x"}})
+        if not parts[2:] and method == "DELETE":
+            del self.containers[container_id]
+            return self.reply(204)
+        return self.reply(400, {"message": "unexpected request"})
+
+    def do_GET(self):
+        self.route("GET")
+
+    def do_POST(self):
+        self.route("POST")
+
+    def do_DELETE(self):
+        self.route("DELETE")
+
+
+@pytest.fixture
+def fake_daemon(tmp_path):
+    server = socketserver.ThreadingUnixStreamServer(
+        str(tmp_path / "docker.sock"), FakeDaemonHandler
+    )
+    server.daemon_threads = True
+    server.containers = {"a": "running", "b": "exited", "c": "running"}
+    server.requests = []
+    server.connections = 0
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+    )
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def api_engine(fake_daemon):
+    engine = APIEngine(socket_path=fake_daemon.server_address)
+    yield engine
+    engine.close()
+
+
+def test_parse_labels():
+    assert parse_labels("") == {}
+    assert parse_labels("a=1,files=x.yml,y.yml,b=2") == {
+        "a": "1",
+        "files": "x.yml,y.yml",
+        "b": "2",
+    }
+
+
+def test_api_engine_reuses_connection(fake_daemon, api_engine):
+    assert api_engine.ping()
+    containers = api_engine.list_containers()
+    assert [c.id for c in containers] == ["a", "c"]
+    assert containers[0].project == "demo"
+    assert len(api_engine.list_containers(all=True)) == 3
+    assert api_engine.inspect("b")["Id"] == "b"
+    assert fake_daemon.connections == 1
+
+
+def test_api_engine_stop_remove(fake_daemon, api_engine):
+    stopped, failures = api_engine.stop(["a", "b", "missing"], timeout=1)
+    assert stopped == ["a", "b"]
+    assert failures == {"missing": "No such container: missing"}
+    assert ("POST", "containers/a/stop", {"t": ["1"]}) in fake_daemon.requests
+
+    removed, failures = api_engine.remove(["a", "b"])
+    assert removed == ["a", "b"] and not failures
+    assert list(fake_daemon.containers) == ["c"]
+
+
+def test_teardown_with_api_engine(fake_daemon, api_engine):
+    report = teardown.teardown(remove=True, workers=2, engine=api_engine)
+    assert report.ok
+    assert sorted(report.removed) == ["a", "b", "c"]
+    assert fake_daemon.containers == {}
+
+
+def test_get_engine(fake_daemon, monkeypatch, tmp_path):
+    monkeypatch.setenv("DOCKER_HOST", "unix://" + fake_daemon.server_address)
+    assert isinstance(get_engine("api"), APIEngine)
+
+    monkeypatch.setenv("DOCKER_HOST", "unix://" + str(tmp_path / "missing.sock"))
+    assert isinstance(get_engine("api"), CLIEngine)
+
+    monkeypatch.setenv("DOCKSWAP_ENGINE", "cli")
+    assert isinstance(get_engine(), CLIEngine)
+
+
+def test_get_engine_is_reused(fake_daemon, monkeypatch):
+    monkeypatch.setenv("DOCKER_HOST", "unix://" + fake_daemon.server_address)
+    engine = get_engine("api")
+    assert get_engine("api") is engine
+    engine.list_containers()
+    get_engine("api").list_containers()
+    # socket is pinged once and the same connection serves later requests
+    assert [request[1] for request in fake_daemon.requests].count("_ping") == 1
+    assert fake_daemon.connections == 1
+    assert get_engine("cli") is get_engine("cli")
+
+
+def test_cli_engine_error_keeps_stderr_tail(tmp_path):
+    binary = tmp_path / "docker"
+    binary.write_text(
+        "#!/bin/sh\nfor i in $(seq 30); do echo \"error $i\" >&2; done\nexit 1\n"
+    )
+    binary.chmod(0o755)
+    with pytest.raises(CommandError) as error:
+        CLIEngine(str(binary)).check(["ps"])
+    assert error.value.stderr_tail.splitlines() == ["error {}".format(i) for i in range(11, 31)]
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+import os
+import sys
+import time
+import signal
+import subprocess
+
+import pytest
+
+from dockswap.dockswap import output
+from dockswap.dockswap.errors import CommandError, CommandNotStarted, CommandTimeout
+from dockswap.dockswap.execution import (
+    Deadline,
+    RetryPolicy,
+    is_transient,
+    phase_timeout,
+    run_captured,
+)
+
+FLAKY = """
+import os, sys
+path = sys.argv[1]
+attempts = int(open(path).read()) if os.path.exists(path) else 0
+open(path, "w").write(str(attempts + 1))
+if attempts < int(sys.argv[2]):
+    sys.stderr.write("Cannot connect to the Docker daemon. Is the docker daemon running?\\n")
+    sys.exit(1)
+print("done after", attempts + 1)
+"""
+
+# leaves a grandchild in its process group and hangs
+WEDGED = """
+import sys, time, subprocess
+child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+open(sys.argv[1], "w").write(str(child.pid))
+sys.stderr.write("".join("waiting for lock {}\\n".format(i) for i in range(30)))
+sys.stderr.flush()
+time.sleep(60)
+"""
+
+
+def python(code, *args):
+    return [sys.executable, "-c", code] + [str(arg) for arg in args]
+
+
+def alive(pid):
+    for _ in range(40):
+        try:
+            os.kill(pid, 0)
+            # orphans are reaped eventually, zombie counts as dead
+            with open("/proc/{}/stat".format(pid)) as stat_file:
+                if stat_file.read().split(")")[-1].split()[0] == "Z":
+                    return False
+        except (ProcessLookupError, FileNotFoundError):
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def test_phase_timeout(monkeypatch):
+    assert phase_timeout("docker") == 120
+    assert phase_timeout("unknown") == 15 * 60
+    monkeypatch.setenv("DOCKSWAP_TIMEOUT_COMPOSE_UP", "2.5")
+    assert phase_timeout("compose_up") == 2.5
+    monkeypatch.setenv("DOCKSWAP_TIMEOUT_COMPOSE_UP", "0")
+    assert phase_timeout("compose_up") is None
+
+
+def test_retry_policy():
+    policy = RetryPolicy(retries=4, base_delay=1, factor=2, max_delay=5)
+    assert [policy.delay(attempt) for attempt in range(5)] == [1, 2, 4, 5, None]
+    assert policy.delay(0, Deadline(0.5)) is None
+    assert policy.delay(0, Deadline(None)) == 1
+    assert is_transient("Cannot connect to the Docker daemon at unix:///var/run/docker.sock")
+    assert not is_transient("No such container: abc")
+
+
+def test_run_captured_retries_transient_errors(tmp_path):
+    counter = tmp_path / "attempts"
+    retry = RetryPolicy(retries=2, base_delay=0.01)
+    result = run_captured(python(FLAKY, counter, 2), retry=retry)
+    assert result.returncode == 0
+    assert result.stdout == "done after 3\n"
+
+    counter.unlink()
+    result = run_captured(python(FLAKY, counter, 5), retry=retry)
+    assert result.returncode == 1
+    assert counter.read_text() == "3"
+
+
+def test_run_captured_streams_files_again_on_retry(tmp_path):
+    counter = tmp_path / "attempts"
+    source, target = tmp_path / "source", tmp_path / "target"
+    source.write_bytes(b"volume content")
+    # echoes stdin, failing transiently after reading it on the first attempt
+    script = "import sys; sys.stdout.write(sys.stdin.read()); sys.stdout.flush()\n" + FLAKY
+    with open(source, "rb") as stdin, open(target, "wb") as stdout:
+        result = run_captured(
+            python(script, counter, 1),
+            retry=RetryPolicy(retries=1, base_delay=0.01),
+            stdin=stdin,
+            stdout=stdout,
+        )
+    assert result.returncode == 0
+    assert result.stdout is None
+    assert target.read_bytes() == b"volume contentdone after 2\n"
+
+
+def test_missing_binary_is_reported(tmp_path):
+    with pytest.raises(CommandNotStarted) as error:
+        run_captured([str(tmp_path / "docker"), "ps"])
+    assert isinstance(error.value, CommandError)
+    assert error.value.exit_code == error.value.returncode == 127
+    assert str(error.value).startswith('Could not run "{}/docker ps": '.format(tmp_path))
+
+    (tmp_path / "docker").write_text("not executable")
+    with pytest.raises(CommandNotStarted) as error:
+        output.run_checked([str(tmp_path / "docker"), "ps"])
+    assert error.value.exit_code == 126
+
+
+def test_run_captured_kills_process_group_on_timeout(tmp_path):
+    pid_path = tmp_path / "pid"
+    started = time.monotonic()
+    with pytest.raises(CommandTimeout) as error:
+        run_captured(python(WEDGED, pid_path), timeout=1)
+    assert time.monotonic() - started < 10
+    assert error.value.exit_code == 124
+    assert "did not finish in 1s" in str(error.value)
+    # stderr written before the deadline is kept, trimmed to its last lines
+    assert error.value.stderr_tail.splitlines() == [
+        "waiting for lock {}".format(i) for i in range(10, 30)
+    ]
+    assert not alive(int(pid_path.read_text()))
+
+
+def test_run_checked_reports_exit_code_and_stderr_tail(capsys, monkeypatch):
+    code = "import sys; sys.stderr.write('pulling\\nno such image\\n'); sys.exit(3)"
+    with pytest.raises(CommandError) as error:
+        output.run_checked(python(code), prefix="foo/up", phase="compose_up")
+    assert error.value.returncode == 3
+    assert error.value.stderr_tail == "pulling\nno such image"
+    assert error.value.elapsed > 0
+    assert str(error.value).endswith("no such image")
+
+    monkeypatch.setenv("DOCKSWAP_TIMEOUT_COMPOSE_UP", "0.5")
+    with pytest.raises(CommandTimeout):
+        output.run_checked(python("import time; time.sleep(30)"), phase="compose_up")
+
+
+def test_signals_are_forwarded_to_children(tmp_path):
+    marker = tmp_path / "marker"
+    child = (
+        "import signal, sys, time\n"
+        "def handle(signum, frame):\n"
+        "    open(sys.argv[1], 'w').write('got ' + signal.Signals(signum).name)\n"
+        "    sys.exit(0)\n"
+        "signal.signal(signal.SIGINT, handle)\n"
+        "open(sys.argv[1], 'w').write('ready')\n"
+        "time.sleep(30)\n"
+    )
+    parent = (
+        "import sys\n"
+        "from dockswap.dockswap.errors import CommandInterrupted\n"
+        "from dockswap.dockswap.execution import run_captured\n"
+        "try:\n"
+        "    run_captured([sys.executable, '-c', sys.argv[1], sys.argv[2]])\n"
+        "except CommandInterrupted as error:\n"
+        "    print(error)\n"
+        "    sys.exit(error.exit_code)\n"
+    )
+    process = subprocess.Popen(
+        python(parent, child, marker), stdout=subprocess.PIPE, universal_newlines=True
+    )
+    for _ in range(200):
+        if marker.exists() and marker.read_text() == "ready":
+            break
+        time.sleep(0.05)
+    process.send_signal(signal.SIGINT)
+    stdout, _ = process.communicate(timeout=20)
+
+    assert process.returncode == 130
+    assert "was interrupted by SIGINT" in stdout
+    assert marker.read_text() == "got SIGINT"
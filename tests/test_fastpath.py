@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+import json
+
+import pytest
+
+from dockswap.dockswap.core import Composer
+from dockswap.dockswap.engine import CLIEngine
+from dockswap.dockswap.fastpath import ConfigRepo, config_state, fast_start, plan_start
+
+SERVICES = {
+    "db": {"image": "postgres"},
+    "web": {"image": "nginx:${TAG}", "depends_on": ["db"]},
+    "worker": {"image": "worker"},
+}
+
+
+def container(service, running=True):
+    return {
+        "id": service,
+        "running": running,
+        "labels": {
+            "com.docker.compose.project": "shop",
+            "com.docker.compose.service": service,
+        },
+    }
+
+
+@pytest.fixture
+def composer(tmp_path):
+    (tmp_path / "shop").mkdir()
+    compose_path = tmp_path / "shop" / "docker-compose.json"
+    compose_path.write_text(json.dumps({"services": SERVICES}))
+    env_path = tmp_path / "shop" / "env"
+    env_path.write_text("TAG=1\n")
+    return Composer(str(compose_path), env_path=str(env_path), project_name="shop")
+
+
+@pytest.fixture
+def configs(tmp_path):
+    return ConfigRepo(tmp_path / "configs.json")
+
+
+@pytest.fixture
+def calls(mocker):
+    calls = []
+    mocker.patch.object(Composer, "start", lambda self, only=None: calls.append(("up", only)))
+    mocker.patch.object(
+        Composer, "update", lambda self, services: calls.append(("update", services))
+    )
+    return calls
+
+
+def rewrite(composer, services, env="TAG=1\n"):
+    with open(composer.docker_compose_path, "w") as compose_file:
+        json.dump({"services": services}, compose_file)
+    with open(composer.env_path, "w") as env_file:
+        env_file.write(env)
+
+
+def test_config_state(composer):
+    state = config_state(composer)
+    assert list(state["services"]) == ["db", "web", "worker"]
+    assert config_state(composer, ["db"])["hash"] != state["hash"]
+
+    rewrite(composer, SERVICES, env="TAG=2\n")
+    changed = config_state(composer)
+    assert changed["hash"] != state["hash"]
+    assert [
+        name for name in state["services"] if state["services"][name] != changed["services"][name]
+    ] == ["web"]
+    assert composer.update(["web"], dry=True).endswith("up --no-deps -d web")
+
+
+def test_fast_start(composer, configs, calls, fake_docker):
+    engine = CLIEngine()
+    plan = fast_start(composer, engine=engine, configs=configs)
+    assert plan.reason == "project was never started by dockswap"
+    assert calls == [("up", None)]
+
+    fake_docker.set_containers([container("db"), container("web"), container("worker")])
+    assert fast_start(composer, engine=engine, configs=configs).up_to_date
+    assert len(calls) == 1
+
+    # only the service whose interpolated configuration changed is recreated
+    rewrite(composer, SERVICES, env="TAG=2\n")
+    plan = fast_start(composer, engine=engine, configs=configs)
+    assert plan.services == ["web"]
+    assert calls[-1] == ("update", ["web"])
+    assert fast_start(composer, engine=engine, configs=configs).up_to_date
+
+    # stopped service is started again
+    fake_docker.set_containers([container("db"), container("web"), container("worker", False)])
+    assert fast_start(composer, engine=engine, configs=configs).services == ["worker"]
+
+
+def test_environment_and_pulled_images(composer, configs, calls, fake_docker, monkeypatch):
+    engine = CLIEngine()
+    fake_docker.state = {
+        "containers": [container("db"), container("web"), container("worker")],
+        "image_ids": {"postgres:latest": "sha256:1", "worker:latest": "sha256:2"},
+    }
+    fast_start(composer, engine=engine, configs=configs)
+    assert fast_start(composer, engine=engine, configs=configs).up_to_date
+
+    # shell environment overrides env file
+    monkeypatch.setenv("TAG", "2")
+    assert fast_start(composer, engine=engine, configs=configs).services == ["web"]
+    assert fast_start(composer, engine=engine, configs=configs).up_to_date
+
+    # image pulled again (e.g. by prefetch) is used
+    state = fake_docker.state
+    state["image_ids"]["worker:latest"] = "sha256:3"
+    fake_docker.state = state
+    assert fast_start(composer, engine=engine, configs=configs).services == ["worker"]
+    assert calls[-1] == ("update", ["worker"])
+    assert fast_start(composer, engine=engine, configs=configs).up_to_date
+
+
+def test_plan_start_falls_back_to_full_up(composer, configs, calls, fake_docker):
+    engine = CLIEngine()
+    fast_start(composer, engine=engine, configs=configs)
+
+    fake_docker.set_containers([container("web"), container("worker")])
+    rewrite(composer, SERVICES, env="TAG=2\n")
+    plan = plan_start(composer, ["web", "worker"], engine=engine, configs=configs)
+    assert plan.services is None
+    assert plan.reason == "dependencies are not running: db"
+
+    fake_docker.set_containers([])
+    plan = plan_start(composer, ["db", "worker"], engine=engine, configs=configs)
+    assert plan.reason == "all services changed or are not running"
+
+    fake_docker.set_containers([container("db"), container("web"), container("worker")])
+    rewrite(composer, SERVICES, env="TAG=1\n")
+    fast_start(composer, engine=engine, configs=configs)
+    rewrite(composer, SERVICES, env="TAG=1\nOTHER=1\n")
+    assert plan_start(composer, engine=engine, configs=configs).reason == (
+        "project configuration changed"
+    )
+
+    composer.docker_compose_path = "/missing/docker-compose.json"
+    plan = plan_start(composer, engine=engine, configs=configs)
+    assert plan.state is None
+    assert plan.reason.startswith("could not read configuration")
+
+
+def test_up_outside_fast_path_drops_config(composer, fake_docker, monkeypatch):
+    monkeypatch.setenv("DOCKSWAP_DOCKER_COMPOSE_CLI", "true")
+    composer = Composer(
+        composer.docker_compose_path, env_path=composer.env_path, project_name="shop"
+    )
+    composer.echo = False
+    configs = ConfigRepo()
+    fast_start(composer, engine=CLIEngine())
+    assert configs.get("shop")
+
+    # e.g. `start --force` or a standby swap, recorded configuration may be stale now
+    composer.update(["web"])
+    assert configs.get("shop") is None
+    plan = plan_start(composer, engine=CLIEngine())
+    assert plan.reason == "project was never started by dockswap"
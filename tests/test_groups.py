@@ -0,0 +1,103 @@
+import time
+import threading
+
+import pytest
+
+from dockswap.dockswap.errors import DockSwapError
+from dockswap.dockswap.groups import Group, GroupRepo, start_group
+
+
+class FakeComposer(object):
+    def __init__(self, name, log, duration=0.1, fail=False):
+        self.name = name
+        self.log = log
+        self.duration = duration
+        self.fail = fail
+
+    def start(self):
+        self.log.append(("start", self.name, time.monotonic()))
+        time.sleep(self.duration)
+        self.log.append(("done", self.name, time.monotonic()))
+        if self.fail:
+            raise DockSwapError("{} failed".format(self.name))
+
+
+@pytest.fixture
+def stack():
+    return Group(
+        "stack",
+        ["infra", "auth", "app", "docs"],
+        {"auth": ["infra"], "app": ["auth", "infra"]},
+    )
+
+
+def test_group_levels(stack):
+    assert stack.levels() == [["infra", "docs"], ["auth"], ["app"]]
+    assert Group.from_dict(stack.to_dict()).levels() == stack.levels()
+    assert stack.represent() == "stack: infra, auth (after infra), app (after auth, infra), docs"
+
+
+def test_group_rejects_bad_dependencies():
+    with pytest.raises(DockSwapError, match="non-members: db"):
+        Group("g", ["app"], {"app": ["db"]})
+    with pytest.raises(DockSwapError, match="cycle between: a, b"):
+        Group("g", ["a", "b", "c"], {"a": ["b"], "b": ["a"]})
+
+
+def test_start_group_runs_independent_members_in_parallel(stack):
+    log = []
+    composers = {name: FakeComposer(name, log) for name in stack.members}
+
+    started = time.monotonic()
+    start_group(stack, composers, workers=4)
+    elapsed = time.monotonic() - started
+
+    # critical path is infra -> auth -> app, docs runs alongside infra
+    assert elapsed < 0.35
+    times = {(event, name): at for event, name, at in log}
+    assert times["start", "auth"] >= times["done", "infra"]
+    assert times["start", "app"] >= times["done", "auth"]
+    assert times["start", "docs"] < times["done", "infra"]
+
+
+def test_start_group_respects_concurrency_limit():
+    group = Group("flat", ["a", "b", "c", "d"])
+    log, lock, active = [], threading.Lock(), []
+
+    class Counting(FakeComposer):
+        def start(self):
+            with lock:
+                active.append(self.name)
+                log.append(len(active))
+            time.sleep(0.05)
+            with lock:
+                active.remove(self.name)
+
+    start_group(group, {name: Counting(name, log) for name in group.members}, workers=2)
+    assert max(log) == 2
+
+
+def test_start_group_stops_scheduling_after_failure(stack):
+    log = []
+    composers = {name: FakeComposer(name, log) for name in stack.members}
+    composers["infra"].fail = True
+
+    with pytest.raises(DockSwapError) as error:
+        start_group(stack, composers)
+    assert "infra: infra failed" in str(error.value)
+    assert "not started: auth, app" in str(error.value)
+    assert {name for event, name, _ in log} == {"infra", "docs"}
+
+
+def test_group_repo(tmp_path, stack):
+    groups = GroupRepo(tmp_path / "groups.json")
+    assert groups.get_all() == []
+    groups.persist(stack)
+    groups.persist(Group("other", ["docs"]))
+    assert [group.name for group in groups.get_all()] == ["stack", "other"]
+    assert groups.get("stack").levels() == stack.levels()
+
+    assert groups.delete("stack")
+    assert not groups.delete("stack")
+    with pytest.raises(DockSwapError, match="No group found"):
+        groups.get("stack")
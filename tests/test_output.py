@@ -0,0 +1,83 @@
+import sys
+
+import pytest
+
+from dockswap.dockswap import output
+from dockswap.dockswap.core import Composer
+from dockswap.dockswap.errors import DockSwapError
+from dockswap.dockswap.output import STDERR, STDOUT, LineBuffer, StreamedProcess
+
+SCRIPT = """
+import sys, time
+print("first", flush=True)
+sys.stderr.write("warning\\n"); sys.stderr.flush()
+time.sleep(0.05)
+sys.stdout.write("progress 10%\\rprogress 100%\\n")
+sys.stdout.write("no newline")
+sys.exit(3)
+"""
+
+
+def python(code):
+    return [sys.executable, "-c", code]
+
+
+def test_streamed_process_yields_lines_as_they_come():
+    process = StreamedProcess(python(SCRIPT))
+    lines = iter(process)
+    assert next(lines).text == "first"
+    assert process.returncode is None
+
+    rest = [(line.source, line.text) for line in lines]
+    assert rest == [
+        (STDERR, "warning"),
+        (STDOUT, "progress 100%"),
+        (STDOUT, "no newline"),
+    ]
+    assert process.returncode == 3
+    assert process.wait() == 3
+
+
+def test_line_buffer_is_bounded():
+    buffer = LineBuffer(limit=4)
+    assert buffer.feed(b"ab") == []
+    # partial line never grows over the limit
+    assert buffer.feed(b"cdefghij") == ["abcd", "efgh"]
+    assert buffer.feed(b"\nk") == ["ij"]
+    assert buffer.partial == b"k"
+    assert buffer.flush() == ["k"]
+    assert buffer.flush() == []
+
+
+def test_run_prefixes_and_logs(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(output, "_logger", None)
+    monkeypatch.setattr(output, "log_path", lambda: tmp_path / "logs" / "output.log")
+    monkeypatch.setenv("DOCKSWAP_LOG", "1")
+
+    assert output.run(python(SCRIPT), prefix="foo/up") == 3
+    captured = capsys.readouterr()
+    assert captured.out.splitlines() == [
+        "foo/up | first",
+        "foo/up | progress 100%",
+        "foo/up | no newline",
+    ]
+    assert captured.err == "foo/up | warning\n"
+
+    log = (tmp_path / "logs" / "output.log").read_text()
+    assert "foo/up stderr warning" in log
+    assert "foo/up exited with 3" in log
+
+    for handler in output._logger.handlers:
+        output._logger.removeHandler(handler)
+        handler.close()
+
+
+def test_composer_execute_reports_failures(capsys):
+    composer = Composer("/srv/foo/docker-compose.yml", project_name="foo")
+    composer.execute("{} -c print('up')".format(sys.executable), "compose_up")
+    assert capsys.readouterr().out == "foo/up | up\n"
+
+    with pytest.raises(DockSwapError, match="exited with status code 1"):
+        composer.execute("{} -c exit(1)".format(sys.executable), "compose_up")
+    with pytest.raises(DockSwapError, match="Could not run"):
+        composer.execute("/nonexistent/docker-compose up", "compose_up")
@@ -0,0 +1,174 @@
+import json
+import time
+
+import pytest
+
+from dockswap.dockswap.core import Composer
+from dockswap.dockswap.engine import CLIEngine
+from dockswap.dockswap.errors import DockSwapError
+from dockswap.dockswap.prefetch import (
+    FREQUENCY_HALF_LIFE,
+    PrefetchState,
+    prefetch,
+    prefetch_plan,
+    swap_frequency,
+)
+from dockswap.dockswap.timing import History
+
+
+@pytest.fixture
+def composers(tmp_path):
+    def make(name, services):
+        path = tmp_path / "{}.json".format(name)
+        path.write_text(json.dumps({"services": services}))
+        return Composer(str(path), project_name=name)
+
+    return [
+        make("shop", {"db": {"image": "postgres:12"}, "web": {"build": "."}}),
+        make("blog", {"db": {"image": "postgres:12"}, "cache": {"image": "redis"}}),
+        make("docs", {"site": {"image": "nginx"}}),
+        Composer(str(tmp_path / "gone.yml"), project_name="gone"),
+    ]
+
+
+@pytest.fixture
+def history(tmp_path):
+    return History(tmp_path / "history.jsonl")
+
+
+def record(history, project, age=0, command="start", ok=True):
+    with open(history.path, "a") as history_file:
+        history_file.write(
+            json.dumps(
+                {"time": time.time() - age, "command": command, "project": project, "ok": ok}
+            )
+            + "\n"
+        )
+
+
+def test_swap_frequency():
+    now = time.time()
+    records = [
+        {"time": now, "command": "start", "project": "a", "ok": True},
+        {"time": now - FREQUENCY_HALF_LIFE, "command": "start", "project": "a", "ok": True},
+        {"time": now, "command": "start", "project": "b", "ok": False},
+        {"time": now, "command": "stop", "project": "b", "ok": True},
+    ]
+    assert swap_frequency(records, now) == {"a": 1.5}
+
+
+def test_prefetch_plan(composers):
+    plan = prefetch_plan(composers, {"docs": 3, "blog": 1, "shop": 1})
+    assert [(item.image, item.projects) for item in plan] == [
+        ("nginx:latest", ["docs"]),
+        ("postgres:12", ["shop", "blog"]),
+        ("redis:latest", ["blog"]),
+    ]
+    assert [item.image for item in prefetch_plan(composers)] == [
+        "nginx:latest",
+        "postgres:12",
+        "redis:latest",
+    ]
+
+
+def test_prefetch(composers, history, fake_docker, tmp_path):
+    record(history, "blog")
+    record(history, "blog", age=FREQUENCY_HALF_LIFE * 10)
+    state = PrefetchState(tmp_path / "prefetch.json")
+    pulled = []
+
+    result = prefetch(
+        composers,
+        workers=1,
+        engine=CLIEngine(),
+        history=history,
+        state=state,
+        on_pulled=lambda item, error: pulled.append((item.image, error)),
+    )
+    assert result.pulled == ["postgres:12", "redis:latest", "nginx:latest"]
+    assert pulled == [(image, None) for image in result.pulled]
+    assert fake_docker.state["images"] == result.pulled
+    assert not result.resumed
+    assert not state.path.exists()
+
+
+def test_prefetch_resumes_interrupted_run(composers, history, fake_docker, tmp_path):
+    fake_docker.state = {"containers": [], "unknown_images": ["redis:latest"]}
+    state_path = tmp_path / "prefetch.json"
+
+    result = prefetch(
+        composers, engine=CLIEngine(), history=history, state=PrefetchState(state_path)
+    )
+    assert sorted(result.pulled) == ["nginx:latest", "postgres:12"]
+    assert list(result.failed) == ["redis:latest"]
+    assert "manifest for redis:latest not found" in result.failed["redis:latest"]
+    assert sorted(json.loads(state_path.read_text())["pulled"]) == sorted(result.pulled)
+
+    fake_docker.state = {"containers": []}
+    result = prefetch(
+        composers, engine=CLIEngine(), history=history, state=PrefetchState(state_path)
+    )
+    assert result.resumed
+    assert result.pulled == ["redis:latest"]
+    assert sorted(result.skipped) == ["nginx:latest", "postgres:12"]
+    assert fake_docker.state["images"] == ["redis:latest"]
+    assert not state_path.exists()
+
+
+def test_prefetch_restart_and_old_state(composers, history, fake_docker, tmp_path):
+    state_path = tmp_path / "prefetch.json"
+    state_path.write_text(json.dumps({"started": time.time(), "pulled": {"nginx:latest": 0}}))
+    result = prefetch(
+        composers,
+        engine=CLIEngine(),
+        history=history,
+        state=PrefetchState(state_path),
+        restart=True,
+    )
+    assert len(result.pulled) == 3
+
+    state_path.write_text(json.dumps({"started": 0, "pulled": {"nginx:latest": 0}}))
+    state = PrefetchState(state_path)
+    assert not state.load()
+    assert state.pulled == {}
+
+
+def test_prefetch_engine_errors_are_reported(composers, history, tmp_path):
+    class BrokenEngine(object):
+        def pull(self, image):
+            raise DockSwapError("registry is down")
+
+    result = prefetch(
+        composers,
+        engine=BrokenEngine(),
+        history=history,
+        state=PrefetchState(tmp_path / "prefetch.json"),
+    )
+    assert result.pulled == []
+    assert set(result.failed.values()) == {"registry is down"}
+
+
+def test_prefetch_interrupt_cancels_queued_pulls(composers, history, tmp_path):
+    pulls = []
+
+    class SlowEngine(object):
+        def pull(self, image):
+            pulls.append(image)
+            time.sleep(0.1)
+
+    def interrupt(item, error):
+        raise KeyboardInterrupt
+
+    state_path = tmp_path / "prefetch.json"
+    with pytest.raises(KeyboardInterrupt):
+        prefetch(
+            composers,
+            workers=1,
+            engine=SlowEngine(),
+            history=history,
+            state=PrefetchState(state_path),
+            on_pulled=interrupt,
+        )
+    # the pull running when interrupted finishes and is kept, the queued one never starts
+    assert pulls == ["nginx:latest", "postgres:12"]
+    assert sorted(json.loads(state_path.read_text())["pulled"]) == pulls
@@ -0,0 +1,133 @@
+import json
+import queue
+import calendar
+
+import pytest
+
+from dockswap.dockswap.core import Composer
+from dockswap.dockswap.engine import CLIEngine, EventStream
+from dockswap.dockswap.errors import DockSwapError
+from dockswap.dockswap.readiness import wait_until_ready
+
+COMPOSER = Composer("/srv/foo/docker-compose.yml", project_name="foo")
+
+
+def container(id, service, project="foo", **fields):
+    labels = {"com.docker.compose.project": project, "com.docker.compose.service": service}
+    return dict({"id": id, "running": True, "labels": labels}, **fields)
+
+
+def event(action, id, service="db", project="foo", **attributes):
+    attributes.update(
+        {"com.docker.compose.project": project, "com.docker.compose.service": service}
+    )
+    return {"Type": "container", "Action": action, "id": id, "Actor": {"Attributes": attributes}}
+
+
+class BlockingEventsEngine(CLIEngine):
+    """Engine whose events stream stays open until closed."""
+
+    def events(self):
+        lines = queue.Queue()
+        return EventStream(iter(lines.get, None), lambda: lines.put(None))
+
+
+def test_wait_until_healthy(fake_docker):
+    fake_docker.set_containers(
+        [
+            container("web1", "web"),
+            container("db1", "db", health="starting"),
+            container("job1", "migrate", running=False, exit_code=0),
+            container("other1", "db", project="bar", health="starting"),
+        ]
+    )
+    state = fake_docker.state
+    state["events"] = [
+        event("health_status: healthy", "other1", project="bar"),
+        event("health_status: healthy", "db1"),
+    ]
+    fake_docker.state = state
+
+    assert wait_until_ready(COMPOSER, engine=CLIEngine()) == ["web", "db", "migrate"]
+    assert wait_until_ready(COMPOSER, only=["web"], engine=CLIEngine()) == ["web"]
+
+
+def test_wait_ignores_one_off_containers(fake_docker):
+    stale = container("run1", "web", running=False, exit_code=1)
+    stale["labels"]["com.docker.compose.oneoff"] = "True"
+    fake_docker.set_containers([container("web1", "web"), stale])
+    assert wait_until_ready(COMPOSER, engine=CLIEngine()) == ["web"]
+
+
+def test_wait_fails_fast_on_death(fake_docker):
+    fake_docker.set_containers([container("db1", "db", health="starting")])
+    state = fake_docker.state
+    state["events"] = [event("die", "db1", exitCode="137")]
+    fake_docker.state = state
+
+    with pytest.raises(DockSwapError, match='"db" died with exit code 137'):
+        wait_until_ready(COMPOSER, engine=CLIEngine())
+
+    fake_docker.set_containers([container("db1", "db", running=False, exit_code=1)])
+    with pytest.raises(DockSwapError, match="exit code 1"):
+        wait_until_ready(COMPOSER, engine=CLIEngine())
+
+
+def test_wait_ignores_containers_exited_before_start(fake_docker):
+    fake_docker.set_containers(
+        [
+            container("web1", "web"),
+            container(
+                "job1", "migrate", running=False, exit_code=1, finished_at="2021-03-04T10:20:30Z"
+            ),
+        ]
+    )
+    since = calendar.timegm((2021, 3, 4, 10, 20, 31, 0, 0, 0))
+    assert wait_until_ready(COMPOSER, engine=CLIEngine(), since=since) == ["web"]
+
+    # died after the start
+    state = fake_docker.state
+    state["containers"][1]["finished_at"] = "2021-03-04T10:20:31.500000000Z"
+    fake_docker.state = state
+    with pytest.raises(DockSwapError, match='"migrate" died with exit code 1'):
+        wait_until_ready(COMPOSER, engine=CLIEngine(), since=since)
+
+
+def test_wait_follows_recreated_containers(fake_docker):
+    fake_docker.set_containers([container("db2", "db", health="healthy")])
+    state = fake_docker.state
+    state["events"] = [event("start", "db2")]
+    fake_docker.state = state
+
+    class LateEngine(CLIEngine):
+        # container did not exist yet when containers were listed
+        def list_containers(self, all=False):
+            return []
+
+    assert wait_until_ready(COMPOSER, engine=LateEngine()) == []
+
+    fake_docker.set_containers([container("db1", "db", health="starting")])
+    state = fake_docker.state
+    state["containers"].append(container("db2", "db", health="healthy"))
+    state["events"] = [event("destroy", "db1"), event("start", "db2")]
+    fake_docker.state = state
+    assert wait_until_ready(COMPOSER, engine=CLIEngine()) == ["db"]
+
+    state["events"] = []
+    fake_docker.state = state
+    with pytest.raises(DockSwapError, match="events stream ended"):
+        wait_until_ready(COMPOSER, engine=CLIEngine())
+
+
+def test_wait_timeout(fake_docker):
+    fake_docker.set_containers([container("db1", "db", health="starting")])
+    with pytest.raises(DockSwapError, match="not ready after 0.2 seconds: db"):
+        wait_until_ready(COMPOSER, timeout=0.2, engine=BlockingEventsEngine())
+
+
+def test_event_stream_skips_garbage():
+    lines = [json.dumps(event("start", "a")), "not json", json.dumps(event("die", "a"))]
+    closed = []
+    stream = EventStream(iter(lines), lambda: closed.append(True))
+    assert [(e.status, e.id) for e in stream] == [("start", "a"), ("die", "a")]
+    assert closed == [True]
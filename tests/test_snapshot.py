@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+import json
+from pathlib import Path
+
+import pytest
+from typer.testing import CliRunner
+
+from dockswap import cli
+from dockswap.dockswap.core import Composer, DockSwapRepo
+from dockswap.dockswap.errors import DockSwapError
+from dockswap.dockswap.snapshot import (
+    SnapshotIndex,
+    create_snapshot,
+    delete_snapshot,
+    restore_snapshot,
+)
+
+SEEDED = {"base/1": "seeded rows"}
+
+
+@pytest.fixture
+def composer(tmp_path, monkeypatch, fake_docker):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    (tmp_path / "shop").mkdir()
+    compose_path = tmp_path / "shop" / "docker-compose.json"
+    compose_path.write_text(
+        json.dumps(
+            {
+                "services": {"db": {"image": "postgres", "volumes": ["data:/var/lib/data"]}},
+                "volumes": {"data": {}, "cache": {"name": "custom_cache"}},
+            }
+        )
+    )
+    fake_docker.state = {
+        "containers": [],
+        "volumes": {
+            "shop_data": {"labels": {}, "files": dict(SEEDED)},
+            "custom_cache": {"labels": {}, "files": {"cache": "warm"}},
+            "unrelated": {"labels": {}, "files": {}},
+        },
+    }
+    return Composer(str(compose_path), project_name="shop")
+
+
+def volume_files(fake_docker, name):
+    return fake_docker.state["volumes"][name]["files"]
+
+
+def reseed(fake_docker, files):
+    state = fake_docker.state
+    state["volumes"]["shop_data"]["files"] = files
+    fake_docker.state = state
+
+
+def test_volume_names(composer):
+    assert composer.spec.volume_name("data", "shop") == "shop_data"
+    assert composer.spec.volume_name("cache", "shop") == "custom_cache"
+
+
+def test_tar_fallback(composer, fake_docker, tmp_path):
+    snapshot = create_snapshot(composer, "seeded")
+    assert {copy["method"] for copy in snapshot["volumes"].values()} == {"tar"}
+    archive = tmp_path / ".dockswap" / "snapshots" / "shop" / "seeded" / "data.tar.gz"
+    assert snapshot["volumes"]["data"]["archive"] == str(archive)
+    assert snapshot["volumes"]["data"]["size"] == archive.stat().st_size
+    assert list(SnapshotIndex("shop").load()) == ["seeded"]
+
+    reseed(fake_docker, {"base/1": "changed", "base/2": "new rows"})
+    restore_snapshot(composer, "seeded")
+    assert volume_files(fake_docker, "shop_data") == SEEDED
+    assert volume_files(fake_docker, "custom_cache") == {"cache": "warm"}
+
+    # volume removed with `down -v` is created again, labelled for docker-compose
+    state = fake_docker.state
+    del state["volumes"]["shop_data"]
+    fake_docker.state = state
+    restore_snapshot(composer, "seeded")
+    assert fake_docker.state["volumes"]["shop_data"] == {
+        "labels": {"com.docker.compose.project": "shop", "com.docker.compose.volume": "data"},
+        "files": SEEDED,
+    }
+
+    delete_snapshot(composer, "seeded")
+    assert not archive.exists()
+    assert SnapshotIndex("shop").load() == {}
+
+
+def test_reflink(composer, fake_docker):
+    state = fake_docker.state
+    state["reflink"] = True
+    fake_docker.state = state
+
+    snapshot = create_snapshot(composer, "seeded", method="reflink")
+    copy = snapshot["volumes"]["data"]
+    assert copy == {
+        "source": "shop_data",
+        "method": "reflink",
+        "volume": "dockswap_snapshot_shop_seeded_data",
+    }
+    assert fake_docker.state["volumes"][copy["volume"]] == {
+        "labels": {"dockswap.snapshot": "shop/seeded"},
+        "files": SEEDED,
+    }
+
+    reseed(fake_docker, {})
+    restore_snapshot(composer, "seeded")
+    assert volume_files(fake_docker, "shop_data") == SEEDED
+
+    delete_snapshot(composer, "seeded")
+    assert copy["volume"] not in fake_docker.state["volumes"]
+
+
+def test_failed_restore_keeps_volume(composer, fake_docker, tmp_path):
+    snapshot = create_snapshot(composer, "seeded")
+    Path(snapshot["volumes"]["data"]["archive"]).write_bytes(b"truncated")
+    reseed(fake_docker, {"base/1": "current rows"})
+
+    with pytest.raises(DockSwapError, match="not in gzip format"):
+        restore_snapshot(composer, "seeded")
+    assert volume_files(fake_docker, "shop_data") == {"base/1": "current rows"}
+
+
+def test_snapshot_volume_named_after_compose_project(composer, fake_docker):
+    state = fake_docker.state
+    state["reflink"] = True
+    fake_docker.state = state
+    composer.project_name = "shop (seeded)"
+
+    snapshot = create_snapshot(composer, "seeded", method="reflink")
+    assert snapshot["volumes"]["data"]["volume"] == "dockswap_snapshot_shop_seeded_data"
+    assert fake_docker.state["volumes"]["dockswap_snapshot_shop_seeded_data"]["labels"] == {
+        "dockswap.snapshot": "shop (seeded)/seeded"
+    }
+
+
+def test_refusals(composer, fake_docker):
+    with pytest.raises(DockSwapError, match="Operation not supported"):
+        create_snapshot(composer, "seeded", method="reflink")
+    assert "dockswap_snapshot_shop_seeded_data" not in fake_docker.state["volumes"]
+    assert SnapshotIndex("shop").load() == {}
+
+    with pytest.raises(DockSwapError, match="Invalid snapshot name"):
+        create_snapshot(composer, "../seeded")
+    with pytest.raises(DockSwapError, match='No snapshot "seeded" of "shop"'):
+        restore_snapshot(composer, "seeded")
+
+    create_snapshot(composer, "seeded")
+    with pytest.raises(DockSwapError, match="already exists"):
+        create_snapshot(composer, "seeded")
+    create_snapshot(composer, "seeded", replace=True)
+
+    state = fake_docker.state
+    state["containers"] = [
+        {
+            "id": "shop_db_1",
+            "running": True,
+            "labels": {"com.docker.compose.project": "shop"},
+        }
+    ]
+    del state["volumes"]["custom_cache"]
+    fake_docker.state = state
+    with pytest.raises(DockSwapError, match="stop it first: dockswap stop shop"):
+        restore_snapshot(composer, "seeded")
+
+    state["containers"] = []
+    fake_docker.state = state
+    with pytest.raises(DockSwapError, match="custom_cache do not exist yet"):
+        create_snapshot(composer, "other")
+
+
+def test_replace(composer, fake_docker, tmp_path):
+    old = create_snapshot(composer, "seeded")
+    archive = tmp_path / ".dockswap" / "snapshots" / "shop" / "seeded" / "data.tar.gz"
+    reseed(fake_docker, {"base/1": "reseeded"})
+
+    # failed replace keeps the old snapshot usable
+    with pytest.raises(DockSwapError, match="Operation not supported"):
+        create_snapshot(composer, "seeded", method="reflink", replace=True)
+    assert SnapshotIndex("shop").load() == {"seeded": old}
+    assert archive.exists()
+    assert sorted(path.name for path in archive.parent.parent.iterdir()) == [
+        "index.json",
+        "index.json.lock",
+        "seeded",
+    ]
+
+    state = fake_docker.state
+    state["reflink"] = True
+    fake_docker.state = state
+    new = create_snapshot(composer, "seeded", method="reflink", replace=True)
+    copy = new["volumes"]["data"]
+    assert copy["volume"].startswith("dockswap_snapshot_shop_seeded.")
+    assert SnapshotIndex("shop").load() == {"seeded": new}
+    assert not archive.parent.exists()
+
+    reseed(fake_docker, {})
+    restore_snapshot(composer, "seeded")
+    assert volume_files(fake_docker, "shop_data") == {"base/1": "reseeded"}
+
+    delete_snapshot(composer, "seeded")
+    assert copy["volume"] not in fake_docker.state["volumes"]
+
+
+def test_cli(composer, monkeypatch, fake_docker):
+    repo = DockSwapRepo()
+    repo.persist(composer)
+    monkeypatch.setattr(cli, "repo", repo)
+    runner = CliRunner()
+
+    result = runner.invoke(cli.app, ["snapshot", "shop", "seeded"])
+    assert result.exit_code == 0, result.stdout
+    assert "Created snapshot seeded (" in result.stdout
+
+    reseed(fake_docker, {})
+    result = runner.invoke(cli.app, ["restore", "shop", "seeded"])
+    assert result.exit_code == 0, result.stdout
+    assert volume_files(fake_docker, "shop_data") == SEEDED
+
+    result = runner.invoke(cli.app, ["snapshots", "shop"])
+    assert result.stdout.startswith("seeded (") and "2 volume(s), tar" in result.stdout
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from dockswap.dockswap.core import Composer, DockSwapRepo
+from dockswap.dockswap.errors import DockSwapError
+from dockswap.dockswap.standby import StandbyPool, standby_swap
+from dockswap.dockswap.top import CgroupSampler
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("DOCKSWAP_DOCKER_COMPOSE_CLI", "true")
+    repo = DockSwapRepo()
+    repo.persist_all(
+        [
+            Composer(
+                docker_compose_path=str(tmp_path / name / "docker-compose.yml"),
+                project_name=name,
+            )
+            for name in ["foo", "bar", "baz"]
+        ]
+    )
+    return repo
+
+
+def container(container_id, project, memory="100MiB / 1GiB", paused=False):
+    return {
+        "id": container_id,
+        "running": True,
+        "paused": paused,
+        "memory": memory,
+        "labels": {"com.docker.compose.project": project},
+    }
+
+
+def test_pool_concurrent_updates(tmp_path):
+    path = tmp_path / "standby.json"
+
+    def add(name):
+        pool = StandbyPool(path=path, count=5)
+        with pool.locked():
+            time.sleep(0.05)
+            pool.add(name, name, 1)
+            pool.save()
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        [*executor.map(add, ["a", "b", "c"])]
+    assert sorted(StandbyPool(path=path).entries) == ["a", "b", "c"]
+
+
+def test_pool_over_budget(tmp_path):
+    pool = StandbyPool(path=tmp_path / "standby.json", count=2, memory="250m")
+    pool.add("a", "a", 100 * 1024 ** 2)
+    pool.add("b", "b", 100 * 1024 ** 2)
+    assert pool.over_budget() == []
+
+    pool.add("c", "c", 100 * 1024 ** 2)
+    assert pool.over_budget() == ["a"]
+
+    pool.add("a", "a", 200 * 1024 ** 2)
+    assert pool.over_budget() == ["b", "c"]
+
+
+def test_standby_swap_and_back(repo, fake_docker, tmp_path):
+    fake_docker.set_containers([container("f1", "foo"), container("b1", "bar")])
+    pool_path = tmp_path / "standby.json"
+
+    result = standby_swap(
+        repo.get("baz"), repo, pool=StandbyPool(path=pool_path, count=1)
+    )
+    assert result.paused == ["bar"]
+    assert result.evicted == ["foo"]
+    assert not result.warm
+    assert list(StandbyPool(path=pool_path).entries) == ["bar"]
+    assert [c["paused"] for c in fake_docker.containers] == [False, True]
+
+    # baz is up now, swapping back to bar just unpauses it
+    fake_docker.set_containers(
+        [container("b1", "bar", paused=True), container("z1", "baz")]
+    )
+    started = time.monotonic()
+    result = standby_swap(
+        repo.get("bar"), repo, pool=StandbyPool(path=pool_path, count=1)
+    )
+    assert time.monotonic() - started < 1
+    assert result.warm
+    assert result.paused == ["baz"]
+    assert list(StandbyPool(path=pool_path).entries) == ["baz"]
+    assert [c["paused"] for c in fake_docker.containers] == [False, True]
+    assert ["unpause", "b1"] in fake_docker.calls
+    # without memory budget, memory of paused projects is not measured
+    assert "stats" not in [call[0] for call in fake_docker.calls]
+
+
+def test_standby_swap_memory_budget(repo, fake_docker, tmp_path, monkeypatch):
+    fake_docker.set_containers(
+        [container("f1", "foo"), container("b1", "bar", memory="300MiB / 1GiB")]
+    )
+    cgroup = tmp_path / "cgroup" / "system.slice" / "docker-f1.scope"
+    cgroup.mkdir(parents=True)
+    (cgroup / "memory.current").write_text("{}\n".format(200 * 1024 ** 2))
+    monkeypatch.setattr(
+        "dockswap.dockswap.standby.CgroupSampler", lambda: CgroupSampler(str(tmp_path / "cgroup"))
+    )
+    pool_path = tmp_path / "standby.json"
+
+    result = standby_swap(
+        repo.get("baz"), repo, pool=StandbyPool(path=pool_path, count=2, memory="400m")
+    )
+    # foo is read from its cgroup, only bar is sampled by docker stats
+    assert [call for call in fake_docker.calls if call[0] == "stats"] == [
+        ["stats", "--no-stream", "--format", "{{.ID}}\t{{.MemUsage}}\t{{.CPUPerc}}", "b1"]
+    ]
+    assert result.evicted == ["foo"]
+    assert list(StandbyPool(path=pool_path).entries) == ["bar"]
+
+
+def test_standby_swap_failing_start(repo, fake_docker, tmp_path, mocker):
+    fake_docker.set_containers([container("f1", "foo"), container("b1", "bar")])
+    pool_path = tmp_path / "standby.json"
+
+    def start(self, dry=False, only=None):
+        if not dry:
+            raise DockSwapError("up failed")
+        return "docker-compose up -d"
+
+    mocker.patch.object(Composer, "start", start)
+
+    with pytest.raises(DockSwapError, match="up failed"):
+        standby_swap(repo.get("baz"), repo, pool=StandbyPool(path=pool_path, count=2))
+    # projects paused before start failed are in pool, so they are not paused forever
+    assert [c["paused"] for c in fake_docker.containers] == [True, True]
+    assert sorted(StandbyPool(path=pool_path).entries) == ["bar", "foo"]
+
+
+def test_standby_swap_failing_unpause(repo, fake_docker, tmp_path):
+    fake_docker.set_containers(
+        [dict(container("b1", "bar", paused=True), fail=True), container("z1", "baz")]
+    )
+    pool_path = tmp_path / "standby.json"
+    pool = StandbyPool(path=pool_path, count=2)
+    with pool.locked():
+        pool.add("bar", "bar", 0)
+        pool.save()
+
+    with pytest.raises(DockSwapError, match='Could not unpause containers of "bar"'):
+        standby_swap(repo.get("bar"), repo, pool=StandbyPool(path=pool_path, count=2))
+    # bar is still paused, so it stays in pool
+    assert sorted(StandbyPool(path=pool_path).entries) == ["bar", "baz"]
+    assert [c["paused"] for c in fake_docker.containers] == [True, True]
+
+
+def test_standby_evict_failing_unpause(repo, fake_docker, tmp_path):
+    fake_docker.set_containers(
+        [
+            dict(container("f1", "foo", paused=True), fail=True),
+            container("b1", "bar"),
+        ]
+    )
+    pool_path = tmp_path / "standby.json"
+    pool = StandbyPool(path=pool_path, count=1)
+    with pool.locked():
+        pool.add("foo", "foo", 0)
+        pool.save()
+
+    with pytest.raises(DockSwapError, match='Could not unpause containers of "foo"'):
+        standby_swap(repo.get("baz"), repo, pool=StandbyPool(path=pool_path, count=1))
+    # foo was not stopped while paused and can still be evicted later
+    assert fake_docker.containers[0]["paused"]
+    assert "foo" in StandbyPool(path=pool_path).entries
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""
+Guards for `dockswap` cold start. Budget (in milliseconds, on top of bare
+interpreter start) can be adjusted with `DOCKSWAP_STARTUP_BUDGET_MS`.
+"""
+import os
+import sys
+import time
+import subprocess
+
+import dockswap
+
+STARTUP_BUDGET_MS = float(os.environ.get("DOCKSWAP_STARTUP_BUDGET_MS", "50"))
+
+
+def run_python(code, home, *args):
+    env = dict(os.environ, HOME=str(home))
+    return subprocess.run(
+        [sys.executable, "-c", code] + list(args),
+        env=env,
+        stdout=subprocess.PIPE,
+        check=True,
+        universal_newlines=True,
+    ).stdout
+
+
+def best_of(times, code, home):
+    timings = []
+    for _ in range(times):
+        started = time.perf_counter()
+        run_python(code, home)
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+
+def test_version_does_not_import_cli(tmp_path):
+    output = run_python(
+        "import sys;"
+        "from dockswap.__main__ import main;"
+        "main(['version', '--mini']);"
+        "print(sorted(m for m in ('typer', 'click', 'subprocess', 'dockswap.cli')"
+        " if m in sys.modules))",
+        tmp_path,
+    )
+    assert output.splitlines() == [dockswap.__version__, "[]"]
+
+
+def test_import_cli_has_no_side_effects(tmp_path):
+    run_python("import dockswap.cli", tmp_path)
+    assert not (tmp_path / ".dockswap").exists()
+
+
+def test_version_startup_budget(tmp_path):
+    bare = best_of(5, "pass", tmp_path)
+    version = best_of(
+        5, "from dockswap.__main__ import main; main(['version'])", tmp_path
+    )
+    assert version - bare < STARTUP_BUDGET_MS
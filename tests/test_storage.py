@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+import json
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from dockswap.dockswap.core import Composer, DockSwapRepo
+from dockswap.dockswap.errors import DockSwapError
+from dockswap.dockswap.fs import atomic_write
+from dockswap.dockswap.storage import (
+    JournalDockSwapRepo,
+    SQLiteDockSwapRepo,
+    get_repo_class,
+)
+
+
+@pytest.fixture(autouse=True)
+def fake_home(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    return tmp_path
+
+
+def make_composer(name):
+    return Composer(
+        docker_compose_path="/path/{}/docker-compose.yml".format(name),
+        env_path="/path/{}/.env".format(name),
+        project_name=name,
+    )
+
+
+def test_get_repo_class(monkeypatch):
+    assert get_repo_class() is DockSwapRepo
+    monkeypatch.setenv("DOCKSWAP_STORAGE_BACKEND", "sqlite")
+    assert get_repo_class() is SQLiteDockSwapRepo
+
+    with pytest.raises(DockSwapError):
+        get_repo_class("xml")
+
+
+def test_sqlite_persist_get_delete():
+    repo = SQLiteDockSwapRepo()
+    repo.persist(make_composer("foo"))
+    repo.persist(make_composer("bar"))
+
+    assert repo.get("foo").to_dict() == make_composer("foo").to_dict()
+    assert repo.get("baz", silent_not_found=True) is None
+    assert [c.project_name for c in repo.get_all()] == ["foo", "bar"]
+
+    with pytest.raises(DockSwapError):
+        repo.persist(make_composer("foo"))
+
+    assert repo.delete("foo")
+    assert not repo.delete("foo")
+    assert [c.project_name for c in SQLiteDockSwapRepo().get_all()] == ["bar"]
+
+
+def test_sqlite_repo_shared_between_threads():
+    repo = SQLiteDockSwapRepo()
+    repo.persist(make_composer("foo"))
+
+    def use(name):
+        repo.persist(make_composer(name))
+        return repo.get("foo").project_name
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        assert [*executor.map(use, ["bar", "baz"])] == ["foo", "foo"]
+    assert sorted(c.project_name for c in repo.get_all()) == ["bar", "baz", "foo"]
+
+
+def test_atomic_write_from_threads(tmp_path):
+    path = tmp_path / "state.json"
+
+    def write(i):
+        for _ in range(50):
+            atomic_write(path, json.dumps({"writer": i}))
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        [*executor.map(write, range(4))]
+    assert json.loads(path.read_text())["writer"] in range(4)
+    assert [p.name for p in tmp_path.iterdir()] == ["state.json"]
+    assert path.stat().st_mode & 0o777 == 0o644
+
+
+def test_sqlite_migrates_json_storage_once():
+    json_repo = DockSwapRepo()
+    json_repo.persist_all([make_composer("foo"), make_composer("bar")])
+
+    repo = SQLiteDockSwapRepo()
+    assert [c.project_name for c in repo.get_all()] == ["foo", "bar"]
+
+    repo.delete("foo")
+    assert [c.project_name for c in SQLiteDockSwapRepo().get_all()] == ["bar"]
+
+    with open(json_repo.storage_path) as storage_file:
+        assert len(json.load(storage_file)) == 2
+
+
+def test_sqlite_prune():
+    SQLiteDockSwapRepo().persist(make_composer("foo"))
+    SQLiteDockSwapRepo.prune()
+    assert SQLiteDockSwapRepo().get_all() == []
+
+
+def test_json_storage_corrupted():
+    repo = DockSwapRepo()
+    repo.storage_path.write_text("[{garbage")
+
+    with pytest.raises(DockSwapError):
+        repo.get_all()
+
+
+def test_sqlite_does_not_migrate_corrupted_json_storage():
+    repo = DockSwapRepo()
+    repo.storage_path.write_text("[{garbage")
+
+    with pytest.raises(DockSwapError, match="is corrupted"):
+        SQLiteDockSwapRepo()
+
+    # migration is done once storage is fixed
+    repo.storage_path.write_text(json.dumps([make_composer("foo").to_dict()]))
+    assert [c.project_name for c in SQLiteDockSwapRepo().get_all()] == ["foo"]
+
+
+def test_journal_persist_get_delete():
+    repo = JournalDockSwapRepo()
+    repo.persist(make_composer("foo"))
+    repo.persist(make_composer("bar"))
+
+    with pytest.raises(DockSwapError):
+        JournalDockSwapRepo().persist(make_composer("foo"))
+
+    assert JournalDockSwapRepo().delete("foo")
+    assert not JournalDockSwapRepo().delete("foo")
+    assert [c.project_name for c in JournalDockSwapRepo().get_all()] == ["bar"]
+    assert repo.journal_path.read_text().count("\n") == 3
+
+
+def test_journal_compaction(monkeypatch):
+    monkeypatch.setattr(JournalDockSwapRepo, "COMPACT_EVERY", 3)
+    repo = JournalDockSwapRepo()
+    for name in ["foo", "bar", "baz", "qux"]:
+        repo.persist(make_composer(name))
+
+    # third record triggered compaction into snapshot, fourth went to journal
+    snapshot = json.loads(repo.storage_path.read_text())
+    assert [data["project_name"] for data in snapshot] == ["foo", "bar", "baz"]
+    assert repo.journal_path.read_text().count("\n") == 1
+    assert [c.project_name for c in JournalDockSwapRepo().get_all()] == [
+        "foo",
+        "bar",
+        "baz",
+        "qux",
+    ]
+
+
+def test_journal_ignores_torn_record():
+    repo = JournalDockSwapRepo()
+    repo.persist(make_composer("foo"))
+    with open(repo.journal_path, "a") as journal_file:
+        journal_file.write('{"op": "add", "comp')
+
+    assert [c.project_name for c in JournalDockSwapRepo().get_all()] == ["foo"]
+
+    JournalDockSwapRepo().persist(make_composer("bar"))
+    assert [c.project_name for c in JournalDockSwapRepo().get_all()] == [
+        "foo",
+        "bar",
+    ]
+
+
+def _register_many(prefix):
+    repo = JournalDockSwapRepo()
+    for i in range(20):
+        repo.persist(make_composer("{}{}".format(prefix, i)))
+
+
+def test_journal_concurrent_writers(monkeypatch):
+    monkeypatch.setattr(JournalDockSwapRepo, "COMPACT_EVERY", 7)
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=_register_many, args=(prefix,)) for prefix in "abcd"
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert len(JournalDockSwapRepo().get_all()) == 80
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite", "journal"])
+def test_delete_many(backend):
+    repo_class = get_repo_class(backend)
+    repo_class().persist_all([make_composer(name) for name in ("foo", "bar", "baz")])
+
+    assert repo_class().delete_many(["baz", "missing", "foo"]) in (
+        ["baz", "foo"],
+        ["foo", "baz"],
+    )
+    assert repo_class().delete_many(["missing"]) == []
+    assert [c.project_name for c in repo_class().get_all()] == ["bar"]
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+import time
+
+import pytest
+
+from dockswap.dockswap.core import Composer
+from dockswap.dockswap.errors import DockSwapError
+from dockswap.dockswap.swap import pipelined_swap
+from dockswap.dockswap.teardown import TeardownReport
+
+
+class SlowComposer(Composer):
+    def __init__(self, calls):
+        super().__init__(docker_compose_path="/srv/foo/dc.yml", project_name="foo")
+        self.calls = calls
+
+    def pull(self, dry=False, only=None):
+        time.sleep(0.2)
+        self.calls.append(("pull", only))
+
+    def create(self, dry=False, only=None):
+        self.calls.append(("create", only))
+
+    def start(self, dry=False, only=None):
+        self.calls.append(("start", only))
+
+
+class SlowPlan(object):
+    def __init__(self, calls, failures=None):
+        self.calls = calls
+        self.failures = failures or {}
+
+    def execute(self, timeout, workers):
+        time.sleep(0.2)
+        self.calls.append(("teardown", timeout))
+        report = TeardownReport()
+        report.failures = self.failures
+        return report
+
+
+def test_pipelined_swap_overlaps_teardown_and_pull():
+    calls = []
+    started = time.monotonic()
+    pipelined_swap(SlowComposer(calls), SlowPlan(calls), ["db"], create=True, timeout=1)
+    elapsed = time.monotonic() - started
+
+    assert elapsed < 0.35
+    assert sorted(calls[:3]) == [("create", ["db"]), ("pull", ["db"]), ("teardown", 1)]
+    assert calls[-1] == ("start", ["db"])
+
+
+def test_pipelined_swap_does_not_start_after_failed_teardown():
+    calls = []
+    with pytest.raises(DockSwapError):
+        pipelined_swap(SlowComposer(calls), SlowPlan(calls, {"x": "boom"}))
+    assert ("start", None) not in calls
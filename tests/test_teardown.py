@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+import pytest
+
+from dockswap.dockswap import teardown
+from dockswap.dockswap.engine import docker_binary
+from dockswap.dockswap.errors import DockSwapError
+
+
+def container(container_id, running=True, fail=False):
+    return {"id": container_id, "running": running, "fail": fail}
+
+
+def test_shard():
+    assert teardown.shard([], 4) == []
+    assert teardown.shard(["a", "b", "c"], 2) == [["a", "c"], ["b"]]
+    assert teardown.shard(["a", "b"], 8) == [["a"], ["b"]]
+
+
+def test_teardown_stops_only_running(fake_docker):
+    fake_docker.set_containers(
+        [container("a"), container("b", running=False), container("c")]
+    )
+    report = teardown.teardown(timeout=3, workers=2)
+
+    assert report.ok
+    assert sorted(report.stopped) == ["a", "c"]
+    stop_calls = [call for call in fake_docker.calls if call[0] == "stop"]
+    assert all(call[1:3] == ["-t", "3"] for call in stop_calls)
+    assert sorted(sum((call[3:] for call in stop_calls), [])) == ["a", "c"]
+    assert [c["running"] for c in fake_docker.containers] == [False] * 3
+
+
+def test_teardown_remove_reports_failures(fake_docker):
+    fake_docker.set_containers(
+        [container("a"), container("b", running=False), container("c", fail=True)]
+    )
+    report = teardown.teardown(remove=True, workers=3)
+
+    assert sorted(report.removed) == ["a", "b"]
+    assert list(report.failures) == ["c"]
+    assert "cannot remove container: c" in report.failures["c"]
+    assert [c["id"] for c in fake_docker.containers] == ["c"]
+
+    with pytest.raises(DockSwapError, match="1 container"):
+        report.raise_for_failures()
+
+
+def test_teardown_command(fake_docker):
+    assert teardown.teardown_command(remove=True) is None
+
+    fake_docker.set_containers([container("a"), container("b", running=False)])
+    assert teardown.teardown_command(remove=True, timeout=5) == (
+        "{docker} stop -t 5 a && {docker} rm -f a b".format(
+            docker=docker_binary()
+        )
+    )
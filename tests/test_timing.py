@@ -0,0 +1,72 @@
+import time
+import threading
+
+from dockswap.dockswap import timing
+from dockswap.dockswap.timing import History, Profiler, covered, percentile, summarize
+
+
+def test_covered_merges_overlapping_intervals():
+    assert covered([]) == 0
+    assert covered([(0, 1), (2, 3)]) == 2
+    assert covered([(0, 2), (1, 3), (5, 6)]) == 4
+    assert covered([(1, 4), (0, 5)]) == 5
+
+
+def test_parallel_phases_count_wall_clock_time():
+    profiler = Profiler()
+
+    def work():
+        with profiler.phase("stop"):
+            time.sleep(0.1)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    profiler.finish()
+
+    assert 0.1 <= profiler.phases["stop"] < 0.3
+    assert profiler.total >= profiler.phases["stop"]
+    assert profiler.describe()[-1].startswith("total")
+
+
+def test_module_phase_goes_to_started_profiler():
+    profiler = timing.start()
+    with timing.phase("list"):
+        pass
+    assert list(profiler.phases) == ["list"]
+    assert list(timing.start().phases) == []
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile([3.0], 95) == 3.0
+    assert percentile([2, 1], 50) == 1
+
+
+def test_history_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(History, "LIMIT", 5)
+    monkeypatch.setattr(History, "TRIM_SIZE", 0)
+    history = History(tmp_path / "history.jsonl")
+    for _ in range(12):
+        history.append("start", Profiler(), project="foo")
+
+    assert len(history.path.read_text().splitlines()) <= 5
+    assert len(history.records()) == 5
+
+
+def test_summarize_skips_failed_runs():
+    records = [
+        {"project": "foo", "ok": True, "total": 2.0, "phases": {"stop": 1.0}},
+        {"project": "foo", "ok": True, "total": 4.0, "phases": {"stop": 3.0}},
+        {"project": "foo", "ok": False, "total": 60.0, "phases": {"stop": 60.0}},
+        {"project": None, "ok": True, "total": 1.0, "phases": {}},
+    ]
+    rows = summarize(records)
+    assert ("foo", "stop", 2, 1.0, 3.0, 3.0) in rows
+    assert ("foo", "total", 2, 2.0, 4.0, 4.0) in rows
+    assert ("-", "total", 1, 1.0, 1.0, 1.0) in rows
+    assert all(row[0] == "foo" for row in summarize(records, project="foo"))
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+import itertools
+
+import pytest
+
+from dockswap.dockswap.core import Composer
+from dockswap.dockswap.engine import Container
+from dockswap.dockswap.top import (
+    OTHER,
+    CgroupSampler,
+    ContainerStats,
+    MixedSampler,
+    Renderer,
+    StreamSampler,
+    Top,
+    aggregate,
+    format_rows,
+    parse_io,
+)
+
+MIB = 1024 ** 2
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    ticks = itertools.count(start=100, step=2)
+    monkeypatch.setattr("dockswap.dockswap.top.time.monotonic", lambda: next(ticks))
+
+
+def write(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+
+
+def container(container_id, project=None):
+    labels = {"com.docker.compose.project": project} if project else {}
+    return Container(container_id, "running", labels=labels)
+
+
+def test_cgroup_sampler_v2(tmp_path, clock):
+    scope = tmp_path / "system.slice" / "docker-abc.scope"
+    write(scope / "memory.current", "104857600\n")
+    write(scope / "cpu.stat", "usage_usec 1000000\nuser_usec 600000\n")
+    write(scope / "io.stat", "8:0 rbytes=100 wbytes=50 rios=1 wios=1\n")
+    sampler = CgroupSampler(str(tmp_path))
+
+    stats = sampler.sample(["abc", "missing"])
+    assert list(stats) == ["abc"]
+    assert (stats["abc"].memory, stats["abc"].cpu, stats["abc"].io) == (100 * MIB, 0.0, 150)
+
+    write(scope / "cpu.stat", "usage_usec 4000000\n")
+    assert sampler.sample(["abc"])["abc"].cpu == 1.5
+
+
+def test_cgroup_sampler_v1(tmp_path, clock):
+    write(tmp_path / "memory" / "docker" / "abc" / "memory.usage_in_bytes", "2048\n")
+    write(tmp_path / "cpuacct" / "docker" / "abc" / "cpuacct.usage", "1000000000\n")
+    write(
+        tmp_path / "blkio" / "docker" / "abc" / "blkio.throttle.io_service_bytes",
+        "8:0 Read 100\n8:0 Write 20\n8:0 Total 120\nTotal 120\n",
+    )
+    sampler = CgroupSampler(str(tmp_path))
+    stats = sampler.sample(["abc"])["abc"]
+    assert (stats.memory, stats.io) == (2048, 120)
+
+    write(tmp_path / "cpuacct" / "docker" / "abc" / "cpuacct.usage", "2000000000\n")
+    assert sampler.sample(["abc"])["abc"].cpu == 0.5
+
+    (tmp_path / "memory" / "docker" / "abc" / "memory.usage_in_bytes").unlink()
+    assert sampler.sample(["abc"]) == {}
+
+
+def test_parse_io():
+    assert parse_io("1kB / 2kB") == 3000
+    assert parse_io("-- / --") == 0
+
+
+def test_stream_sampler(fake_docker):
+    fake_docker.set_containers(
+        [
+            {"id": "abc123", "running": True, "memory": "10MiB / 1GiB", "cpu": "25.00%"},
+            {"id": "def456", "running": False},
+        ]
+    )
+    sampler = StreamSampler()
+    sampler.reader.join(timeout=10)
+    sampler.close()
+
+    stats = sampler.sample(["abc123", "def456"])
+    assert list(stats) == ["abc123"]
+    assert (stats["abc123"].memory, stats["abc123"].cpu) == (10 * MIB, 0.25)
+    assert ["stats", "--no-trunc", "--format", "{{json .}}"] in fake_docker.calls
+
+
+def test_mixed_sampler_streams_only_unreadable_containers(tmp_path, clock):
+    write(tmp_path / "docker" / "abc" / "memory.current", "2048\n")
+    streamed = []
+
+    class Stream(object):
+        def sample(self, ids):
+            streamed.append(ids)
+            return {container_id: ContainerStats(MIB) for container_id in ids}
+
+        def close(self):
+            streamed.append("closed")
+
+    sampler = MixedSampler(CgroupSampler(str(tmp_path)), stream_factory=Stream)
+    assert sampler.sample(["abc"])["abc"].memory == 2048
+    assert sampler.stream is None
+
+    stats = sampler.sample(["abc", "def"])
+    assert (stats["abc"].memory, stats["def"].memory) == (2048, MIB)
+    sampler.close()
+    assert streamed == [["def"], "closed"]
+
+
+def test_aggregate_and_format():
+    # rows are named after registered projects, matched by compose project
+    composers = [
+        Composer("/foo/dc.yml", project_name="foo"),
+        Composer("/srv/b/dc.yml", project_name="bar"),
+    ]
+    containers = [
+        container("f1", "foo"),
+        container("f2", "foo"),
+        container("b1", "b"),
+        container("x1", "unknown"),
+        container("x2"),
+        container("gone", "foo"),
+    ]
+    stats = {
+        "f1": ContainerStats(100 * MIB, 0.5, 0),
+        "f2": ContainerStats(50 * MIB, 0.25, 0),
+        "b1": ContainerStats(MIB, 1.0, 0),
+        "x1": ContainerStats(MIB, 0.0, 0),
+        "x2": ContainerStats(MIB, 0.0, 0),
+    }
+    rows = aggregate(containers, stats, composers, {"f1": 2048})
+    assert [(row.name, row.containers) for row in rows] == [("bar", 1), ("foo", 2), (OTHER, 2)]
+    assert rows[1].memory == 150 * MIB
+    assert rows[1].cpu == 0.75
+
+    lines = format_rows(rows)
+    assert lines[0].split() == ["PROJECT", "CONT", "CPU%", "MEM", "IO/s"]
+    assert lines[2].split() == ["foo", "2", "75.0%", "150.0MiB", "2.0KiB"]
+
+
+def test_renderer_rewrites_only_changed_lines():
+    renderer = Renderer()
+    assert renderer.render(["a", "b", "c"]) == "\x1b[1;1Ha\x1b[K\x1b[2;1Hb\x1b[K\x1b[3;1Hc\x1b[K"
+    assert renderer.render(["a", "B", "c"]) == "\x1b[2;1HB\x1b[K"
+    assert renderer.render(["a", "B", "c"]) == ""
+    assert renderer.render(["a"]) == "\x1b[2;1H\x1b[J"
+
+
+def test_top_frame_computes_io_rate(clock):
+    class Sampler(object):
+        io = iter([1000, 5000])
+
+        def sample(self, ids):
+            return {"f1": ContainerStats(MIB, 0.1, next(self.io))}
+
+    top = Top(
+        Sampler(),
+        lambda: [container("f1", "foo"), Container("s1", "exited")],
+        [Composer("/foo/dc.yml", project_name="foo")],
+    )
+    assert top.frame()[1].split()[-1] == "0.0B"
+    assert top.frame()[1].split()[-1] == "2.0KiB"